@@ -0,0 +1,142 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from wtt import repositories
+from wtt.models.absence import Absence
+from wtt.models.holiday import Holiday
+from wtt.models.profile import Profile
+from wtt.repositories import absence as absence_repo
+from wtt.repositories import holiday as holiday_repo
+from wtt.repositories import profile as profile_repo
+from wtt.repositories import time_card as time_card_repo
+from wtt.repositories import transaction
+from wtt.utils import date as date_utils
+
+DATASET_TIMEZONE = 'America/Sao_Paulo'
+LOCATIONS = ('Brasil', 'Portugal')
+# (day, month, working hours) of the holidays that repeat every year
+YEARLY_HOLIDAYS = ((1, 1, 0), (21, 4, 0), (1, 5, 0), (7, 9, 0), (12, 10, 0), (2, 11, 0), (15, 11, 0), (24, 12, 4),
+                   (25, 12, 0), (31, 12, 4))
+ONE_OFF_HOLIDAYS_PER_YEAR = 2
+ABSENCE_PROBABILITY = 0.01
+MISSED_DAY_PROBABILITY = 0.01
+ODD_DAY_PROBABILITY = 0.04
+SINGLE_CARD_DAY_PROBABILITY = 0.01
+OVERTIME_PROBABILITY = 0.08
+NIGHT_SHIFT_PROBABILITY = 0.02
+WEEKEND_WORK_PROBABILITY = 0.03
+
+
+def use_database(path):
+    # points the repositories of this process to another database file, its schema is created on the next query
+    repositories.close_session()
+    repositories.DATABASE_PATH = path
+    repositories.database_checked = False
+
+
+def get_day_local_times(rng, date):
+    # local times of the cards of a regular day: arrival, lunch, return and departure
+    arrival = date + datetime.timedelta(hours=8, minutes=rng.randint(0, 75), seconds=rng.randint(0, 59))
+    lunch = date + datetime.timedelta(hours=11, minutes=rng.randint(45, 100), seconds=rng.randint(0, 59))
+    lunch_return = lunch + datetime.timedelta(minutes=rng.randint(40, 80), seconds=rng.randint(0, 59))
+    departure = arrival + datetime.timedelta(hours=9, minutes=rng.randint(-20, 40), seconds=rng.randint(0, 59))
+    times = [arrival, lunch, lunch_return, departure]
+    draw = rng.random()
+    if draw < SINGLE_CARD_DAY_PROBABILITY:
+        times = times[:1]
+    elif draw < SINGLE_CARD_DAY_PROBABILITY + ODD_DAY_PROBABILITY:
+        del times[rng.randint(1, 3)]  # a forgotten card
+    elif draw < SINGLE_CARD_DAY_PROBABILITY + ODD_DAY_PROBABILITY + OVERTIME_PROBABILITY:
+        times[-1] += datetime.timedelta(minutes=rng.randint(60, 180))
+    elif draw < SINGLE_CARD_DAY_PROBABILITY + ODD_DAY_PROBABILITY + OVERTIME_PROBABILITY + NIGHT_SHIFT_PROBABILITY:
+        night_start = date + datetime.timedelta(hours=20, minutes=rng.randint(0, 60))
+        times += [night_start, night_start + datetime.timedelta(minutes=rng.randint(60, 150))]
+    return times
+
+
+def generate_profile_time_cards(rng, first_day, now, holiday_dates, absence_dates):
+    # epochs of the cards of every day from first_day until now, cards of today only up to now
+    timezone = date_utils.get_local_timezone()
+    now_local_epoch = date_utils.naive_datetime_to_local_epoch(now)
+    epochs = []
+    date = first_day
+    while date <= now:
+        is_weekday = date.weekday() < 5
+        works = (is_weekday and date not in holiday_dates and date not in absence_dates
+                 and rng.random() >= MISSED_DAY_PROBABILITY) or rng.random() < WEEKEND_WORK_PROBABILITY
+        if works:
+            for local_time in get_day_local_times(rng, date):
+                local_epoch = date_utils.naive_datetime_to_local_epoch(local_time)
+                if local_epoch <= now_local_epoch:
+                    epochs.append(date_utils.local_epoch_to_epoch(local_epoch, timezone))
+        date = date_utils.add_days_to_datetime(date, 1)
+    return sorted(set(epochs))
+
+
+def generate_dataset(path, profiles=1, years=1, seed=0):
+    # creates a database file with the given amount of profiles, each with the given years of history until now,
+    # on DATASET_TIMEZONE, returns the amount of time cards, the same seed always generates the same history
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} exists already')
+    rng = random.Random(seed)
+    date_utils.set_local_timezone(DATASET_TIMEZONE)
+    use_database(path)
+    now = date_utils.get_now().replace(tzinfo=None, microsecond=0)
+    first_day = date_utils.date_to_naive_beginning_of_day(date_utils.add_days_to_datetime(now, -365 * years))
+    holiday_dates = {location: set() for location in LOCATIONS}
+    time_cards = 0
+    with transaction():
+        for location in LOCATIONS:
+            for day, month, working_hours in YEARLY_HOLIDAYS:
+                date = datetime.datetime(first_day.year, month, day)
+                holiday_repo.create_holiday(Holiday(date_utils.set_timezone_on_datetime(date, 'UTC'), location,
+                                                    description=f'Yearly holiday {day}/{month}',
+                                                    working_hours=working_hours, repeats_every_year=True))
+                if working_hours == 0:
+                    holiday_dates[location].update(datetime.datetime(year, month, day)
+                                                   for year in range(first_day.year, now.year + 1))
+            for year in range(first_day.year, now.year + 1):
+                for _ in range(ONE_OFF_HOLIDAYS_PER_YEAR):
+                    date = datetime.datetime(year, 1, 1) + datetime.timedelta(days=rng.randint(0, 364))
+                    holiday_repo.create_holiday(Holiday(date_utils.set_timezone_on_datetime(date, 'UTC'), location,
+                                                        description='One-off holiday', repeats_every_year=False))
+                    holiday_dates[location].add(date)
+        for i in range(profiles):
+            location = LOCATIONS[i % len(LOCATIONS)]
+            profile = Profile(f'Profile{i}', 'Synthetic', 'Benchmarks', location, first_day,
+                              latest_working_hour=datetime.datetime(1900, 1, 1, 22), default_timezone=DATASET_TIMEZONE,
+                              uuid=str(uuid.UUID(int=rng.getrandbits(128))))
+            profile_repo.create_profile(profile)
+            absence_dates = set()
+            date = first_day
+            while date <= now:
+                if rng.random() < ABSENCE_PROBABILITY:
+                    absence_repo.create_absence(Absence(profile.uuid, date, description='Synthetic absence',
+                                                        authorized=rng.random() < 0.5))
+                    absence_dates.add(date)
+                date = date_utils.add_days_to_datetime(date, 1)
+            epochs = generate_profile_time_cards(rng, first_day, now, holiday_dates[location], absence_dates)
+            time_cards += time_card_repo.insert_time_cards_from_epochs(profile, 'manual', epochs)
+    return time_cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates a database of synthetic profiles, time cards, holidays '
+                                                 'and absences')
+    parser.add_argument('path', type=str, help='The database file to create', metavar='FILE')
+    parser.add_argument('--profiles', type=int, default=1, help='Amount of profiles (default: %(default)s)')
+    parser.add_argument('--years', type=int, default=1, help='Years of history of each profile (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random history (default: %(default)s)')
+    args = parser.parse_args()
+    time_cards = generate_dataset(args.path, profiles=args.profiles, years=args.years, seed=args.seed)
+    print(f'Generated {time_cards} time cards of {args.profiles} profiles on {args.path}')
+
+
+if __name__ == '__main__':
+    main()
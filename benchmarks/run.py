@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import dataset
+from wtt import repositories
+from wtt.repositories import profile as profile_repo
+from wtt.repositories import work_day as work_day_repo
+from wtt.services import team as team_service
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+from wtt.utils import worked_time as worked_time_utils
+
+DEFAULT_SIZES = ('1x1', '1x5', '10x3')  # profiles x years
+DEFAULT_REPEAT = 5
+REGRESSION_THRESHOLD = 1.2  # median slower than the previous run by this factor
+
+
+def clear_ledger(profile):
+    work_day_repo.delete_profile_work_days(profile)
+
+
+def get_benchmarks(profile, profiles):
+    # name, function and the setup that runs before each measurement, outside of the timing, in the order they run,
+    # those that store time cards come last, so they do not change the data measured by the others
+    yesterday = date_utils.date_to_naive_beginning_of_day(date_utils.get_yesterday())
+    benchmarks = [
+        ('ehbal_cold', lambda: time_card_service.get_extra_hours_balance_in_minutes(profile),
+         lambda: clear_ledger(profile)),
+        ('ehbal', lambda: time_card_service.print_extra_hours_balance_in_minutes(profile, details=True), None),
+        ('wdr', lambda: time_card_service.print_work_day_status_report(profile, 'VERBOSE'), None),
+        ('ttco', lambda: time_card_service.print_today_report(profile), None),
+        ('stc', lambda: time_card_service.display_time_cards_of_a_day(profile, yesterday), None),
+        ('rebuild', lambda: time_card_service.rebuild_work_days(profile), None),
+    ]
+    if len(profiles) > 1:
+        benchmarks += [
+            ('team_ehbal_cold', lambda: team_service.print_team_extra_hours_balance(jobs=1),
+             lambda: [clear_ledger(el) for el in profiles]),
+            ('team_ehbal', lambda: team_service.print_team_extra_hours_balance(jobs=1), None),
+        ]
+    benchmarks += [
+        ('clock', lambda: time_card_service.store_clock_time_card(profile), None),
+        ('addtc', lambda: time_card_service.store_manual_time_card(profile, yesterday), None),
+    ]
+    return benchmarks
+
+
+def measure(function, setup, repeat, warmup=1):
+    # elapsed milliseconds of each run after the warmup ones, which load lazy imports and caches, whatever the
+    # function prints is discarded
+    runs = []
+    for i in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started_at = time.perf_counter()
+            function()
+            elapsed = (time.perf_counter() - started_at) * 1000
+        if i >= warmup:
+            runs.append(elapsed)
+    return runs
+
+
+def parse_size(size):
+    profiles, years = size.lower().split('x')
+    return int(profiles), int(years)
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, warmup=1, seed=0, only=None):
+    results = []
+    time_card_service.COOLDOWN_IN_SECONDS = 0  # clock runs several times in a row
+    with tempfile.TemporaryDirectory(prefix='wtt-benchmarks-') as directory:
+        for size in sizes:
+            profile_count, years = parse_size(size)
+            path = os.path.join(directory, f'{size}.sqlite')
+            started_at = time.perf_counter()
+            time_cards = dataset.generate_dataset(path, profiles=profile_count, years=years, seed=seed)
+            generation_in_ms = (time.perf_counter() - started_at) * 1000
+            profiles = profile_repo.get_all_profiles()
+            for name, function, setup in get_benchmarks(profiles[0], profiles):
+                if only is not None and name not in only:
+                    continue
+                runs = measure(function, setup, repeat, warmup=warmup)
+                results.append({
+                    'size': size,
+                    'profiles': profile_count,
+                    'years': years,
+                    'time_cards': time_cards,
+                    'generation_ms': round(generation_in_ms, 3),
+                    'benchmark': name,
+                    'runs_ms': [round(el, 3) for el in runs],
+                    'min_ms': round(min(runs), 3),
+                    'median_ms': round(statistics.median(runs), 3),
+                    'mean_ms': round(statistics.mean(runs), 3),
+                })
+                print(f'{size} {name}: median {results[-1]["median_ms"]:.1f} ms, min {results[-1]["min_ms"]:.1f} ms',
+                      file=sys.stderr)
+            repositories.close_session()
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'numpy': worked_time_utils.get_numpy() is not None,
+            'cpus': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'warmup': warmup,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare_results(previous, current, threshold=REGRESSION_THRESHOLD):
+    # ratio of the current median to the previous one of every benchmark on both, returns the regressions
+    previous_medians = {(el['size'], el['benchmark']): el['median_ms'] for el in previous['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['size'], result['benchmark'])
+        if key not in previous_medians or previous_medians[key] == 0:
+            continue
+        ratio = result['median_ms'] / previous_medians[key]
+        flag = ''
+        if ratio > threshold:
+            flag = ' REGRESSION'
+            regressions.append((key, ratio))
+        print(f'{key[0]} {key[1]}: {previous_medians[key]:.1f} ms -> {result["median_ms"]:.1f} ms ({ratio:.2f}x){flag}',
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the time card services on synthetic datasets')
+    parser.add_argument('--sizes', type=str, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Datasets as PROFILESxYEARS (default: %(default)s)', metavar='SIZE')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Measurements of each benchmark (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='Runs of each benchmark before the measurements (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the datasets (default: %(default)s)')
+    parser.add_argument('--only', type=str, nargs='+', default=None, help='Benchmarks to run (default: all)',
+                        metavar='NAME')
+    parser.add_argument('-o', '--output', type=str, default=None, help='File to write the json results to '
+                                                                       '(default: stdout)')
+    parser.add_argument('--compare', type=str, default=None, metavar='FILE',
+                        help='Results of a previous run, exits with 1 when a median is slower by more than '
+                             '--threshold')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Slowdown factor taken as a regression (default: %(default)s)')
+    args = parser.parse_args()
+    current = run_benchmarks(sizes=args.sizes, repeat=args.repeat, warmup=args.warmup, seed=args.seed,
+                             only=args.only)
+    if args.output is None:
+        print(json.dumps(current, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+        if len(compare_results(previous, current, threshold=args.threshold)) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
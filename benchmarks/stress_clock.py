@@ -0,0 +1,166 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import dataset
+from wtt import repositories
+from wtt.models.profile import Profile
+from wtt.repositories import execute_query
+from wtt.repositories import profile as profile_repo
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+
+DEFAULT_PROCESSES = 16
+DEFAULT_CLOCKS = 25  # per process
+DEFAULT_PROFILES = 4
+START_DELAY_IN_SECONDS = 0.5  # every process starts clocking at the same moment, after all of them were spawned
+
+
+def create_profiles(path, amount):
+    dataset.use_database(path)
+    date_utils.set_local_timezone(dataset.DATASET_TIMEZONE)
+    today = date_utils.date_to_naive_beginning_of_day(date_utils.get_now().replace(tzinfo=None))
+    profiles = []
+    for i in range(amount):
+        profile = Profile(f'Profile{i}', 'Stress', 'Benchmarks', dataset.LOCATIONS[0], today,
+                          latest_working_hour=datetime.datetime(1900, 1, 1, 22),
+                          default_timezone=dataset.DATASET_TIMEZONE)
+        profile_repo.create_profile(profile)
+        profiles.append(profile)
+    repositories.close_session()
+    return profiles
+
+
+def clock_worker(path, profiles, clocks, cooldown, busy_timeout_ms, start_at, index, results):
+    # clocks the profiles round robin, starting by a different one on each process, and reports the uuid of every
+    # stored card, the cooldown refusals and any other error, with the latency of each call
+    dataset.use_database(path)
+    date_utils.set_local_timezone(dataset.DATASET_TIMEZONE)
+    time_card_service.COOLDOWN_IN_SECONDS = cooldown
+    if busy_timeout_ms is not None:
+        repositories.SQLITE_PRAGMAS = tuple((pragma, busy_timeout_ms if pragma == 'busy_timeout' else value)
+                                            for pragma, value in repositories.SQLITE_PRAGMAS)
+    repositories.get_session_conn()
+    stored, cooldowns, errors, latencies = [], 0, [], []
+    time.sleep(max(0.0, start_at - time.time()))
+    for i in range(clocks):
+        profile = profiles[(index + i) % len(profiles)]
+        started_at = time.perf_counter()
+        try:
+            stored.append(time_card_service.store_clock_time_card(profile, method='stress').uuid)
+        except TimeoutError:
+            cooldowns += 1
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+        latencies.append((time.perf_counter() - started_at) * 1000)
+    repositories.close_session()
+    results.put({'stored': stored, 'cooldowns': cooldowns, 'errors': errors, 'latencies_ms': latencies})
+
+
+def run_scenario(name, path, profiles, processes, clocks, cooldown, busy_timeout_ms=None):
+    results = multiprocessing.Queue()
+    start_at = time.time() + START_DELAY_IN_SECONDS + processes * 0.02
+    workers = [multiprocessing.Process(target=clock_worker,
+                                       args=(path, profiles, clocks, cooldown, busy_timeout_ms, start_at, i, results))
+               for i in range(processes)]
+    started_at = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started_at
+
+    dataset.use_database(path)
+    rows = execute_query("""
+            SELECT uuid, profile_uuid, event_timestamp_epoch FROM time_cards
+            WHERE insertion_method = 'stress';
+        """, fetch=True)
+    repositories.close_session()
+    stored = [uuid for report in reports for uuid in report['stored']]
+    errors = [error for report in reports for error in report['errors']]
+    latencies = sorted(latency for report in reports for latency in report['latencies_ms'])
+    row_uuids = set(el['uuid'] for el in rows)
+    # with a cooldown every profile gets one card per window at most, without it every clock must be stored
+    if cooldown > 0:
+        expected = len(profiles)
+    else:
+        expected = processes * clocks
+    failures = []
+    if len(errors) > 0:
+        failures.append(f'{len(errors)} clocks failed')
+    if len(stored) != len(set(stored)) or set(stored) != row_uuids:
+        failures.append('the stored cards do not match the reported ones')
+    if len(rows) != expected:
+        failures.append(f'{len(rows)} cards stored, {expected} expected')
+    for profile in profiles:
+        epochs = sorted(el['event_timestamp_epoch'] for el in rows if el['profile_uuid'] == profile.uuid)
+        if cooldown > 0 and any(b - a < cooldown for a, b in zip(epochs, epochs[1:])):
+            failures.append(f'cards of {profile.first_name} closer than the cooldown')
+    return {
+        'scenario': name,
+        'processes': processes,
+        'clocks': processes * clocks,
+        'profiles': len(profiles),
+        'cooldown_s': cooldown,
+        'stored': len(rows),
+        'cooldowns': sum(report['cooldowns'] for report in reports),
+        'errors': errors[:10],
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'median_ms': round(statistics.median(latencies), 3),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        'max_ms': round(latencies[-1], 3),
+        'failures': failures,
+    }
+
+
+def run_stress(processes=DEFAULT_PROCESSES, clocks=DEFAULT_CLOCKS, profile_count=DEFAULT_PROFILES,
+               busy_timeout_ms=None):
+    results = []
+    with tempfile.TemporaryDirectory(prefix='wtt-stress-') as directory:
+        # every process presses clock on the same moments, only the first press of each profile is stored
+        path = os.path.join(directory, 'cooldown.sqlite')
+        profiles = create_profiles(path, profile_count)
+        results.append(run_scenario('cooldown', path, profiles, processes, clocks, 60, busy_timeout_ms))
+        # without a cooldown no clock may be lost, however many processes write at once
+        path = os.path.join(directory, 'no_cooldown.sqlite')
+        profiles = create_profiles(path, profile_count)
+        results.append(run_scenario('no_cooldown', path, profiles, processes, clocks, 0, busy_timeout_ms))
+    for result in results:
+        status = 'FAILED ' + ', '.join(result['failures']) if len(result['failures']) > 0 else 'ok'
+        print(f'{result["scenario"]}: {result["clocks"]} clocks on {result["processes"]} processes, '
+              f'{result["stored"]} stored, {result["cooldowns"]} on cooldown, median {result["median_ms"]:.1f} ms, '
+              f'p99 {result["p99_ms"]:.1f} ms - {status}', file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs many clock operations at the same time from several processes '
+                                                 'and checks that no card is duplicated or lost')
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES,
+                        help='Processes clocking at the same time (default: %(default)s)')
+    parser.add_argument('--clocks', type=int, default=DEFAULT_CLOCKS,
+                        help='Clocks of each process (default: %(default)s)')
+    parser.add_argument('--profiles', type=int, default=DEFAULT_PROFILES,
+                        help='Profiles clocked round robin (default: %(default)s)')
+    parser.add_argument('--busy-timeout', type=int, default=None, dest='busy_timeout_ms',
+                        help='sqlite busy timeout of the processes in milliseconds, low values exercise the retries '
+                             '(default: SQLITE_BUSY_TIMEOUT_MS)')
+    args = parser.parse_args()
+    results = run_stress(processes=args.processes, clocks=args.clocks, profile_count=args.profiles,
+                         busy_timeout_ms=args.busy_timeout_ms)
+    print(json.dumps(results, indent=2))
+    if any(len(el['failures']) > 0 for el in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
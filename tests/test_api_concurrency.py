@@ -0,0 +1,83 @@
+import asyncio
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import dataset
+from wtt import api
+from wtt import repositories
+from wtt.repositories import profile as profile_repo
+from wtt.utils import date as date_utils
+
+PROFILES = 8
+REQUESTS = 400
+CLIENTS = 16
+
+
+class ApiConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='wtt-test-')
+        dataset.generate_dataset(os.path.join(self.directory.name, 'wtt.sqlite'), profiles=PROFILES, years=1)
+        self.profiles = profile_repo.get_all_profiles()
+        repositories.close_session()
+        # the server runs on its own event loop, on a free port, as wtt api would
+        self.api_server = api.ApiServer()
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.api_server.handle_connection, '127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.stop_server(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.api_server.executor.shutdown(wait=True)
+        self.directory.cleanup()
+
+    async def stop_server(self):
+        # the connections the clients closed are still being handled for a moment
+        self.server.close()
+        await self.server.wait_closed()
+        await asyncio.gather(*[task for task in asyncio.all_tasks() if task is not asyncio.current_task()],
+                             return_exceptions=True)
+
+    def request(self, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            data = None if body is None else json.dumps(body)
+            conn.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            return response.status, response.read().decode('utf-8')
+        finally:
+            conn.close()
+
+    def test_time_cards_and_balances_of_many_profiles(self):
+        # cards on past days mark them as dirty, so every balance read refreshes the ledger while others write
+        rng = random.Random(0)
+        requests = []
+        for i in range(REQUESTS):
+            profile = self.profiles[i % len(self.profiles)]
+            if rng.random() < 0.5:
+                event_timestamp = date_utils.add_days_to_datetime(date_utils.get_utc_now(), -rng.randint(2, 300))
+                requests.append(('POST', f'/profiles/{profile.uuid}/time-cards',
+                                 {'event_timestamp': event_timestamp.isoformat()}))
+            else:
+                requests.append(('GET', f'/profiles/{profile.uuid}/balance', None))
+        with ThreadPoolExecutor(max_workers=CLIENTS) as executor:
+            responses = list(executor.map(lambda el: self.request(*el), requests))
+        failures = [(request[:2], response) for request, response in zip(requests, responses)
+                    if response[0] not in (200, 201)]
+        self.assertEqual([], failures)
+
+
+if __name__ == '__main__':
+    unittest.main()
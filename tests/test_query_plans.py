@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks import dataset
+from wtt import repositories
+from wtt.repositories import audit
+from wtt.repositories import execute_query
+from wtt.repositories import migrations
+from wtt.services import database as database_service
+
+
+class QueryPlansTest(unittest.TestCase):
+    # the plans of the repository queries, as wtt db check and wtt db audit read them
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='wtt-test-')
+        dataset.generate_dataset(os.path.join(self.directory.name, 'wtt.sqlite'), profiles=2, years=1)
+
+    def tearDown(self):
+        repositories.close_session()
+        self.directory.cleanup()
+
+    def assertQueriesAreServedByAnIndex(self):
+        self.assertEqual([], migrations.check_query_plans())
+        errors = [(el['name'], el['findings']) for el in audit.audit_query_plans()
+                  if not el['scan_expected'] and el['findings']]
+        self.assertEqual([], errors)
+
+    def test_query_plans(self):
+        self.assertQueriesAreServedByAnIndex()
+
+    def test_query_plans_with_statistics(self):
+        # ANALYZE lets the planner pick other indexes, which must serve the queries too
+        execute_query('ANALYZE;')
+        self.assertQueriesAreServedByAnIndex()
+
+    def test_plan_details(self):
+        self.assertTrue(migrations.is_full_scan('SCAN time_cards'))
+        self.assertFalse(migrations.is_full_scan('SCAN time_cards', scanned_tables=('time_cards',)))
+        self.assertFalse(migrations.is_full_scan('SCAN time_cards USING INDEX time_cards_profile_epoch_idx'))
+        self.assertTrue(migrations.is_unindexed_sort('USE TEMP B-TREE FOR ORDER BY'))
+        self.assertTrue(migrations.is_unindexed_sort('USE TEMP B-TREE FOR GROUP BY'))
+        self.assertFalse(migrations.is_unindexed_sort(
+            'SEARCH holidays USING INDEX holidays_location_date_idx (location=? AND date=?)'))
+
+    def test_unindexed_sort_fails_the_check(self):
+        # a sort on a column no index returns in order is a failure, though its rows are found through an index
+        query = 'SELECT * FROM holidays WHERE "location" = ? AND "date" = ? ORDER BY description;'
+        checks = [('unindexed sort', query, ('', '2020-01-01'))]
+        original_get_query_plan_checks = migrations.get_query_plan_checks
+        migrations.get_query_plan_checks = lambda: checks
+        try:
+            self.assertEqual(['unindexed sort'], [name for name, _ in migrations.check_query_plans()])
+            with self.assertRaises(AssertionError):
+                database_service.print_query_plan_check()
+        finally:
+            migrations.get_query_plan_checks = original_get_query_plan_checks
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks import dataset
+from wtt import repositories
+from wtt.models.absence import Absence
+from wtt.models.holiday import Holiday
+from wtt.repositories import execute_query
+from wtt.repositories import profile as profile_repo
+from wtt.repositories import time_card as time_card_repo
+from wtt.repositories import work_day as work_day_repo
+from wtt.services import absence as absence_service
+from wtt.services import holiday as holiday_service
+from wtt.services import team as team_service
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+
+
+class WorkDaysLedgerTest(unittest.TestCase):
+    # every change is followed by a read that updates the stored ledger incrementally, which must give the days a full
+    # computation gives
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='wtt-test-')
+        dataset.generate_dataset(os.path.join(self.directory.name, 'wtt.sqlite'), profiles=2, years=1)
+        self.profile = profile_repo.get_all_profiles()[0]
+        self.location_weekend_days = repositories.LOCATION_WEEKEND_DAYS
+        self.assertLedgerIsRecomputed()
+
+    def tearDown(self):
+        repositories.LOCATION_WEEKEND_DAYS = self.location_weekend_days
+        date_utils.set_local_timezone(dataset.DATASET_TIMEZONE)
+        repositories.close_session()
+        self.directory.cleanup()
+
+    def assertLedgerIsRecomputed(self, team=False):
+        profiles = profile_repo.get_all_profiles()
+        if team:
+            team_service.refresh_team_work_days(profiles, jobs=1)
+        else:
+            for profile in profiles:
+                time_card_service.refresh_work_days(profile)
+        last_day = date_utils.date_to_naive_beginning_of_day(date_utils.get_yesterday())
+        for profile in profiles:
+            stored = [el.to_database_params() for el in work_day_repo.get_profile_work_days(profile)]
+            computed = [el.to_database_params() for el in time_card_service.compute_work_days(
+                profile, date_utils.date_to_naive_beginning_of_day(profile.start_date), last_day)]
+            self.assertEqual(computed, stored)
+
+    def get_past_date(self, days):
+        return date_utils.date_to_naive_beginning_of_day(
+            date_utils.add_days_to_datetime(date_utils.get_now().replace(tzinfo=None), -days))
+
+    def add_time_card(self, date, hour, minute=0):
+        event_timestamp = date.replace(hour=hour, minute=minute)
+        return time_card_service.store_manual_time_card(self.profile, event_timestamp)
+
+    def test_time_cards(self):
+        self.add_time_card(self.get_past_date(30), 13)
+        self.assertLedgerIsRecomputed()
+        # cards late in the night belong to the local day, and the rest before the next day depends on them
+        self.add_time_card(self.get_past_date(20), 23, 30)
+        self.assertLedgerIsRecomputed()
+        self.add_time_card(self.get_past_date(21), 13)  # the day after it is recomputed too, with its late card
+        self.assertLedgerIsRecomputed()
+        self.add_time_card(self.get_past_date(19), 0, 15)
+        self.assertLedgerIsRecomputed()
+        date = self.get_past_date(10)
+        time_cards = time_card_repo.get_profile_time_cards(self.profile, start_date=date,
+                                                           end_date=date.replace(hour=23, minute=59))
+        for time_card in time_cards[:1]:
+            time_card_service.remove_time_card(self.profile, time_card.uuid)
+        self.assertLedgerIsRecomputed()
+
+    def test_holidays(self):
+        one_off = Holiday(date_utils.set_timezone_on_datetime(self.get_past_date(40), 'UTC'),
+                          self.profile.working_location, description='One-off', repeats_every_year=False)
+        holiday_service.insert_holiday(one_off)
+        self.assertLedgerIsRecomputed()
+        yearly = Holiday(date_utils.set_timezone_on_datetime(self.get_past_date(50), 'UTC'),
+                         self.profile.working_location, description='Yearly', working_hours=4)
+        holiday_service.insert_holiday(yearly)
+        self.assertLedgerIsRecomputed()
+        execute_query('DELETE FROM holidays WHERE uuid = ?;', params=(one_off.uuid,))
+        self.assertLedgerIsRecomputed()
+        execute_query('UPDATE holidays SET working_hours = 0 WHERE uuid = ?;', params=(yearly.uuid,))
+        self.assertLedgerIsRecomputed()
+
+    def test_absences(self):
+        absence = Absence(self.profile.uuid, date_utils.set_timezone_on_datetime(self.get_past_date(60), 'UTC'),
+                          description='Absence', authorized=True)
+        absence_service.insert_absence(absence)
+        self.assertLedgerIsRecomputed()
+        execute_query('UPDATE absences SET authorized = 0 WHERE uuid = ?;', params=(absence.uuid,))
+        self.assertLedgerIsRecomputed()
+        execute_query('DELETE FROM absences WHERE uuid = ?;', params=(absence.uuid,))
+        self.assertLedgerIsRecomputed()
+
+    def test_settings(self):
+        execute_query('UPDATE profiles SET daily_office_hours = 6 WHERE uuid = ?;', params=(self.profile.uuid,))
+        self.assertLedgerIsRecomputed()
+        repositories.LOCATION_WEEKEND_DAYS = {self.profile.working_location: (4, 5)}
+        self.assertLedgerIsRecomputed()
+        date_utils.set_local_timezone('Europe/Lisbon')
+        self.assertLedgerIsRecomputed()
+
+    def test_team_refresh(self):
+        self.add_time_card(self.get_past_date(30), 13)
+        holiday_service.insert_holiday(Holiday(date_utils.set_timezone_on_datetime(self.get_past_date(40), 'UTC'),
+                                               self.profile.working_location, repeats_every_year=False))
+        self.assertLedgerIsRecomputed(team=True)
+        execute_query('UPDATE profiles SET required_lunch_time = 2 WHERE uuid = ?;', params=(self.profile.uuid,))
+        self.assertLedgerIsRecomputed(team=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from benchmarks import dataset
+from wtt import repositories
+from wtt.repositories import profile as profile_repo
+from wtt.services import team as team_service
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+
+PROCESSES = 4
+ROUNDS = 30
+START_DELAY_IN_SECONDS = 0.5
+
+
+def add_cards_and_read_balance(path, profile_uuid, seed, start_at, results):
+    # adds time cards on past days, which marks them as dirty, and reads the balance right after each one, so every
+    # read refreshes the ledger while the other processes write theirs
+    dataset.use_database(path)
+    date_utils.set_local_timezone(dataset.DATASET_TIMEZONE)
+    rng = random.Random(seed)
+    profile = profile_repo.get_profile(profile_uuid)
+    errors = []
+    time.sleep(max(0.0, start_at - time.time()))
+    for _ in range(ROUNDS):
+        event_timestamp = date_utils.add_days_to_datetime(date_utils.get_utc_now(), -rng.randint(2, 300))
+        try:
+            time_card_service.store_manual_time_card(profile, event_timestamp)
+            time_card_service.get_extra_hours_balance_in_minutes(profile)
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+    repositories.close_session()
+    results.put(errors)
+
+
+def read_team_balances(path, start_at, results):
+    # refreshes the ledgers of every profile at once, while the other processes add cards to them
+    dataset.use_database(path)
+    date_utils.set_local_timezone(dataset.DATASET_TIMEZONE)
+    errors = []
+    time.sleep(max(0.0, start_at - time.time()))
+    for _ in range(ROUNDS):
+        try:
+            team_service.get_team_extra_hours_balance(jobs=1)
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+    repositories.close_session()
+    results.put(errors)
+
+
+class WorkDaysConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='wtt-test-')
+        self.path = os.path.join(self.directory.name, 'wtt.sqlite')
+        dataset.generate_dataset(self.path, profiles=PROCESSES, years=1)
+        self.profiles = profile_repo.get_all_profiles()
+        for profile in self.profiles:
+            time_card_service.refresh_work_days(profile)
+        repositories.close_session()
+
+    def tearDown(self):
+        repositories.close_session()
+        self.directory.cleanup()
+
+    def test_ledger_refreshes_of_many_processes(self):
+        results = multiprocessing.Queue()
+        start_at = time.time() + START_DELAY_IN_SECONDS
+        workers = [multiprocessing.Process(target=add_cards_and_read_balance,
+                                           args=(self.path, profile.uuid, i, start_at, results))
+                   for i, profile in enumerate(self.profiles)]
+        workers.append(multiprocessing.Process(target=read_team_balances, args=(self.path, start_at, results)))
+        for worker in workers:
+            worker.start()
+        errors = [error for _ in workers for error in results.get()]
+        for worker in workers:
+            worker.join()
+        self.assertEqual([], errors)
+
+        # the ledger each process kept up to date is the one a full computation gives
+        dataset.use_database(self.path)
+        for profile in profile_repo.get_all_profiles():
+            stored = [work_day.to_database_params() for work_day in time_card_service.get_work_days(profile)]
+            time_card_service.rebuild_work_days(profile)
+            rebuilt = [work_day.to_database_params() for work_day in time_card_service.get_work_days(profile)]
+            self.assertEqual(rebuilt, stored)
+
+
+if __name__ == '__main__':
+    unittest.main()
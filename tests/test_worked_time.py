@@ -0,0 +1,83 @@
+import datetime
+import random
+import unittest
+
+from wtt.models.time_card_batch import TimeCardBatch
+from wtt.utils import date as date_utils
+from wtt.utils import worked_time as worked_time_utils
+
+TIMEZONE = 'Europe/Lisbon'  # with daylight saving time, so some days have 23 and 25 hours
+
+
+def get_batch(local_datetimes, timezone=TIMEZONE):
+    # the cards as repositories/time_card.py reads them, sorted by time and numbered by their local day
+    epochs = sorted(int(date_utils.set_timezone_on_datetime(el, timezone).timestamp()) for el in local_datetimes)
+    batch = TimeCardBatch('profile')
+    for epoch in epochs:
+        batch.append(epoch, date_utils.epoch_to_day_number(epoch, timezone))
+    return batch
+
+
+def get_day_number(year, month, day):
+    return date_utils.datetime_to_day_number(datetime.date(year, month, day))
+
+
+@unittest.skipIf(worked_time_utils.get_numpy() is None, 'numpy is not installed')
+class WorkedTimeParityTest(unittest.TestCase):
+    # the numpy engine must give exactly what the pure python engine gives, which runs when numpy is not installed
+
+    def assertEnginesAgree(self, batch):
+        python = worked_time_utils.get_daily_worked_time_python(batch.epochs, batch.day_numbers)
+        numpy = worked_time_utils.get_daily_worked_time_numpy(batch.epochs, batch.day_numbers)
+        self.assertEqual(python, numpy)
+        self.assertEqual(python, worked_time_utils.get_daily_worked_time(batch.epochs, batch.day_numbers))
+        return python
+
+    def test_empty_batch(self):
+        self.assertEqual([], self.assertEnginesAgree(get_batch([])))
+
+    def test_single_card_days(self):
+        daily = self.assertEnginesAgree(get_batch([datetime.datetime(2024, 5, 6, 9), datetime.datetime(2024, 5, 8, 9)]))
+        first_card = get_batch([datetime.datetime(2024, 5, 6, 9)]).epochs[0] // 60
+        self.assertEqual((get_day_number(2024, 5, 6), 1, 0, 0, 0, first_card, first_card), daily[0])
+        self.assertEqual(2, len(daily))
+
+    def test_odd_card_days(self):
+        # the last card of a day with an odd amount of cards is ignored
+        daily = self.assertEnginesAgree(get_batch([datetime.datetime(2024, 5, 6, 9), datetime.datetime(2024, 5, 6, 12),
+                                                   datetime.datetime(2024, 5, 6, 13, 30)]))
+        self.assertEqual([(3, 180, 180, 90)], [el[1:5] for el in daily])
+
+    def test_cards_on_day_boundaries(self):
+        # a card at midnight starts the next day, and the seconds of a card are dropped
+        daily = self.assertEnginesAgree(get_batch([
+            datetime.datetime(2024, 5, 6, 22), datetime.datetime(2024, 5, 6, 23, 59, 59),
+            datetime.datetime(2024, 5, 7, 0, 0, 0), datetime.datetime(2024, 5, 7, 0, 0, 59),
+            datetime.datetime(2024, 5, 7, 23, 59), datetime.datetime(2024, 5, 8, 0, 0, 1),
+        ]))
+        self.assertEqual([(get_day_number(2024, 5, 6), 2, 119), (get_day_number(2024, 5, 7), 3, 0),
+                          (get_day_number(2024, 5, 8), 1, 0)], [el[:3] for el in daily])
+
+    def test_daylight_saving_time_days(self):
+        # the clocks go forward at 01:00 on 31/03/2024 and back at 02:00 on 27/10/2024 in Lisbon
+        daily = self.assertEnginesAgree(get_batch([
+            datetime.datetime(2024, 3, 31, 0, 30), datetime.datetime(2024, 3, 31, 2, 30),
+            datetime.datetime(2024, 10, 27, 0, 30), datetime.datetime(2024, 10, 27, 2, 30),
+        ]))
+        self.assertEqual([60, 180], [el[2] for el in daily])
+
+    def test_random_batches(self):
+        rng = random.Random(0)
+        first_day = datetime.datetime(2024, 1, 1)
+        for _ in range(200):
+            local_datetimes = [first_day + datetime.timedelta(seconds=rng.randint(0, 60 * 86400))
+                               for _ in range(rng.randint(1, 300))]
+            # a few cards on the same minute, and on midnight
+            local_datetimes += [rng.choice(local_datetimes) for _ in range(rng.randint(0, 5))]
+            local_datetimes += [first_day + datetime.timedelta(days=rng.randint(0, 60))
+                                for _ in range(rng.randint(0, 5))]
+            self.assertEnginesAgree(get_batch(local_datetimes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from wtt.models.absence import Absence
+from wtt.models.holiday import Holiday
+from wtt.services import absence as absence_service
+from wtt.services import holiday as holiday_service
+from wtt.services import profile as profile_service
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+
+API_HOST = os.getenv('API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('API_PORT', '8080'))
+API_WORKERS = int(os.getenv('API_WORKERS', '4'))  # every worker thread keeps its own sqlite connection
+MAX_BODY_IN_BYTES = 1024 * 1024
+# profiles share a fixed amount of locks, so requests with made up profile uuids can not make them grow
+PROFILE_LOCK_STRIPES = 64
+
+HTTP_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_date(value, field):
+    try:
+        return date_utils.string_to_datetime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise HttpError(400, f'{field} must be a date formatted as YYYY-MM-DD')
+
+
+def parse_timestamp(value, field):
+    try:
+        return date_utils.iso_string_to_datetime(value)
+    except (TypeError, ValueError, OverflowError):
+        raise HttpError(400, f'{field} must be an ISO 8601 timestamp')
+
+
+def parse_hours(value, field):
+    # bools are ints for python, but not for the clients
+    if type(value) is not int or value < 0:
+        raise HttpError(400, f'{field} must be a non negative integer')
+    return value
+
+
+def parse_bool(value, field):
+    if type(value) is not bool:
+        raise HttpError(400, f'{field} must be true or false')
+    return value
+
+
+def parse_description(value, field):
+    if value is not None and type(value) is not str:
+        raise HttpError(400, f'{field} must be a string')
+    return value
+
+
+def get_profile_or_raise(profile_uuid):
+    profile = profile_service.get_profile(profile_uuid)
+    if profile is None:
+        raise HttpError(404, f'Profile {profile_uuid} not found')
+    return profile
+
+
+# handlers run on the worker threads, they receive the captured path parameters, the query string and the json body
+
+def list_profiles(query, body):
+    return 200, [profile.to_dict() for profile in profile_service.get_all_profiles()]
+
+
+def clock(query, body, profile_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    try:
+        time_card = time_card_service.store_clock_time_card(profile, method='api')
+    except TimeoutError as e:
+        raise HttpError(409, str(e))
+    return 201, time_card.to_dict()
+
+
+def add_time_card(query, body, profile_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    event_timestamp = parse_timestamp(body.get('event_timestamp'), 'event_timestamp')
+    return 201, time_card_service.store_manual_time_card(profile, event_timestamp).to_dict()
+
+
+def list_time_cards(query, body, profile_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    if 'date' in query:
+        date = parse_date(query['date'], 'date')
+    else:
+        date = date_utils.get_now()
+    return 200, [time_card.to_dict() for time_card in time_card_service.get_time_cards_of_a_day(profile, date)]
+
+
+def delete_time_card(query, body, profile_uuid, card_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    time_card = time_card_service.remove_time_card(profile, card_uuid)
+    if time_card is None:
+        raise HttpError(404, f'Time card {card_uuid} not found')
+    return 200, time_card.to_dict()
+
+
+def add_holiday(query, body):
+    if not body.get('location') or type(body['location']) is not str:
+        raise HttpError(400, 'location is required')
+    holiday = Holiday(parse_date(body.get('date'), 'date'), body['location'],
+                      description=parse_description(body.get('description'), 'description'),
+                      working_hours=parse_hours(body.get('working_hours', 0), 'working_hours'),
+                      repeats_every_year=parse_bool(body.get('repeats_every_year', True), 'repeats_every_year'))
+    return 201, holiday_service.insert_holiday(holiday).to_dict()
+
+
+def add_absence(query, body, profile_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    absence = Absence(profile.uuid, parse_date(body.get('date'), 'date'),
+                      description=parse_description(body.get('description'), 'description'),
+                      authorized=parse_bool(body.get('authorized', False), 'authorized'))
+    return 201, absence_service.insert_absence(absence).to_dict()
+
+
+def get_balance(query, body, profile_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    daily_details_dict = {}
+    balance = time_card_service.get_extra_hours_balance_in_minutes(profile, daily_details_dict=daily_details_dict)
+    days = {date_utils.datetime_to_string(date, '%Y-%m-%d'): minutes for date, minutes in daily_details_dict.items()}
+    return 200, {'balance_minutes': balance, 'days': days}
+
+
+def list_work_days(query, body, profile_uuid):
+    profile = get_profile_or_raise(profile_uuid)
+    start_date = parse_date(query['start'], 'start') if 'start' in query else None
+    end_date = parse_date(query['end'], 'end') if 'end' in query else None
+    work_days = time_card_service.get_work_days(profile, start_date=start_date, end_date=end_date)
+    try:
+        statuses = time_card_service.filter_work_day_status({work_day.date: work_day.get_status()
+                                                             for work_day in work_days},
+                                                            filter_out_below=query.get('filter', 'VERBOSE'))
+    except AttributeError as e:
+        raise HttpError(400, str(e))
+    return 200, [work_day.to_dict() for work_day in work_days if work_day.date in statuses]
+
+
+# method, path pattern, handler, whether the handler changes the data of the profile, balance and work-days are reads,
+# even though they bring the work days ledger up to date first, that write is idempotent, it stores what the time
+# cards, absences and holidays already determine, so sharing those reads never hides a change, and it runs on a
+# BEGIN IMMEDIATE transaction retried while the workers of other profiles write, see refresh_work_days
+ROUTES = (
+    ('GET', r'/profiles', list_profiles, False),
+    ('POST', r'/profiles/(?P<profile_uuid>[^/]+)/clock', clock, True),
+    ('GET', r'/profiles/(?P<profile_uuid>[^/]+)/time-cards', list_time_cards, False),
+    ('POST', r'/profiles/(?P<profile_uuid>[^/]+)/time-cards', add_time_card, True),
+    ('DELETE', r'/profiles/(?P<profile_uuid>[^/]+)/time-cards/(?P<card_uuid>[^/]+)', delete_time_card, True),
+    ('POST', r'/profiles/(?P<profile_uuid>[^/]+)/absences', add_absence, True),
+    ('GET', r'/profiles/(?P<profile_uuid>[^/]+)/balance', get_balance, False),
+    ('GET', r'/profiles/(?P<profile_uuid>[^/]+)/work-days', list_work_days, False),
+    ('POST', r'/holidays', add_holiday, True),
+)
+COMPILED_ROUTES = tuple((method, re.compile(pattern + '/?$'), handler, writes)
+                        for method, pattern, handler, writes in ROUTES)
+
+
+def find_route(method, path):
+    allowed = False
+    for route_method, pattern, handler, writes in COMPILED_ROUTES:
+        match = pattern.match(path)
+        if match is not None:
+            if route_method == method:
+                return handler, writes, match.groupdict()
+            allowed = True
+    if allowed:
+        raise HttpError(405, f'Method {method} not allowed on {path}')
+    raise HttpError(404, f'Nothing found on {path}')
+
+
+class ApiServer(object):
+    def __init__(self, workers=API_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wtt-api')
+        # identical reads of a profile that arrive while one is running share its result
+        self.in_flight = {}
+        # work of the same profile runs one at a time, so it never competes for the sqlite write lock with itself, the
+        # locks are created on the event loop that uses them
+        self.profile_locks = [None] * PROFILE_LOCK_STRIPES
+
+    def get_profile_lock(self, profile_uuid):
+        index = hash(profile_uuid) % PROFILE_LOCK_STRIPES
+        lock = self.profile_locks[index]
+        if lock is None:
+            lock = asyncio.Lock()
+            self.profile_locks[index] = lock
+        return lock
+
+    async def run_locked(self, profile_uuid, handler, query, body, params):
+        loop = asyncio.get_running_loop()
+        async with self.get_profile_lock(profile_uuid):
+            return await loop.run_in_executor(self.executor, lambda: handler(query, body, **params))
+
+    async def dispatch(self, method, path, query, body):
+        handler, writes, params = find_route(method, path)
+        profile_uuid = params.get('profile_uuid')
+        if writes:
+            # reads that started before this write would return stale data, so they are not shared anymore
+            for key in [key for key in self.in_flight if key[0] == profile_uuid or profile_uuid is None]:
+                del self.in_flight[key]
+            return await self.run_locked(profile_uuid, handler, query, body, params)
+        # reads may still refresh the ledger, under the profile lock, which gives the same result however often it runs
+        key = (profile_uuid, handler.__name__, tuple(sorted(params.items())), tuple(sorted(query.items())))
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.run_locked(profile_uuid, handler, query, body, params))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self.forget_in_flight(key, done))
+        return await asyncio.shield(task)
+
+    def forget_in_flight(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    async def handle_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(400, 'Malformed request line')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        try:
+            content_length = int(headers.get('content-length', '0') or '0')
+        except ValueError:
+            raise HttpError(400, 'Content-Length must be an integer')
+        if content_length < 0:
+            raise HttpError(400, 'Content-Length must be an integer')
+        if content_length > MAX_BODY_IN_BYTES:
+            raise HttpError(413, 'Request body is too large')
+        body = {}
+        if content_length > 0:
+            try:
+                body = json.loads((await reader.readexactly(content_length)).decode('utf-8'))
+            except ValueError:
+                raise HttpError(400, 'Request body must be a json object')
+            if type(body) is not dict:
+                raise HttpError(400, 'Request body must be a json object')
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        status, payload = await self.dispatch(method.upper(), url.path, query, body)
+        return status, payload, keep_alive
+
+    async def handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    result = await self.handle_request(reader)
+                    if result is None:
+                        break
+                    status, payload, keep_alive = result
+                except HttpError as e:
+                    status, payload, keep_alive = e.status, {'error': str(e)}, False
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    print(f'Error while handling a request: {e}', file=sys.stderr)
+                    status, payload, keep_alive = 500, {'error': str(e)}, False
+                data = json.dumps(payload).encode('utf-8')
+                writer.write((f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}\r\n'
+                              f'Content-Type: application/json\r\n'
+                              f'Content-Length: {len(data)}\r\n'
+                              f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=API_HOST, port=API_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f'Serving the API on http://{host}:{port}', flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def serve(host=API_HOST, port=API_PORT, workers=API_WORKERS):
+    api_server = ApiServer(workers=workers)
+    try:
+        asyncio.run(api_server.serve(host=host, port=port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api_server.executor.shutdown(wait=True)
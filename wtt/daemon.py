@@ -0,0 +1,152 @@
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+# only the standard library is imported here, the client runs before any other module of wtt is loaded
+
+SOCKET_PATH = os.getenv('SOCKET_FILE', os.path.join(os.path.expanduser('~'), '.wtt', 'wtt.sock'))
+SETTINGS_PATH = os.getenv('SETTINGS_FILE', os.path.join(os.path.expanduser('~'), '.wtt', 'settings.json'))
+DISABLE_DAEMON = os.getenv('DISABLE_DAEMON', 'false').lower() in ('true', '1')
+DAEMON_TIMEOUT_IN_SECONDS = float(os.getenv('DAEMON_TIMEOUT_IN_SECONDS', '30'))
+# traced commands run in process, the trace would measure the daemon otherwise
+TRACE_OPTIONS = ('--trace', '--trace-memory')
+TRACING = os.getenv('TRACE', 'false').lower() in ('true', '1') or os.getenv('TRACE_MEMORY', 'false').lower() in (
+    'true', '1')
+# watch modes keep running until interrupted, they would hold the daemon forever
+WATCH_OPTIONS = ('--watch',)
+
+# commands that do not prompt for input, the others always run in process
+SERVED_COMMANDS = ('clock', 'ttco', 'ehbal', 'stc', 'wdr', 'team')
+OPTIONS_WITH_VALUE = ('-p', '--profile')
+# variables that change the database, the profile or the results of the served commands, the daemon only serves
+# clients with the same values it was started with, the settings file is only read once, on its start, as well
+CONTEXT_VARIABLES = ('HOME', 'TZ', 'DATABASE_FILE', 'SETTINGS_FILE', 'CURRENT_PROFILE', 'WEEKEND_DAYS',
+                     'USE_PROFILE_TIMEZONE', 'COOLDOWN_IN_SECONDS', 'DISABLE_NUMPY', 'REPORT_JOBS',
+                     'SQLITE_BUSY_TIMEOUT_MS', 'SQLITE_WRITE_RETRIES', 'SQLITE_WRITE_RETRY_BACKOFF_MS',
+                     'CLOCK_LATENCY_TARGET_IN_MS')
+
+
+def read_message(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def get_context():
+    try:
+        settings_mtime = os.path.getmtime(SETTINGS_PATH)
+    except OSError:
+        settings_mtime = None
+    return {'environment': {el: os.getenv(el) for el in CONTEXT_VARIABLES}, 'settings_mtime': settings_mtime}
+
+
+def get_command(argv):
+    # first positional argument, global flags come before the sub-command
+    skip_value = False
+    for arg in argv[1:]:
+        if skip_value:
+            skip_value = False
+        elif arg in OPTIONS_WITH_VALUE:
+            skip_value = True
+        elif not arg.startswith('-'):
+            return arg.lower()
+    return None
+
+
+def run_captured(main_function, argv):
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            main_function(list(argv))
+        except SystemExit as e:  # argparse exits on --help and on invalid arguments
+            exit_code = e.code if type(e.code) is int else (0 if e.code is None else 1)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit_code = 1
+    return {'served': True, 'exit_code': exit_code, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+class CommandHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            message = read_message(self.request)
+            argv = message['argv']
+        except (ValueError, KeyError, TypeError):
+            return
+        # a client of another database, profile or settings runs the command in process
+        if message.get('context') == self.server.context and get_command(argv) in SERVED_COMMANDS:
+            response = run_captured(self.server.main_function, argv)
+        else:
+            response = {'served': False}
+        self.request.sendall(json.dumps(response).encode('utf-8'))
+
+
+class CommandServer(socketserver.UnixStreamServer):
+    # commands are handled one at a time, they share the session connection and redirect the process outputs
+
+    def __init__(self, socket_path, main_function):
+        self.main_function = main_function
+        self.context = get_context()
+        super().__init__(socket_path, CommandHandler)
+
+
+def is_daemon_running(socket_path=SOCKET_PATH):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def serve(main_function, socket_path=SOCKET_PATH):
+    if is_daemon_running(socket_path):
+        raise RuntimeError(f'There is a daemon running on {socket_path} already')
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # left behind by a daemon that was killed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # removes the socket file on kill as well
+    with CommandServer(socket_path, main_function) as server:
+        os.chmod(socket_path, 0o600)
+        print(f'Serving {", ".join(SERVED_COMMANDS)} on {socket_path}', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def run_on_daemon(argv, socket_path=SOCKET_PATH):
+    # returns the exit code of the command, or None when it must run in process
+    if DISABLE_DAEMON or TRACING or get_command(argv) not in SERVED_COMMANDS or not os.path.exists(socket_path):
+        return None
+    if any(el in TRACE_OPTIONS or el in WATCH_OPTIONS for el in argv):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            conn.connect(socket_path)
+        except OSError:
+            return None  # nothing was sent yet, so running in process can not store a time card twice
+        conn.settimeout(DAEMON_TIMEOUT_IN_SECONDS)
+        conn.sendall(json.dumps({'argv': argv, 'context': get_context()}).encode('utf-8'))
+        conn.shutdown(socket.SHUT_WR)
+        response = read_message(conn)
+    finally:
+        conn.close()
+    if not response.get('served'):
+        return None
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['exit_code']
@@ -1,18 +1,177 @@
 import argparse
 import os
 import sys
+import time
+
+STARTED_AT = time.perf_counter()
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from wtt.services import time_card as time_card_service
-from wtt.services import profile as profile_service
-from wtt.services import holiday as holiday_service
-from wtt.services import absence as absence_service
-from wtt.utils import date as date_utils
+# services are imported by the sub-commands that need them, to keep the startup of quick commands, such as clock, short
+
+startup_timings = []
+last_startup_timing = STARTED_AT
+
+
+def mark_startup_phase(phase):
+    global last_startup_timing
+    now = time.perf_counter()
+    startup_timings.append((phase, now - last_startup_timing))
+    last_startup_timing = now
+
+
+def print_startup_timings():
+    report = 'Startup timing:'
+    for phase, elapsed in startup_timings:
+        report += f'\n\t{phase}: {elapsed * 1000:.1f} ms'
+    report += f'\n\ttotal: {(last_startup_timing - STARTED_AT) * 1000:.1f} ms'
+    print(report, file=sys.stderr)
+
+
+CLOCK_LATENCY_TARGET_IN_MS = float(os.getenv('CLOCK_LATENCY_TARGET_IN_MS', '100'))
+
+
+def run_follow_up_report(report_function, *args, **kwargs):
+    # reports that follow a stored time card must never turn the clock into a failure
+    try:
+        report_function(*args, **kwargs)
+    except Exception as e:
+        print(f'Could not build the report: {e}', file=sys.stderr)
+
+
+def check_clock_latency():
+    latency_in_ms = (time.perf_counter() - STARTED_AT) * 1000
+    if latency_in_ms > CLOCK_LATENCY_TARGET_IN_MS:
+        print(f'Clocking took {latency_in_ms:.1f} ms, more than the {CLOCK_LATENCY_TARGET_IN_MS:.0f} ms target',
+              file=sys.stderr)
+
+
+def run_daemon_command(argv):
+    # the daemon process is reused, so timings and the clock latency are measured from the start of each command
+    global STARTED_AT, last_startup_timing
+    STARTED_AT = last_startup_timing = time.perf_counter()
+    startup_timings.clear()
+    main(argv)
+
+
+profile_selector = None
 
 
 def get_current_profile():
-    return profile_service.get_current_profile()
+    from wtt.services import profile as profile_service
+    return profile_service.get_current_profile(profile_selector)
+
+
+def run_command(cmd, args):
+    from wtt.services import time_card as time_card_service
+    from wtt.utils import date as date_utils
+    mark_startup_phase('imports')
+    date_utils.freeze_now()  # the whole command, reports included, sees the same instant
+    from wtt import repositories
+    repositories.get_session_conn()
+    mark_startup_phase('database')
+
+    if cmd not in ('wdr', 'addtc', 'import', 'export', 'rebuild', 'db', 'clock', 'team', 'archive') \
+            and args.check_errors:
+        time_card_service.print_work_day_status_report_if_recent_error(get_current_profile())
+        mark_startup_phase('error check')
+
+    if cmd == 'clock':
+        # the time card is stored before anything else, reports are only streamed once it is committed
+        time_card_service.clock_in_out(get_current_profile())
+        sys.stdout.flush()
+        if args.startup_timing:  # slower machines would get the warning on every clock otherwise
+            check_clock_latency()
+        mark_startup_phase('clock')
+        if args.check_errors:
+            run_follow_up_report(time_card_service.print_work_day_status_report_if_recent_error,
+                                 get_current_profile())
+            mark_startup_phase('error check')
+        if args.auto_ttco:
+            print('---')
+            run_follow_up_report(time_card_service.print_today_report, get_current_profile(), from_auto_run=True,
+                                 tabs=not args.no_tabs)
+            mark_startup_phase('today report')
+    elif cmd == 'ttco':
+        if args.ttco_watch:
+            time_card_service.watch_today_report(get_current_profile(), tabs=not args.no_tabs)
+        else:
+            time_card_service.print_today_report(get_current_profile(), tabs=not args.no_tabs)
+    elif cmd == 'ehbal':
+        time_card_service.print_extra_hours_balance_in_minutes(get_current_profile(), details=True)
+    elif cmd == 'stc':
+        if args.stc_date.lower() == 'today':
+            date = date_utils.get_now()
+        else:
+            date = date_utils.string_to_datetime(args.stc_date)
+        time_card_service.display_time_cards_of_a_day(get_current_profile(), date)
+    elif cmd == 'rmtc':
+        time_card_service.delete_time_card(get_current_profile(), args.rmtc_uuid)
+    elif cmd == 'addtc':
+        date = args.addtc_datetime
+        if type(args.addtc_datetime) is list:
+            date = ' '.join(args.addtc_datetime)
+        time_card_service.clock_in_out_manually(get_current_profile(), date)
+    elif cmd == 'addholi':
+        from wtt.services import holiday as holiday_service
+        holiday_service.prompt_and_insert_holiday()
+    elif cmd == 'addabs':
+        from wtt.services import absence as absence_service
+        absence_service.prompt_and_insert_absence(get_current_profile())
+    elif cmd == 'wdr':
+        time_card_service.print_work_day_status_report(get_current_profile(), args.wdr_filter)
+    elif cmd == 'team':
+        from wtt.services import team as team_service
+        jobs = args.team_jobs or team_service.REPORT_JOBS
+        if args.team_report == 'ehbal':
+            team_service.print_team_extra_hours_balance(as_json=args.team_json, jobs=jobs)
+        else:
+            team_service.print_team_work_day_status_report(args.team_filter, as_json=args.team_json, jobs=jobs)
+    elif cmd == 'import':
+        from wtt.services import import_export as import_export_service
+        import_export_service.print_import_time_cards(get_current_profile(), args.import_file,
+                                                      file_format=args.import_format)
+    elif cmd == 'export':
+        from wtt.services import import_export as import_export_service
+        start_date = end_date = None
+        if args.export_start is not None:
+            start_date = date_utils.string_to_datetime(args.export_start)
+        if args.export_end is not None:
+            end_date = date_utils.string_to_datetime(args.export_end)
+        import_export_service.print_export_records(args.export_kind,
+                                                   profile=None if args.export_all_profiles
+                                                   else get_current_profile(),
+                                                   output=args.export_output, file_format=args.export_format,
+                                                   start_date=start_date, end_date=end_date)
+    elif cmd == 'rebuild':
+        time_card_service.rebuild_work_days(get_current_profile())
+    elif cmd == 'archive':
+        from wtt.services import archive as archive_service
+        if args.archive_list:
+            archive_service.print_archives()
+        else:
+            archive_service.print_archive_years(until_year=args.archive_until, jobs=args.archive_jobs)
+    elif cmd == 'db':
+        from wtt.services import database as database_service
+        if args.db_action == 'check':
+            database_service.print_query_plan_check()
+        elif args.db_action == 'audit':
+            database_service.print_database_audit(as_json=args.db_json)
+    elif cmd == 'coreg':
+        time_card_service.clock_out_automatically(get_current_profile())
+    elif cmd == 'coearly':
+        time_card_service.clock_out_automatically(get_current_profile(), clock_early=True)
+    if cmd != 'clock':
+        mark_startup_phase('command')
+
+    watching = cmd == 'ttco' and args.ttco_watch
+    if args.auto_ehbal and cmd not in ('ehbal', 'export', 'db', 'team', 'archive') and not watching:
+        print('---')
+        if cmd == 'clock':
+            run_follow_up_report(time_card_service.print_extra_hours_balance_in_minutes, get_current_profile())
+        else:
+            time_card_service.print_extra_hours_balance_in_minutes(get_current_profile())
+        mark_startup_phase('extra hours balance')
 
 
 def main(argv):
@@ -29,10 +188,26 @@ def main(argv):
                         help='Remove tabs from string reports (default: %(default)s)')
     parser.add_argument('--dont-check-errors', dest='check_errors', required=False, action='store_false', default=True,
                         help='Check for errors on time cards, if present, print a warn report (default: False)')
+    parser.add_argument('-p', '--profile', dest='profile', required=False, type=str, default=None,
+                        help='Uuid or name of the profile to use, when there are many (default: CURRENT_PROFILE or '
+                             '"current_profile" on the settings file)')
+    parser.add_argument('--trace', dest='trace', required=False, action='store_true',
+                        default=os.getenv('TRACE', 'false').lower() in ('true', '1'),
+                        help='Trace the sql statements and service calls of the command, printing a summary to stderr '
+                             'and writing a chrome trace to TRACE_DIR or ~/.wtt/traces (default: TRACE or False)')
+    parser.add_argument('--trace-memory', dest='trace_memory', required=False, action='store_true',
+                        default=os.getenv('TRACE_MEMORY', 'false').lower() in ('true', '1'),
+                        help='Trace the memory peaks with tracemalloc as well, implies --trace (default: TRACE_MEMORY '
+                             'or False)')
+    parser.add_argument('--startup-timing', dest='startup_timing', required=False, action='store_true', default=False,
+                        help='Print the time spent on each phase of the command to stderr (default: %(default)s)')
 
     subparsers = parser.add_subparsers(dest='cmd', help='sub-commands help')
     clock_parser = subparsers.add_parser('clock', help='Clocks in or out from work')
     ttco_parser = subparsers.add_parser('ttco', help='Show time to clock out')
+    ttco_parser.add_argument('--watch', dest='ttco_watch', action='store_true', default=False,
+                             help='Redraws the report every second until interrupted, reading the database again only '
+                                  'when it changes')
     ehbal_parser = subparsers.add_parser('ehbal', help='Shows the extra hours balance')
     stc_parser = subparsers.add_parser('stc', help='Show time cards for a given day')
     stc_parser.add_argument('stc_date', type=str, nargs='?', default='Today',
@@ -50,61 +225,109 @@ def main(argv):
     wdr_parser.add_argument('wdr_filter', type=str, nargs='?', default='OK',
                             help='Filter out work day reports with severity equal or below the given one. (default: %(default)s)',
                             metavar='FILTER')
+    import_parser = subparsers.add_parser('import', help='Imports time cards from a csv or jsonl file, skipping those '
+                                                         'already recorded')
+    import_parser.add_argument('import_file', type=str, help='The file to import, csv files must have a header. Each '
+                                                             'record needs an event_timestamp_epoch, an '
+                                                             'event_timestamp_utc or an event_timestamp on local time',
+                               metavar='FILE')
+    import_parser.add_argument('--format', dest='import_format', type=str, choices=['csv', 'jsonl'], default=None,
+                               help='Format of the file (default: from the file extension)')
+    export_parser = subparsers.add_parser('export', help='Streams the time cards or the work days as csv or jsonl')
+    export_parser.add_argument('export_kind', type=str, choices=['cards', 'days'],
+                               help='cards: time cards, days: worked minutes and status of the closed work days',
+                               metavar='KIND')
+    export_parser.add_argument('-o', '--output', dest='export_output', type=str, default=None,
+                               help='File to write (default: stdout)')
+    export_parser.add_argument('--format', dest='export_format', type=str, choices=['csv', 'jsonl'], default=None,
+                               help='Format of the output (default: from the file extension, csv on stdout)')
+    export_parser.add_argument('--start', dest='export_start', type=str, default=None,
+                               help='First day to export. Format: dd/mm/YYYY', metavar='DATE')
+    export_parser.add_argument('--end', dest='export_end', type=str, default=None,
+                               help='Last day to export. Format: dd/mm/YYYY', metavar='DATE')
+    export_parser.add_argument('--all-profiles', dest='export_all_profiles', action='store_true', default=False,
+                               help='Exports every profile instead of the selected one (default: %(default)s)')
+    archive_parser = subparsers.add_parser('archive', help='Moves the time cards of closed years to one file per year, '
+                                                           'with the yearly totals of every profile')
+    archive_parser.add_argument('archive_until', type=int, nargs='?', default=None,
+                                help='Last year to archive (default: every year before the last ARCHIVE_KEEP_YEARS '
+                                     'closed ones)', metavar='YEAR')
+    archive_parser.add_argument('--list', dest='archive_list', action='store_true', default=False,
+                                help='Lists the archived years and their totals instead (default: %(default)s)')
+    archive_parser.add_argument('-j', '--jobs', dest='archive_jobs', type=int, default=None,
+                                help='Processes bringing the ledgers up to date before archiving (default: '
+                                     'REPORT_JOBS or the amount of cpus)')
+    rebuild_parser = subparsers.add_parser('rebuild', help='Rebuilds the work days ledger from the time cards')
+    team_parser = subparsers.add_parser('team', help='Shows the extra hours balance or the work day report of every '
+                                                     'profile')
+    team_parser.add_argument('team_report', type=str, choices=['ehbal', 'wdr'], help='The report to show',
+                             metavar='REPORT')
+    team_parser.add_argument('team_filter', type=str, nargs='?', default='OK',
+                             help='Filter of the wdr report, as on wdr. (default: %(default)s)', metavar='FILTER')
+    team_parser.add_argument('-j', '--jobs', dest='team_jobs', type=int, default=None,
+                             help='Processes computing the work days of the profiles (default: REPORT_JOBS or the '
+                                  'amount of cpus)')
+    team_parser.add_argument('--json', dest='team_json', action='store_true', default=False,
+                             help='Prints the report as json (default: %(default)s)')
+    db_parser = subparsers.add_parser('db', help='Database maintenance')
+    db_parser.add_argument('db_action', type=str, choices=['check', 'audit'],
+                           help='check: verifies that every repository query is served by an index, audit: reports '
+                                'the query plans, full scans, temporary b-trees and unindexed sorts of the repository '
+                                'queries, with the sizes and index coverage of the tables',
+                           metavar='ACTION')
+    db_parser.add_argument('--json', dest='db_json', action='store_true', default=False,
+                           help='Prints the audit as json (default: %(default)s)')
+    serve_parser = subparsers.add_parser('serve', help='Keeps running, answering clock, ttco, ehbal, stc, wdr and '
+                                                       'team from a local socket')
+    api_parser = subparsers.add_parser('api', help='Serves the time card services as an HTTP/JSON API')
+    api_parser.add_argument('--host', dest='api_host', type=str, default=None,
+                            help='Address to listen on (default: API_HOST or 127.0.0.1)')
+    api_parser.add_argument('--port', dest='api_port', type=int, default=None,
+                            help='Port to listen on (default: API_PORT or 8080)')
     auto_clock_out_parser = subparsers.add_parser('coreg',
                                                   help='Clocks out from work on regular shift time')
     auto_clock_out_early_parser = subparsers.add_parser('coearly',
                                                         help='Clocks out from work earlier, regular shift minus launch Ïtime')
 
     args = parser.parse_args(argv)
+    mark_startup_phase('arguments')
+    global profile_selector
+    profile_selector = args.profile
 
     if args.cmd is None:
         parser.print_help(sys.stdout)
     else:
         cmd = args.cmd.lower()
+        if cmd == 'serve':
+            from wtt import daemon
+            daemon.serve(run_daemon_command)
+            return
+        if cmd == 'api':
+            # requests are not frozen on a single instant like commands, so it starts before freeze_now
+            from wtt import api
+            api.serve(host=args.api_host or api.API_HOST, port=args.api_port or api.API_PORT)
+            return
+        if args.trace or args.trace_memory:
+            from wtt.utils import trace as trace_utils
+            trace_utils.start(cmd, memory=args.trace_memory)
+            try:
+                run_command(cmd, args)
+            finally:  # a failed command must not keep tracing the next ones of the daemon
+                trace_utils.stop()
+        else:
+            run_command(cmd, args)
 
-        if cmd not in ('wdr', 'addtc') and args.check_errors:
-            time_card_service.print_work_day_status_report_if_recent_error(get_current_profile())
-
-        if cmd == 'clock':
-            time_card_service.clock_in_out(get_current_profile())
-            if args.auto_ttco:
-                print('---')
-                time_card_service.print_today_report(get_current_profile(), from_auto_run=True, tabs=not args.no_tabs)
-        elif cmd == 'ttco':
-            time_card_service.print_today_report(get_current_profile(), tabs=not args.no_tabs)
-        elif cmd == 'ehbal':
-            time_card_service.print_extra_hours_balance_in_minutes(get_current_profile(), details=True)
-        elif cmd == 'stc':
-            if args.stc_date.lower() == 'today':
-                date = date_utils.get_now()
-            else:
-                date = date_utils.string_to_datetime(args.stc_date)
-            time_card_service.display_time_cards_of_a_day(get_current_profile(), date)
-        elif cmd == 'rmtc':
-            time_card_service.delete_time_card(get_current_profile(), args.rmtc_uuid)
-        elif cmd == 'addtc':
-            date = args.addtc_datetime
-            if type(args.addtc_datetime) is list:
-                date = ' '.join(args.addtc_datetime)
-            time_card_service.clock_in_out_manually(get_current_profile(), date)
-        elif cmd == 'addholi':
-            holiday_service.prompt_and_insert_holiday()
-        elif cmd == 'addabs':
-            absence_service.prompt_and_insert_absence(get_current_profile())
-        elif cmd == 'wdr':
-            time_card_service.print_work_day_status_report(get_current_profile(), args.wdr_filter)
-        elif cmd == 'coreg':
-            time_card_service.clock_out_automatically(get_current_profile())
-        elif cmd == 'coearly':
-            time_card_service.clock_out_automatically(get_current_profile(), clock_early=True)
-
-        if args.auto_ehbal and cmd != 'ehbal':
-            print('---')
-            time_card_service.print_extra_hours_balance_in_minutes(get_current_profile())
+    if args.startup_timing:
+        print_startup_timings()
 
 
 if __name__ == '__main__':
     try:
+        from wtt import daemon
+
+        exit_code = daemon.run_on_daemon(sys.argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
         main(sys.argv)
     except Exception as e:
         print(e, file=sys.stderr)
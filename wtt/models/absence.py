@@ -55,12 +55,21 @@ class Absence(object):
         params = []
         params.append(self.uuid)
         params.append(self.profile_uuid)
-        params.append(self.date)
+        params.append(date_utils.datetime_to_string(self.date, '%Y-%m-%d'))
         params.append(self.description)
         params.append(self.authorized)
         params = tuple(params)
         return params
 
+    def to_dict(self):
+        return {
+            'uuid': self.uuid,
+            'profile_uuid': self.profile_uuid,
+            'date': date_utils.datetime_to_string(self.date, '%Y-%m-%d'),
+            'description': self.description,
+            'authorized': self.authorized
+        }
+
     @staticmethod
     def GetFields():
         fields = ("uuid", "profile_uuid", "date", "description", "authorized")
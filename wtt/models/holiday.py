@@ -59,13 +59,23 @@ class Holiday(object):
         params = []
         params.append(self.uuid)
         params.append(self.description)
-        params.append(self.date)
+        params.append(date_utils.datetime_to_string(self.date, '%Y-%m-%d'))
         params.append(self.location)
         params.append(self.working_hours)
         params.append(self.repeats_every_year)
         params = tuple(params)
         return params
 
+    def to_dict(self):
+        return {
+            'uuid': self.uuid,
+            'description': self.description,
+            'date': date_utils.datetime_to_string(self.date, '%Y-%m-%d'),
+            'location': self.location,
+            'working_hours': self.working_hours,
+            'repeats_every_year': self.repeats_every_year
+        }
+
     @staticmethod
     def GetFields():
         fields = ("uuid", "description", "date", "location", "working_hours", "repeats_every_year")
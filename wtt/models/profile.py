@@ -166,3 +166,24 @@ class Profile(object):
         params.append(self.updated_at_utc)
         params = tuple(params)
         return params
+
+    def to_dict(self):
+        latest_working_hour = self.latest_working_hour
+        if latest_working_hour is not None and type(latest_working_hour) is not str:
+            latest_working_hour = date_utils.datetime_to_string(latest_working_hour, '%H:%M:%S')
+        return {
+            'uuid': self.uuid,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'company': self.company,
+            'working_location': self.working_location,
+            'start_date': date_utils.datetime_to_string(self.start_date, '%Y-%m-%d'),
+            'daily_office_hours': self.daily_office_hours,
+            'required_lunch_time': self.required_lunch_time,
+            'auto_insert_lunch_time': self.auto_insert_lunch_time,
+            'max_allowed_extra_hours': self.max_allowed_extra_hours,
+            'latest_working_hour': latest_working_hour,
+            'min_hours_between_working_days': self.min_hours_between_working_days,
+            'initial_extra_hours_balance': self.initial_extra_hours_balance,
+            'default_timezone': self.default_timezone
+        }
@@ -6,7 +6,9 @@ class TimeCard(object):
     def __init__(self, profile_uuid, insertion_method, uuid=None, event_timestamp_utc=None, gen_uuid=True):
         if uuid is None and gen_uuid:
             uuid = uuid_utils.random_uuid()
-        if type(event_timestamp_utc) is str:
+        if type(event_timestamp_utc) is int:
+            event_timestamp_utc = date_utils.epoch_to_utc_datetime(event_timestamp_utc)
+        elif type(event_timestamp_utc) is str:
             event_timestamp_utc = date_utils.iso_string_to_datetime(event_timestamp_utc)
 
         self.uuid = uuid
@@ -16,21 +18,25 @@ class TimeCard(object):
 
     @staticmethod
     def GetFields():
-        fields = ("uuid", "profile_uuid", "event_timestamp_utc", "insertion_method")
+        fields = ("uuid", "profile_uuid", "event_timestamp_utc", "insertion_method", "event_timestamp_epoch")
         return fields
 
     @staticmethod
     def FromDatabaseObj(database_obj):
         uuid = database_obj.get('uuid')
         profile_uuid = database_obj.get('profile_uuid')
-        event_timestamp_utc = database_obj.get('event_timestamp_utc')
+        event_timestamp_utc = database_obj.get('event_timestamp_epoch')
+        if event_timestamp_utc is None:  # rows that were not migrated yet only have the string column
+            event_timestamp_utc = database_obj.get('event_timestamp_utc')
         insertion_method = database_obj.get('insertion_method')
         time_card = TimeCard(uuid=uuid, profile_uuid=profile_uuid, event_timestamp_utc=event_timestamp_utc,
                              insertion_method=insertion_method)
-        try:
-            time_card.event_timestamp_utc = date_utils.convert_datetime_timezone(time_card.event_timestamp_utc, 'UTC')
-        except:
-            pass  # explicitly ignoring
+        if type(event_timestamp_utc) is str:
+            try:
+                time_card.event_timestamp_utc = date_utils.convert_datetime_timezone(time_card.event_timestamp_utc,
+                                                                                     'UTC')
+            except:
+                pass  # explicitly ignoring
         return time_card
 
     def to_database_params(self):
@@ -41,9 +47,22 @@ class TimeCard(object):
             self.event_timestamp_utc = date_utils.get_utc_now()
         params.append(self.event_timestamp_utc)
         params.append(self.insertion_method)
+        params.append(date_utils.datetime_to_epoch(self.event_timestamp_utc))
         params = tuple(params)
         return params
 
+    def to_dict(self):
+        return {
+            'uuid': self.uuid,
+            'profile_uuid': self.profile_uuid,
+            'insertion_method': self.insertion_method,
+            'event_timestamp_utc': self.event_timestamp_utc.isoformat(),
+            'event_timestamp_epoch': self.get_event_timestamp_epoch()
+        }
+
+    def get_event_timestamp_epoch(self):
+        return date_utils.datetime_to_epoch(self.event_timestamp_utc)
+
     def get_localized_timestamp(self):
         return date_utils.convert_datetime_timezone_to_local(self.event_timestamp_utc)
 
@@ -0,0 +1,28 @@
+from array import array
+
+
+class TimeCardBatch(object):
+    # columnar time cards of a single profile, sorted by timestamp, for computations that only need numbers
+    __slots__ = ('profile_uuid', 'epochs', 'day_numbers', 'uuids')
+
+    def __init__(self, profile_uuid, epochs=None, day_numbers=None, uuids=None):
+        self.profile_uuid = profile_uuid
+        self.epochs = array('q', epochs if epochs is not None else [])
+        self.day_numbers = array('q', day_numbers if day_numbers is not None else [])
+        self.uuids = uuids
+
+    def append(self, epoch, day_number, uuid=None):
+        self.epochs.append(epoch)
+        self.day_numbers.append(day_number)
+        if self.uuids is not None:
+            self.uuids.append(uuid)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __str__(self):
+        string = f'profile_uuid: {self.profile_uuid} | time cards: {len(self)}'
+        return string
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,115 @@
+import datetime
+import json
+
+from wtt.utils import date as date_utils
+
+
+class WorkCalendar(object):
+    # work days and holidays of a working location on a year, days are day numbers (days since 01/01/1970), the work
+    # days are a bitset indexed by the day of the year and the holidays map each day to (working hours, description)
+    __slots__ = ('location', 'year', 'weekend_days', 'first_day_number', 'last_day_number', 'work_days', 'holidays')
+
+    def __init__(self, location, year, weekend_days, work_days=None, holidays=None):
+        if type(weekend_days) is str:
+            weekend_days = tuple(int(el) for el in weekend_days.split(',') if el != '')
+
+        self.location = location
+        self.year = year
+        self.weekend_days = tuple(sorted(weekend_days))
+        self.first_day_number = date_utils.datetime_to_day_number(datetime.date(year, 1, 1))
+        self.last_day_number = date_utils.datetime_to_day_number(datetime.date(year, 12, 31))
+        if work_days is None:
+            work_days = WorkCalendar.GetWorkDaysBitset(self.first_day_number, self.last_day_number, self.weekend_days)
+        self.work_days = bytes(work_days)
+        self.holidays = holidays if holidays is not None else {}
+
+    @staticmethod
+    def GetWorkDaysBitset(first_day_number, last_day_number, weekend_days):
+        work_days = bytearray((last_day_number - first_day_number) // 8 + 1)
+        for day_number in range(first_day_number, last_day_number + 1):
+            if (day_number + 3) % 7 not in weekend_days:  # 01/01/1970 was a thursday, monday=0 | sunday = 6
+                index = day_number - first_day_number
+                work_days[index >> 3] |= 1 << (index & 7)
+        return work_days
+
+    @staticmethod
+    def FromHolidays(location, year, weekend_days, holidays):
+        # same matching rules as holiday_repo.get_date_holiday, the holiday with fewer working hours wins and yearly
+        # holidays win the ties
+        calendar = WorkCalendar(location, year, weekend_days)
+        for holiday in sorted(holidays, key=lambda x: (x.working_hours, not x.repeats_every_year)):
+            holiday_year, month, day = date_utils.datetime_to_date_key(holiday.date, to_utc=True)
+            if not holiday.repeats_every_year and holiday_year != year:
+                continue
+            try:
+                day_number = date_utils.datetime_to_day_number(datetime.date(year, month, day))
+            except ValueError:
+                continue  # 29th of February on a non leap year
+            calendar.holidays.setdefault(day_number, (holiday.working_hours, holiday.description))
+        return calendar
+
+    @staticmethod
+    def FromDatabaseObj(database_obj):
+        year = database_obj.get('year')
+        calendar = WorkCalendar(location=database_obj.get('location'), year=year,
+                                weekend_days=database_obj.get('weekend_days'), work_days=database_obj.get('work_days'))
+        calendar.holidays = {calendar.first_day_number + int(day): tuple(holiday)
+                             for day, holiday in json.loads(database_obj.get('holidays')).items()}
+        return calendar
+
+    @staticmethod
+    def GetFields():
+        fields = ("location", "year", "weekend_days", "work_days", "holidays")
+        return fields
+
+    @staticmethod
+    def WeekendDaysToString(weekend_days):
+        return ','.join(str(el) for el in sorted(weekend_days))
+
+    def to_database_params(self):
+        params = []
+        params.append(self.location)
+        params.append(self.year)
+        params.append(WorkCalendar.WeekendDaysToString(self.weekend_days))
+        params.append(self.work_days)
+        params.append(json.dumps({str(day_number - self.first_day_number): list(holiday)
+                                  for day_number, holiday in self.holidays.items()}))
+        params = tuple(params)
+        return params
+
+    def is_work_day(self, day_number):
+        # days of other years are never work days of this calendar
+        index = day_number - self.first_day_number
+        if index < 0 or day_number > self.last_day_number:
+            return False
+        return self.work_days[index >> 3] >> (index & 7) & 1 == 1
+
+    def get_work_day_numbers(self, first_day_number, last_day_number):
+        for day_number in range(max(first_day_number, self.first_day_number),
+                                min(last_day_number, self.last_day_number) + 1):
+            index = day_number - self.first_day_number
+            if self.work_days[index >> 3] >> (index & 7) & 1:
+                yield day_number
+
+    def get_holiday(self, day_number):
+        return self.holidays.get(day_number)
+
+    def to_dict(self):
+        return {
+            'location': self.location,
+            'year': self.year,
+            'weekend_days': list(self.weekend_days),
+            'work_days': [date_utils.datetime_to_string(date_utils.day_number_to_datetime(el), '%Y-%m-%d')
+                          for el in self.get_work_day_numbers(self.first_day_number, self.last_day_number)],
+            'holidays': {date_utils.datetime_to_string(date_utils.day_number_to_datetime(day_number), '%Y-%m-%d'):
+                         {'working_hours': working_hours, 'description': description}
+                         for day_number, (working_hours, description) in sorted(self.holidays.items())}
+        }
+
+    def __str__(self):
+        string = f'location: {self.location} | year: {self.year} | weekend days: {self.weekend_days} | ' \
+                 f'holidays: {len(self.holidays)}'
+        return string
+
+    def __repr__(self):
+        return self.__str__()
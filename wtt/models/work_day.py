@@ -0,0 +1,80 @@
+from wtt.utils import date as date_utils
+
+
+class WorkDay(object):
+    def __init__(self, profile_uuid, date, time_cards=0, worked_minutes=0, expected_minutes=0, balance_minutes=0,
+                 status_class='UNKNOWN', status_reason=None, status_info=None):
+        if type(date) is str:
+            date = date_utils.set_timezone_on_datetime(date_utils.iso_string_to_datetime(date), 'UTC')
+
+        self.profile_uuid = profile_uuid
+        self.date = date
+        self.time_cards = time_cards
+        self.worked_minutes = worked_minutes
+        self.expected_minutes = expected_minutes
+        self.balance_minutes = balance_minutes
+        self.status_class = status_class
+        self.status_reason = status_reason
+        self.status_info = status_info
+
+    @staticmethod
+    def FromDatabaseObj(database_obj):
+        profile_uuid = database_obj.get('profile_uuid')
+        date = database_obj.get('date')
+        time_cards = database_obj.get('time_cards')
+        worked_minutes = database_obj.get('worked_minutes')
+        expected_minutes = database_obj.get('expected_minutes')
+        balance_minutes = database_obj.get('balance_minutes')
+        status_class = database_obj.get('status_class')
+        status_reason = database_obj.get('status_reason')
+        status_info = database_obj.get('status_info')
+        work_day = WorkDay(profile_uuid=profile_uuid, date=date, time_cards=time_cards, worked_minutes=worked_minutes,
+                           expected_minutes=expected_minutes, balance_minutes=balance_minutes,
+                           status_class=status_class, status_reason=status_reason, status_info=status_info)
+        return work_day
+
+    @staticmethod
+    def GetFields():
+        fields = ("profile_uuid", "date", "time_cards", "worked_minutes", "expected_minutes", "balance_minutes",
+                  "status_class", "status_reason", "status_info")
+        return fields
+
+    def to_database_params(self):
+        params = []
+        params.append(self.profile_uuid)
+        params.append(date_utils.datetime_to_string(self.date, '%Y-%m-%d'))
+        params.append(self.time_cards)
+        params.append(self.worked_minutes)
+        params.append(self.expected_minutes)
+        params.append(self.balance_minutes)
+        params.append(self.status_class)
+        params.append(self.status_reason)
+        params.append(self.status_info)
+        params = tuple(params)
+        return params
+
+    def get_status(self):
+        status = {'class': self.status_class}
+        if self.status_reason is not None:
+            status['reason'] = self.status_reason
+        if self.status_info is not None:
+            status['info'] = self.status_info
+        return status
+
+    def to_dict(self):
+        return {
+            'date': date_utils.datetime_to_string(self.date, '%Y-%m-%d'),
+            'time_cards': self.time_cards,
+            'worked_minutes': self.worked_minutes,
+            'expected_minutes': self.expected_minutes,
+            'balance_minutes': self.balance_minutes,
+            'status': self.get_status()
+        }
+
+    def __str__(self):
+        date = date_utils.datetime_to_string(self.date, '%d/%m/%Y')
+        string = f'date: {date} | profile_uuid: {self.profile_uuid} | balance: {self.balance_minutes} | status: {self.status_class}'
+        return string
+
+    def __repr__(self):
+        return self.__str__()
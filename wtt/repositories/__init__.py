@@ -1,10 +1,14 @@
+import atexit
 import errno
 import json
 import os
+import random
 import sqlite3
-from pathlib import Path
+import threading
+import time
+from contextlib import contextmanager
 
-wtt_dir = os.path.join(str(Path.home()), ".wtt")
+wtt_dir = os.path.join(os.path.expanduser('~'), ".wtt")
 if not os.path.exists(wtt_dir):
     try:
         os.makedirs(wtt_dir)
@@ -14,6 +18,11 @@ if not os.path.exists(wtt_dir):
 
 SETTINGS_PATH = os.getenv('SETTINGS_FILE', os.path.join(wtt_dir, 'settings.json'))
 DATABASE_PATH = None
+CURRENT_PROFILE = os.getenv('CURRENT_PROFILE')  # uuid or name of the profile used when there are many
+# days of the week without work, monday=0 | sunday = 6, settings.json may override them by working location with
+# "weekend_days": {"location": [4, 5]}
+WEEKEND_DAYS = tuple(int(el) for el in os.getenv('WEEKEND_DAYS', '5,6').split(',') if el.strip() != '')
+LOCATION_WEEKEND_DAYS = {}
 
 if os.path.exists(SETTINGS_PATH):
     try:
@@ -23,6 +32,10 @@ if os.path.exists(SETTINGS_PATH):
                 DATABASE_PATH = settings['database_path']
             if 'database_file' in settings and DATABASE_PATH is None:
                 DATABASE_PATH = os.path.join(wtt_dir, settings['database_file'])
+            if 'current_profile' in settings and CURRENT_PROFILE is None:
+                CURRENT_PROFILE = settings['current_profile']
+            if 'weekend_days' in settings:
+                LOCATION_WEEKEND_DAYS = {location: tuple(days) for location, days in settings['weekend_days'].items()}
     except:
         pass
 
@@ -30,6 +43,23 @@ if DATABASE_PATH is None:
     DATABASE_PATH = os.getenv('DATABASE_FILE', os.path.join(wtt_dir, 'wtt_records.db'))
 
 
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))),
+    ('cache_size', -16000),  # negative values are in KiB
+    ('mmap_size', 256 * 1024 * 1024),
+)
+# write transactions that still find the database locked after the busy timeout are retried this many times, waiting
+# twice as long, with jitter, after each attempt
+WRITE_RETRIES = int(os.getenv('SQLITE_WRITE_RETRIES', '5'))
+WRITE_RETRY_BACKOFF_MS = int(os.getenv('SQLITE_WRITE_RETRY_BACKOFF_MS', '50'))
+
+session = threading.local()
+database_lock = threading.Lock()
+database_checked = False
+
+
 def dict_factory(cursor, row):
     d = {}
     for idx, col in enumerate(cursor.description):
@@ -37,15 +67,168 @@ def dict_factory(cursor, row):
     return d
 
 
-def get_db_conn():
-    conn = sqlite3.connect(DATABASE_PATH)
+def apply_pragmas(conn, read_only=False):
+    for pragma, value in SQLITE_PRAGMAS:
+        if not read_only or pragma != 'journal_mode':  # changing the journal mode needs write access
+            conn.execute(f'PRAGMA {pragma} = {value};')
+
+
+def get_db_conn(path=None):
+    # isolation_level=None disables the implicit transactions of the sqlite3 module, reads run without any commit
+    # and writes are grouped with transaction()
+    conn = sqlite3.connect(path or DATABASE_PATH, isolation_level=None)
+    conn.row_factory = dict_factory
+    apply_pragmas(conn)
+    return conn
+
+
+def get_session_conn():
+    # one connection per thread, reopened after a fork, since sqlite connections must not cross processes
+    conn = getattr(session, 'conn', None)
+    if conn is None or session.pid != os.getpid():
+        conn = get_db_conn()
+        session.conn = conn
+        session.pid = os.getpid()
+        session.read_only = False
+        session.archives = {}
+        ensure_database()
+    return conn
+
+
+def open_read_only_session():
+    # for worker processes that only read, the schema is left to the process that started them
+    global database_checked
+    conn = sqlite3.connect(f'file:{DATABASE_PATH}?mode=ro', uri=True, isolation_level=None)
     conn.row_factory = dict_factory
+    conn.execute('PRAGMA query_only = 1;')
+    apply_pragmas(conn, read_only=True)
+    session.conn = conn
+    session.pid = os.getpid()
+    session.read_only = True
+    session.archives = {}
+    database_checked = True
+    return conn
+
+
+def is_read_only_session():
+    get_session_conn()
+    return session.read_only
+
+
+def ensure_database():
+    # the schema is checked on the first connection of the process, not on import
+    global database_checked
+    with database_lock:
+        if not database_checked:
+            database_checked = True
+            build_database()
+
+
+def get_archive_conn(path):
+    # read-only connections to the archive files, opened by the first read that reaches them and kept for the session,
+    # they are not attached to the session connection because sqlite refuses ATTACH inside a transaction
+    get_session_conn()
+    conn = session.archives.get(path)
+    if conn is None:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, isolation_level=None)
+        conn.row_factory = dict_factory
+        conn.execute('PRAGMA query_only = 1;')
+        apply_pragmas(conn, read_only=True)
+        session.archives[path] = conn
     return conn
 
 
+def close_session():
+    conn = getattr(session, 'conn', None)
+    if conn is not None and session.pid == os.getpid():
+        conn.close()
+        for archive_conn in session.archives.values():
+            archive_conn.close()
+    session.conn = None
+
+
+@contextmanager
+def transaction(immediate=False):
+    conn = get_session_conn()
+    if conn.in_transaction:  # nested calls join the outer transaction
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE;' if immediate else 'BEGIN;')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def is_busy_error(error):
+    # sqlite3 only exposes the error codes from python 3.11 on
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_in_write_transaction(function, *args, **kwargs):
+    # runs function on its own BEGIN IMMEDIATE transaction, so whatever it reads can not change before it writes, and
+    # runs it again from the start while another writer keeps the database locked, calls inside an outer transaction
+    # just join it, since only the outermost one can be retried
+    if get_session_conn().in_transaction:
+        return function(*args, **kwargs)
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            with transaction(immediate=True):
+                return function(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if attempt >= WRITE_RETRIES or not is_busy_error(e):
+                raise e
+        time.sleep(WRITE_RETRY_BACKOFF_MS * 2 ** attempt * random.uniform(0.5, 1.5) / 1000)
+
+
+def get_data_version():
+    # changes whenever another connection commits to the database, the commits of the session connection do not count
+    return execute_query('PRAGMA data_version;', fetch=True)[0]['data_version']
+
+
 def execute_query(query, params=None, fetch=False):
-    conn = get_db_conn()
-    return execute_query_with_conn(conn, query, params=params, fetch=fetch, close_conn=True)
+    conn = get_session_conn()
+    return execute_query_with_conn(conn, query, params=params, fetch=fetch, close_conn=False)
+
+
+def execute_many(query, params_iterable):
+    # params_iterable is consumed as the statement runs, so it can be a generator
+    cur = get_session_conn().cursor()
+    cur.executemany(query, params_iterable)
+    cur.close()
+
+
+def iterate_query_rows(query, params=None):
+    # plain tuples straight from the cursor, without building a dict for every row
+    if params is None:
+        params = tuple([])
+    cur = get_session_conn().cursor()
+    cur.row_factory = None
+    return cur.execute(query, params)
+
+
+def iterate_query_batches(query, params=None, batch_size=1000):
+    # lists of plain tuples read with fetchmany, only one batch of the result is in memory at a time
+    if params is None:
+        params = tuple([])
+    cur = get_session_conn().cursor()
+    cur.row_factory = None
+    try:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            yield rows
+    finally:
+        cur.close()
 
 
 def execute_query_with_conn(conn, query, params=None, fetch=False, close_conn=True):
@@ -57,7 +240,6 @@ def execute_query_with_conn(conn, query, params=None, fetch=False, close_conn=Tr
         results = cur.execute(query, params).fetchall()
     else:
         cur.execute(query, params)
-    conn.commit()
     cur.close()
     if close_conn:
         conn.close()
@@ -66,7 +248,10 @@ def execute_query_with_conn(conn, query, params=None, fetch=False, close_conn=Tr
 
 
 def build_database():
-    conn = get_db_conn()
+    from wtt.repositories import migrations  # imported here, the module depends on this one
+    if migrations.get_schema_version(get_session_conn()) >= migrations.SCHEMA_VERSION:
+        return  # up to date, the tables were created before the first migration ran
+
     # DEFAULT DATETIME('now', 'UTC') does not work on DEFAULT
     create_profile_table = """
         CREATE TABLE IF NOT EXISTS profiles(
@@ -118,10 +303,37 @@ def build_database():
                     "authorized" BOOL NOT NULL DEFAULT False
                 );
                 """
-    execute_query_with_conn(conn, create_profile_table, close_conn=False)
-    execute_query_with_conn(conn, create_holidays_table, close_conn=False)
-    execute_query_with_conn(conn, create_time_cards_table, close_conn=False)
-    execute_query_with_conn(conn, create_absences_table, close_conn=True)
+
+    create_work_days_table = """
+                CREATE TABLE IF NOT EXISTS work_days(
+                    "profile_uuid" UUID NOT NULL,
+                    "date" DATE NOT NULL,
+                    "time_cards" INT NOT NULL DEFAULT 0,
+                    "worked_minutes" INT NOT NULL DEFAULT 0,
+                    "expected_minutes" INT NOT NULL DEFAULT 0,
+                    "balance_minutes" INT NOT NULL DEFAULT 0,
+                    "status_class" VARCHAR(10) NOT NULL DEFAULT 'UNKNOWN',
+                    "status_reason" VARCHAR(300) NULL,
+                    "status_info" VARCHAR(300) NULL,
+                    PRIMARY KEY ("profile_uuid", "date")
+                );
+                """
+
+    create_work_days_state_table = """
+                CREATE TABLE IF NOT EXISTS work_days_state(
+                    "profile_uuid" UUID PRIMARY KEY,
+                    "computed_until" DATE NOT NULL
+                );
+                """
+    with transaction() as conn:
+        execute_query_with_conn(conn, create_profile_table, close_conn=False)
+        execute_query_with_conn(conn, create_holidays_table, close_conn=False)
+        execute_query_with_conn(conn, create_time_cards_table, close_conn=False)
+        execute_query_with_conn(conn, create_absences_table, close_conn=False)
+        execute_query_with_conn(conn, create_work_days_table, close_conn=False)
+        execute_query_with_conn(conn, create_work_days_state_table, close_conn=False)
+
+    migrations.migrate_database()
 
 
-build_database()
+atexit.register(close_session)
@@ -2,34 +2,39 @@ from wtt.models.absence import Absence
 from wtt.repositories import execute_query
 from wtt.utils import date as date_utils
 
+ALL_ABSENCES_QUERY = """
+        SELECT * FROM absences ORDER BY "date";
+    """
+PROFILE_ABSENCES_QUERY = """
+        SELECT * FROM absences
+        WHERE profile_uuid = ?
+        ORDER BY "date";
+    """
+ABSENCE_ON_DATE_QUERY = """
+        SELECT * FROM absences
+        WHERE profile_uuid = ? AND "date" = ?;
+    """
+AUTHORIZED_ABSENCE_ON_DATE_QUERY = """
+        SELECT * FROM absences
+        WHERE profile_uuid = ? AND "date" = ? AND authorized = True;
+    """
+
 
 def get_all_absences():
-    query = """
-            SELECT * FROM absences ORDER BY "date";
-        """
-    results = execute_query(query, fetch=True)
+    results = execute_query(ALL_ABSENCES_QUERY, fetch=True)
     results = [Absence.FromDatabaseObj(el) for el in results]
     return results
 
 
 def get_profile_absences(profile):
-    query = """
-            SELECT * FROM absences
-            WHERE profile_uuid = ?
-            ORDER BY "date";
-        """
-    results = execute_query(query, params=(profile.uuid,), fetch=True)
+    results = execute_query(PROFILE_ABSENCES_QUERY, params=(profile.uuid,), fetch=True)
     results = [Absence.FromDatabaseObj(el) for el in results]
     return results
 
 
 def get_absence_on_date(profile, date):
-    query = """
-            SELECT * FROM absences
-            WHERE profile_uuid = ? AND strftime('%d/%m/%Y',"date") = ?;
-        """
-    params = (profile.uuid, date_utils.datetime_to_string(date, '%d/%m/%Y'))
-    results = execute_query(query, params=params, fetch=True)
+    params = (profile.uuid, date_utils.datetime_to_string(date, '%Y-%m-%d'))
+    results = execute_query(ABSENCE_ON_DATE_QUERY, params=params, fetch=True)
     if len(results) > 0:
         abs = Absence.FromDatabaseObj(results[0])
     else:
@@ -38,27 +43,57 @@ def get_absence_on_date(profile, date):
 
 
 def has_absence_on_date(profile, date):
-    query = """
-            SELECT * FROM absences
-            WHERE profile_uuid = ? AND strftime('%d/%m/%Y',"date") = ?;
-        """
-    params = (profile.uuid, date_utils.datetime_to_string(date, '%d/%m/%Y'))
-    results = execute_query(query, params=params, fetch=True)
+    params = (profile.uuid, date_utils.datetime_to_string(date, '%Y-%m-%d'))
+    results = execute_query(ABSENCE_ON_DATE_QUERY, params=params, fetch=True)
     result = len(results) > 0
     return result
 
 
 def has_authorized_absence_on_date(profile, date):
-    query = """
-            SELECT * FROM absences
-            WHERE profile_uuid = ? AND strftime('%d/%m/%Y',"date") = ? AND authorized = True;
-        """
-    params = (profile.uuid, date_utils.datetime_to_string(date, '%d/%m/%Y'))
-    results = execute_query(query, params=params, fetch=True)
+    params = (profile.uuid, date_utils.datetime_to_string(date, '%Y-%m-%d'))
+    results = execute_query(AUTHORIZED_ABSENCE_ON_DATE_QUERY, params=params, fetch=True)
     result = len(results) > 0
     return result
 
 
+def add_absence_to_index(absences_index, absence):
+    date_key = date_utils.datetime_to_date_key(absence.date, to_utc=True)
+    if date_key not in absences_index:
+        absences_index[date_key] = []
+    absences_index[date_key].append(absence)
+
+
+def get_profile_absences_index(profile):
+    absences_index = {}
+    for absence in get_profile_absences(profile):
+        add_absence_to_index(absences_index, absence)
+    return absences_index
+
+
+def get_absences_indexes():
+    # indexes of every profile, keyed by the profile uuid, from a single query
+    absences_indexes = {}
+    for absence in get_all_absences():
+        add_absence_to_index(absences_indexes.setdefault(absence.profile_uuid, {}), absence)
+    return absences_indexes
+
+
+def get_absence_on_date_from_index(absences_index, date):
+    absences = absences_index.get(date_utils.datetime_to_date_key(date), [])
+    if len(absences) > 0:
+        return absences[0]
+    return None
+
+
+def has_absence_on_date_from_index(absences_index, date):
+    return date_utils.datetime_to_date_key(date) in absences_index
+
+
+def has_authorized_absence_on_date_from_index(absences_index, date):
+    absences = absences_index.get(date_utils.datetime_to_date_key(date), [])
+    return any(el.authorized for el in absences)
+
+
 def create_absence(absence):
     params = absence.to_database_params()
     fields = '(' + ', '.join([f'"{el}"' for el in Absence.GetFields()]) + ')'
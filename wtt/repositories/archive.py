@@ -0,0 +1,256 @@
+import heapq
+import os
+
+from wtt import repositories
+from wtt.models.time_card import TimeCard
+from wtt.repositories import execute_query, execute_query_with_conn, get_archive_conn, get_db_conn, get_session_conn
+from wtt.repositories import transaction
+
+# closed years of time cards can be moved to one sqlite file per year, registered on time_cards_archives with the
+# epochs they cover, reads only open the files their range reaches, the cards of the hot database are always read too,
+# since cards of archived years can still be added to it, and the ones also found on an archive are left out, since
+# archiving a year again copies its new cards before deleting them from the hot database
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS archive.time_cards(
+        "uuid" UUID PRIMARY KEY,
+        "profile_uuid" UUID NOT NULL,
+        "event_timestamp_utc" DATETIME NOT NULL,
+        "insertion_method" VARCHAR(30) DEFAULT 'manual',
+        "event_timestamp_epoch" INT NULL
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS archive.time_cards_profile_epoch_idx
+        ON time_cards("profile_uuid", "event_timestamp_epoch");
+    """,
+    # the closed work days of the ledger on the year, as they were when the year was archived
+    """
+    CREATE TABLE IF NOT EXISTS archive.yearly_totals(
+        "profile_uuid" UUID PRIMARY KEY,
+        "year" INT NOT NULL,
+        "time_cards" INT NOT NULL DEFAULT 0,
+        "work_days" INT NOT NULL DEFAULT 0,
+        "worked_minutes" INT NOT NULL DEFAULT 0,
+        "expected_minutes" INT NOT NULL DEFAULT 0,
+        "balance_minutes" INT NOT NULL DEFAULT 0
+    );
+    """,
+)
+MERGE_BATCH_SIZE = 1000
+# archives that hold cards between the epochs, both inclusive, sorted by year
+ARCHIVES_QUERY = """
+        SELECT * FROM time_cards_archives
+        WHERE first_epoch <= ? AND end_epoch > ?
+        ORDER BY "year";
+    """
+
+
+def get_archive_dir():
+    return os.path.splitext(os.path.abspath(repositories.DATABASE_PATH))[0] + '_archive'
+
+
+def get_archive_path(archive):
+    # registered paths are relative to the directory of the database, so both can be moved together
+    return os.path.join(os.path.dirname(os.path.abspath(repositories.DATABASE_PATH)), archive['path'])
+
+
+def get_archives(start_epoch=None, end_epoch=None):
+    if start_epoch is None:
+        start_epoch = -2 ** 63
+    if end_epoch is None:
+        end_epoch = 2 ** 63 - 1
+    return execute_query(ARCHIVES_QUERY, params=(end_epoch, start_epoch), fetch=True)
+
+
+def fetch_from_archives(archives, query, params):
+    results = []
+    for archive in archives:
+        results += execute_query_with_conn(get_archive_conn(get_archive_path(archive)), query, params=params,
+                                           fetch=True, close_conn=False)
+    return results
+
+
+def iterate_archives_rows(archives, query, params):
+    # one cursor of plain tuples for each archive, like iterate_query_rows
+    cursors = []
+    for archive in archives:
+        cur = get_archive_conn(get_archive_path(archive)).cursor()
+        cur.row_factory = None
+        cursors.append(cur.execute(query, params))
+    return cursors
+
+
+def merge_rows(sources, key):
+    # each source is sorted by key, and so is the result, the last source is the hot database, its rows equal to an
+    # archived row of the same key are left out
+    if key is None:
+        key = identity
+    archived_rows = heapq.merge(*sources[:-1], key=key)
+    archived_row = next(archived_rows, None)
+    archived_key = None if archived_row is None else key(archived_row)
+    seen_key, seen = None, set()
+    for row in sources[-1]:
+        row_key = key(row)
+        while archived_row is not None and archived_key <= row_key:
+            if archived_key != seen_key:
+                seen_key, seen = archived_key, set()
+            seen.add(archived_row)
+            yield archived_row
+            archived_row = next(archived_rows, None)
+            archived_key = None if archived_row is None else key(archived_row)
+        if row_key == seen_key and row in seen:
+            continue
+        yield row
+    if archived_row is not None:
+        yield archived_row
+        yield from archived_rows
+
+
+def identity(row):
+    return row
+
+
+def exclude_archived(results, archived_results):
+    # fetched rows of the hot database whose card was also fetched from an archive are left out
+    archived_uuids = set(el['uuid'] for el in archived_results)
+    return [el for el in results if el['uuid'] not in archived_uuids]
+
+
+def merge_batches(sources, key, batch_size=MERGE_BATCH_SIZE):
+    # lists of rows, like the ones of iterate_query_batches, from sources of rows sorted by key
+    rows = merge_rows(sources, key)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def get_archived_time_card(profile, card_uuid):
+    query = """
+            SELECT * FROM time_cards
+            WHERE profile_uuid = ? AND uuid = ?;
+        """
+    for archive in reversed(get_archives()):
+        results = fetch_from_archives([archive], query, (profile.uuid, card_uuid))
+        if len(results) > 0:
+            return TimeCard.FromDatabaseObj(results[0])
+    return None
+
+
+def delete_archived_time_card(profile, card_uuid):
+    # the day is marked as dirty before the card leaves the archive, an interruption in between only recomputes it
+    query = """
+            SELECT event_timestamp_epoch FROM time_cards
+            WHERE profile_uuid = ? AND uuid = ?;
+        """
+    for archive in reversed(get_archives()):
+        results = fetch_from_archives([archive], query, (profile.uuid, card_uuid))
+        if len(results) == 0:
+            continue
+        query_dirty = """
+                INSERT INTO work_days_dirty ("profile_uuid", "event_timestamp_epoch") VALUES (?, ?);
+            """
+        execute_query(query_dirty, params=(profile.uuid, results[0]['event_timestamp_epoch']))
+        query_delete = """
+                DELETE FROM time_cards
+                WHERE profile_uuid = ? AND uuid = ?;
+            """
+        # the archive connections of the session are read-only, this one gets the pragmas of the session connection
+        conn = get_db_conn(get_archive_path(archive))
+        try:
+            execute_query_with_conn(conn, query_delete, params=(profile.uuid, card_uuid), close_conn=False)
+        finally:
+            conn.close()
+        return True
+    return False
+
+
+def get_archived_epochs(profile, start_epoch, end_epoch):
+    query = """
+            SELECT event_timestamp_epoch FROM time_cards
+            WHERE profile_uuid = ? AND event_timestamp_epoch >= ? AND event_timestamp_epoch <= ?;
+        """
+    archives = get_archives(start_epoch, end_epoch)
+    return [el[0] for cur in iterate_archives_rows(archives, query, (profile.uuid, start_epoch, end_epoch))
+            for el in cur]
+
+
+def archive_time_cards(year, first_epoch, end_epoch):
+    # moves the cards between the epochs, end_epoch exclusive, to the file of the year, returns how many were moved,
+    # the copy and the deletion are separate transactions, since transactions over attached WAL databases are not
+    # atomic, an interruption in between leaves the cards on both files and running it again finishes the job, reads
+    # in between see them on both too, and count them once, see merge_rows
+    directory = get_archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{year}.db')
+    relative_path = os.path.relpath(path, os.path.dirname(os.path.abspath(repositories.DATABASE_PATH)))
+    fields = ', '.join([f'"{el}"' for el in TimeCard.GetFields()])
+    conn = get_session_conn()
+    execute_query_with_conn(conn, 'ATTACH DATABASE ? AS archive;', params=(path,), close_conn=False)
+    try:
+        with transaction(immediate=True):
+            for statement in ARCHIVE_SCHEMA:
+                execute_query_with_conn(conn, statement, close_conn=False)
+            query_copy = f"""
+                    INSERT OR IGNORE INTO archive.time_cards ({fields})
+                    SELECT {fields} FROM main.time_cards
+                    WHERE event_timestamp_epoch >= ? AND event_timestamp_epoch < ?
+                    ORDER BY profile_uuid, event_timestamp_epoch;
+                """
+            execute_query_with_conn(conn, query_copy, params=(first_epoch, end_epoch), close_conn=False)
+            query_totals = """
+                    INSERT OR REPLACE INTO archive.yearly_totals
+                        ("profile_uuid", "year", "time_cards", "work_days", "worked_minutes", "expected_minutes",
+                         "balance_minutes")
+                    SELECT w.profile_uuid, ?,
+                        (SELECT count(*) FROM archive.time_cards c WHERE c.profile_uuid = w.profile_uuid),
+                        count(*), SUM(w.worked_minutes), SUM(w.expected_minutes), SUM(w.balance_minutes)
+                    FROM main.work_days w
+                    WHERE w."date" >= ? AND w."date" <= ?
+                    GROUP BY w.profile_uuid;
+                """
+            execute_query_with_conn(conn, query_totals, params=(year, f'{year:04d}-01-01', f'{year:04d}-12-31'),
+                                    close_conn=False)
+        with transaction(immediate=True):
+            # the delete triggers mark every archived day as dirty, but moving a card does not change its day
+            last_dirty_rowid = execute_query_with_conn(conn, """
+                    SELECT COALESCE(MAX(rowid), 0) AS last_rowid FROM work_days_dirty;
+                """, fetch=True, close_conn=False)[0]['last_rowid']
+            query_delete = """
+                    DELETE FROM main.time_cards
+                    WHERE event_timestamp_epoch >= ? AND event_timestamp_epoch < ?
+                        AND uuid IN (SELECT uuid FROM archive.time_cards);
+                """
+            execute_query_with_conn(conn, query_delete, params=(first_epoch, end_epoch), close_conn=False)
+            moved = execute_query_with_conn(conn, 'SELECT changes() AS moved;', fetch=True,
+                                            close_conn=False)[0]['moved']
+            execute_query_with_conn(conn, 'DELETE FROM work_days_dirty WHERE rowid > ?;', params=(last_dirty_rowid,),
+                                    close_conn=False)
+            query_register = """
+                    INSERT OR REPLACE INTO time_cards_archives
+                        ("year", "path", "first_epoch", "end_epoch", "time_cards")
+                    VALUES
+                        (?, ?, ?, ?, (SELECT count(*) FROM archive.time_cards));
+                """
+            execute_query_with_conn(conn, query_register, params=(year, relative_path, first_epoch, end_epoch),
+                                    close_conn=False)
+    finally:
+        execute_query_with_conn(conn, 'DETACH DATABASE archive;', close_conn=False)
+    return moved
+
+
+def get_yearly_totals(archive):
+    query = """
+            SELECT * FROM yearly_totals ORDER BY profile_uuid;
+        """
+    return fetch_from_archives([archive], query, ())
+
+
+def vacuum():
+    # gives the pages of the archived cards back to the file system
+    execute_query_with_conn(get_session_conn(), 'VACUUM;', close_conn=False)
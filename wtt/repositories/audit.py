@@ -0,0 +1,118 @@
+import re
+import sqlite3
+
+from wtt.repositories import execute_query, get_session_conn
+from wtt.repositories import migrations
+
+# plan details that make a query slower than its index allows, the first matching prefix names the finding
+PLAN_FINDINGS = (
+    ('USE TEMP B-TREE FOR ORDER BY', 'unindexed sort'),
+    ('USE TEMP B-TREE FOR RIGHT PART OF ORDER BY', 'partially indexed sort'),
+    ('USE TEMP B-TREE FOR LAST TERM OF ORDER BY', 'partially indexed sort'),
+    ('USE TEMP B-TREE FOR ', 'temp b-tree'),  # GROUP BY and DISTINCT
+)
+USED_INDEX_PATTERN = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+PLAN_TABLE_PATTERN = re.compile(r'^(?:SCAN|SEARCH) (\S+)')
+
+
+def get_plan_findings(plan, scan_expected=False, scanned_tables=()):
+    # a full scan is only a finding for queries that must be served by an index, walking a whole index in order is not
+    findings = []
+    for detail in plan:
+        if detail.startswith('SCAN '):
+            if not scan_expected and migrations.is_full_scan(detail, scanned_tables):
+                findings.append(('full scan', detail))
+            continue
+        if 'AUTOMATIC' in detail and 'INDEX' in detail:
+            findings.append(('automatic index', detail))  # built from scratch on every run of the query
+            continue
+        for prefix, finding in PLAN_FINDINGS:
+            if detail.startswith(prefix):
+                findings.append((finding, detail))
+                break
+    return findings
+
+
+def audit_query_plans():
+    # the plan of every registered repository query on the live database, with its findings
+    audited = []
+    checks = ((migrations.get_query_plan_checks(), False), (migrations.get_scanning_query_plans(), True))
+    for queries, scan_expected in checks:
+        for name, query, params in queries:
+            plan = migrations.explain_query_plan(query, params)
+            scanned_tables = migrations.SCANNED_TABLES.get(name, ())
+            audited.append({
+                'name': name,
+                'query': re.sub(r'\s+', ' ', query).strip(),
+                'plan': plan,
+                'scan_expected': scan_expected,
+                'scanned_tables': list(scanned_tables),
+                'tables': sorted(set(el.group(1) for el in map(PLAN_TABLE_PATTERN.match, plan) if el is not None)),
+                'indexes': sorted(set(index for el in plan for index in USED_INDEX_PATTERN.findall(el))),
+                'findings': [{'finding': finding, 'detail': detail}
+                             for finding, detail in get_plan_findings(plan, scan_expected, scanned_tables)],
+            })
+    return audited
+
+
+def get_objects_sizes():
+    # bytes used by each table and index, None when sqlite was built without the dbstat table
+    try:
+        results = execute_query('SELECT name, pgsize FROM dbstat WHERE aggregate = TRUE;', fetch=True)
+    except sqlite3.OperationalError:
+        return None
+    return {el['name']: el['pgsize'] for el in results}
+
+
+def get_table_indexes(table):
+    indexes = []
+    for el in execute_query('SELECT * FROM pragma_index_list(?) ORDER BY name;', params=(table,), fetch=True):
+        columns = execute_query('SELECT name FROM pragma_index_info(?) ORDER BY seqno;', params=(el['name'],),
+                                fetch=True)
+        indexes.append({'name': el['name'], 'columns': [column['name'] for column in columns],
+                        'unique': bool(el['unique']), 'origin': el['origin'], 'partial': bool(el['partial'])})
+    return indexes
+
+
+def audit_tables(audited_queries):
+    # rows, size and indexes of each table, with the registered queries that read it and the ones using each index
+    sizes = get_objects_sizes()
+    tables = []
+    query = """
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+            ORDER BY name;
+        """
+    for el in execute_query(query, fetch=True):
+        name = el['name']
+        # the name comes from sqlite_master, identifiers can not be parameters
+        rows = execute_query(f'SELECT count(*) AS amount FROM "{name}";', fetch=True)[0]['amount']
+        queries = [audited for audited in audited_queries if name in audited['tables']]
+        indexes = get_table_indexes(name)
+        for index in indexes:
+            index['bytes'] = None if sizes is None else sizes.get(index['name'], 0)
+            index['used_by'] = [audited['name'] for audited in queries if index['name'] in audited['indexes']]
+        tables.append({
+            'name': name,
+            'rows': rows,
+            'bytes': None if sizes is None else sizes.get(name, 0),
+            'queries': [audited['name'] for audited in queries],
+            'indexed_queries': [audited['name'] for audited in queries
+                                if not any(migrations.is_full_scan(detail, audited['scanned_tables'])
+                                           for detail in audited['plan'])],
+            'indexes': indexes,
+        })
+    return tables
+
+
+def audit_database():
+    # query plans, table sizes and index coverage of the live database, as plain dicts and lists
+    queries = audit_query_plans()
+    has_statistics = len(execute_query("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1';",
+                                       fetch=True)) > 0
+    return {
+        'schema_version': migrations.get_schema_version(get_session_conn()),
+        'has_statistics': has_statistics,
+        'queries': queries,
+        'tables': audit_tables(queries),
+    }
@@ -2,54 +2,47 @@ from wtt.models.holiday import Holiday
 from wtt.repositories import execute_query
 from wtt.utils import date as date_utils
 
+ALL_HOLIDAYS_QUERY = """
+        SELECT * FROM holidays ORDER BY "date";
+    """
+LOCATION_HOLIDAYS_QUERY = """
+        SELECT * FROM holidays
+        WHERE "location" = ?
+        ORDER BY "date";
+    """
+# a holiday that does not repeat also matches the month and day, so the index on them serves both cases, the few
+# holidays of a date are sorted by get_date_holiday
+DATE_HOLIDAY_QUERY = """
+        SELECT * FROM holidays
+        WHERE "location" = ? AND "month" = ? AND "day" = ? AND (repeats_every_year OR "date" = ?);
+    """
+
 
 def get_all_holidays():
-    query = """
-            SELECT * FROM holidays ORDER BY "date";
-        """
-    results = execute_query(query, fetch=True)
+    results = execute_query(ALL_HOLIDAYS_QUERY, fetch=True)
     results = [Holiday.FromDatabaseObj(el) for el in results]
     return results
 
 
-def get_profile_holidays(profile):
-    query = """
-            SELECT * FROM holidays
-            WHERE "location" = ?
-            ORDER BY "date";
-        """
-    results = execute_query(query, params=(profile.working_location,), fetch=True)
+def get_location_holidays(location):
+    results = execute_query(LOCATION_HOLIDAYS_QUERY, params=(location,), fetch=True)
     results = [Holiday.FromDatabaseObj(el) for el in results]
     return results
 
 
+def get_profile_holidays(profile):
+    return get_location_holidays(profile.working_location)
+
+
 def has_holiday_on_date(profile, date):
-    query = """
-            SELECT * FROM holidays
-            WHERE "location" = ? AND 
-                ((repeats_every_year AND strftime('%d', "date") = ? AND strftime('%m', "date") = ?) OR 
-                    (NOT repeats_every_year AND "date" = ?))
-        """
-    params = (profile.working_location, date.day, date.month, date)
-    results = execute_query(query, params=params, fetch=True)
-    result = len(results) > 0
-    return result
+    return get_date_holiday(profile, date) is not None
 
 
 def get_date_holiday(profile, date):
-    query = """
-            SELECT * FROM holidays
-            WHERE "location" = ? AND 
-                ((repeats_every_year AND strftime('%d', "date") = ? AND strftime('%m', "date") = ?) OR 
-                    (NOT repeats_every_year AND strftime('%d/%m/%Y',"date") = ?))
-            ORDER BY "working_hours";
-        """
-    params = (
-        profile.working_location, f"{date.day:02d}", f"{date.month:02d}",
-        date_utils.datetime_to_string(date, '%d/%m/%Y'))
-    results = execute_query(query, params=params, fetch=True)
+    params = (profile.working_location, date.month, date.day, date_utils.datetime_to_string(date, '%Y-%m-%d'))
+    results = execute_query(DATE_HOLIDAY_QUERY, params=params, fetch=True)
     if len(results) > 0:
-        return Holiday.FromDatabaseObj(results[0])
+        return Holiday.FromDatabaseObj(min(results, key=lambda x: x['working_hours']))
     return None
 
 
@@ -0,0 +1,325 @@
+from wtt.repositories import execute_query, execute_query_with_conn, transaction
+
+# each entry upgrades the database to its version, they are applied in order and only once per database file
+MIGRATIONS = (
+    (1, (
+        """
+        CREATE INDEX IF NOT EXISTS time_cards_profile_timestamp_idx
+            ON time_cards("profile_uuid", "event_timestamp_utc");
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS absences_profile_date_idx
+            ON absences("profile_uuid", "date");
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS holidays_location_date_idx
+            ON holidays("location", "date");
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS profiles_created_at_idx
+            ON profiles("created_at_utc");
+        """,
+    )),
+    (2, (
+        # dates were stored as str(datetime), possibly with an UTC offset, now they are plain YYYY-MM-DD strings
+        """
+        UPDATE absences SET "date" = date("date");
+        """,
+        """
+        UPDATE holidays SET "date" = date("date");
+        """,
+        """
+        ALTER TABLE holidays ADD COLUMN "month" INT GENERATED ALWAYS AS (CAST(substr("date", 6, 2) AS INT)) VIRTUAL;
+        """,
+        """
+        ALTER TABLE holidays ADD COLUMN "day" INT GENERATED ALWAYS AS (CAST(substr("date", 9, 2) AS INT)) VIRTUAL;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS holidays_location_month_day_idx
+            ON holidays("location", "month", "day");
+        """,
+    )),
+    (3, (
+        # the string column is kept up to date as well, for compatibility with older versions and external tools
+        """
+        ALTER TABLE time_cards ADD COLUMN "event_timestamp_epoch" INT NULL;
+        """,
+        """
+        UPDATE time_cards SET "event_timestamp_epoch" = CAST(strftime('%s', "event_timestamp_utc") AS INT);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS time_cards_profile_epoch_idx
+            ON time_cards("profile_uuid", "event_timestamp_epoch");
+        """,
+        """
+        DROP INDEX IF EXISTS time_cards_profile_timestamp_idx;
+        """,
+    )),
+    (4, (
+        # the ledger is rebuilt whenever the profile settings it was computed with change
+        """
+        ALTER TABLE work_days_state ADD COLUMN "settings_fingerprint" VARCHAR(40) NULL;
+        """,
+        # days touched by any write, even from outside of wtt, they are recomputed on the next ledger read
+        """
+        CREATE TABLE IF NOT EXISTS work_days_dirty(
+            "profile_uuid" UUID NOT NULL,
+            "date" DATE NULL,
+            "event_timestamp_epoch" INT NULL,
+            "repeats_every_year" BOOL NOT NULL DEFAULT False
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS work_days_dirty_profile_idx
+            ON work_days_dirty("profile_uuid");
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS time_cards_insert_dirty AFTER INSERT ON time_cards
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "event_timestamp_epoch")
+            VALUES (NEW."profile_uuid",
+                    COALESCE(NEW."event_timestamp_epoch", CAST(strftime('%s', NEW."event_timestamp_utc") AS INT)));
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS time_cards_delete_dirty AFTER DELETE ON time_cards
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "event_timestamp_epoch")
+            VALUES (OLD."profile_uuid",
+                    COALESCE(OLD."event_timestamp_epoch", CAST(strftime('%s', OLD."event_timestamp_utc") AS INT)));
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS time_cards_update_dirty AFTER UPDATE ON time_cards
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "event_timestamp_epoch")
+            VALUES (OLD."profile_uuid",
+                    COALESCE(OLD."event_timestamp_epoch", CAST(strftime('%s', OLD."event_timestamp_utc") AS INT))),
+                   (NEW."profile_uuid",
+                    COALESCE(NEW."event_timestamp_epoch", CAST(strftime('%s', NEW."event_timestamp_utc") AS INT)));
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS absences_insert_dirty AFTER INSERT ON absences
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "date") VALUES (NEW."profile_uuid", date(NEW."date"));
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS absences_delete_dirty AFTER DELETE ON absences
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "date") VALUES (OLD."profile_uuid", date(OLD."date"));
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS absences_update_dirty AFTER UPDATE ON absences
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "date")
+            VALUES (OLD."profile_uuid", date(OLD."date")), (NEW."profile_uuid", date(NEW."date"));
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS holidays_insert_dirty AFTER INSERT ON holidays
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "date", "repeats_every_year")
+            SELECT "uuid", date(NEW."date"), NEW."repeats_every_year" FROM profiles
+            WHERE "working_location" = NEW."location";
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS holidays_delete_dirty AFTER DELETE ON holidays
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "date", "repeats_every_year")
+            SELECT "uuid", date(OLD."date"), OLD."repeats_every_year" FROM profiles
+            WHERE "working_location" = OLD."location";
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS holidays_update_dirty AFTER UPDATE ON holidays
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "date", "repeats_every_year")
+            SELECT "uuid", date(OLD."date"), OLD."repeats_every_year" FROM profiles
+            WHERE "working_location" = OLD."location";
+            INSERT INTO work_days_dirty ("profile_uuid", "date", "repeats_every_year")
+            SELECT "uuid", date(NEW."date"), NEW."repeats_every_year" FROM profiles
+            WHERE "working_location" = NEW."location";
+        END;
+        """,
+    )),
+    (5, (
+        # bulk imports mark each day once, instead of once per card, see import_export.store_imported_time_cards
+        """
+        DROP TRIGGER IF EXISTS time_cards_insert_dirty;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS time_cards_insert_dirty AFTER INSERT ON time_cards
+            WHEN NEW."insertion_method" IS NOT 'import'
+        BEGIN
+            INSERT INTO work_days_dirty ("profile_uuid", "event_timestamp_epoch")
+            VALUES (NEW."profile_uuid",
+                    COALESCE(NEW."event_timestamp_epoch", CAST(strftime('%s', NEW."event_timestamp_utc") AS INT)));
+        END;
+        """,
+    )),
+    (6, (
+        # calendars compiled from the holidays, see repositories/work_calendar.py, dropped whenever a holiday of their
+        # location changes, even from outside of wtt
+        """
+        CREATE TABLE IF NOT EXISTS work_calendars(
+            "location" VARCHAR(50) NOT NULL,
+            "year" INT NOT NULL,
+            "weekend_days" VARCHAR(20) NOT NULL,
+            "work_days" BLOB NOT NULL,
+            "holidays" TEXT NOT NULL,
+            PRIMARY KEY ("location", "weekend_days", "year")
+        );
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS holidays_insert_calendars AFTER INSERT ON holidays
+        BEGIN
+            DELETE FROM work_calendars WHERE "location" = NEW."location";
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS holidays_delete_calendars AFTER DELETE ON holidays
+        BEGIN
+            DELETE FROM work_calendars WHERE "location" = OLD."location";
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS holidays_update_calendars AFTER UPDATE ON holidays
+        BEGIN
+            DELETE FROM work_calendars WHERE "location" IN (OLD."location", NEW."location");
+        END;
+        """,
+    )),
+    (7, (
+        # closed years moved to their own files, see repositories/archive.py, end_epoch is exclusive
+        """
+        CREATE TABLE IF NOT EXISTS time_cards_archives(
+            "year" INT PRIMARY KEY,
+            "path" TEXT NOT NULL,
+            "first_epoch" INT NOT NULL,
+            "end_epoch" INT NOT NULL,
+            "time_cards" INT NOT NULL DEFAULT 0,
+            "archived_at_utc" DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    )),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_query_plan_checks():
+    # repository queries that must be served by an index, the parameters are only placeholders for the planner, the
+    # repositories are imported here, the module is loaded on the startup of every command
+    from wtt.repositories import absence as absence_repo
+    from wtt.repositories import holiday as holiday_repo
+    from wtt.repositories import profile as profile_repo
+    from wtt.repositories import time_card as time_card_repo
+    from wtt.repositories import work_calendar as work_calendar_repo
+    from wtt.repositories import work_day as work_day_repo
+    # the temporary table of the imports only exists on the connection that created it
+    execute_query(time_card_repo.IMPORTED_TIME_CARDS_TABLE_QUERY)
+    return (
+        ('time_card.get_profile_time_cards', time_card_repo.PROFILE_TIME_CARDS_QUERY, ('', 0, 0)),
+        ('time_card.get_profile_time_cards_batch', time_card_repo.PROFILE_TIME_CARDS_BATCH_QUERY, ('', 0, 0)),
+        ('time_card.get_profiles_time_cards_batches', time_card_repo.get_profiles_time_cards_query(2),
+         ('', '', 0, 0)),
+        ('time_card.iterate_time_cards_rows', time_card_repo.TIME_CARDS_ROWS_QUERY, (0, 0)),
+        ('time_card.iterate_time_cards_rows/profile', time_card_repo.PROFILE_TIME_CARDS_ROWS_QUERY, ('', 0, 0)),
+        ('time_card.get_time_card', time_card_repo.TIME_CARD_QUERY, ('', '')),
+        ('time_card.delete_time_card', time_card_repo.DELETE_TIME_CARD_QUERY, ('', '')),
+        ('time_card.insert_time_cards_from_epochs', time_card_repo.INSERT_IMPORTED_TIME_CARDS_QUERY, ('', '', '')),
+        ('profile.get_profile', profile_repo.PROFILE_QUERY, ('',)),
+        ('absence.get_profile_absences', absence_repo.PROFILE_ABSENCES_QUERY, ('',)),
+        ('absence.get_absence_on_date', absence_repo.ABSENCE_ON_DATE_QUERY, ('', '')),
+        ('absence.has_authorized_absence_on_date', absence_repo.AUTHORIZED_ABSENCE_ON_DATE_QUERY, ('', '')),
+        ('holiday.get_location_holidays', holiday_repo.LOCATION_HOLIDAYS_QUERY, ('',)),
+        ('holiday.get_date_holiday', holiday_repo.DATE_HOLIDAY_QUERY, ('', 0, 0, '')),
+        ('work_calendar.get_location_work_calendars', work_calendar_repo.LOCATION_WORK_CALENDARS_QUERY,
+         ('', '', 0, 0)),
+        ('work_day.get_profile_work_days', work_day_repo.PROFILE_WORK_DAYS_QUERY, ('', '', '')),
+        ('work_day.iterate_work_days_rows', work_day_repo.WORK_DAYS_ROWS_QUERY, ('', '')),
+        ('work_day.iterate_work_days_rows/profile', work_day_repo.PROFILE_WORK_DAYS_ROWS_QUERY, ('', '', '')),
+        ('work_day.get_computed_until', work_day_repo.COMPUTED_UNTIL_QUERY, ('',)),
+        ('work_day.get_settings_fingerprint', work_day_repo.SETTINGS_FINGERPRINT_QUERY, ('',)),
+        ('work_day.get_dirty_work_days', work_day_repo.DIRTY_WORK_DAYS_QUERY, ('',)),
+        ('work_day.delete_dirty_work_days', work_day_repo.DELETE_READ_DIRTY_WORK_DAYS_QUERY, ('', 0)),
+        ('work_day.delete_dirty_work_days/all', work_day_repo.DELETE_DIRTY_WORK_DAYS_QUERY, ('',)),
+        ('work_day.replace_profile_work_days', work_day_repo.DELETE_WORK_DAYS_QUERY, ('', '', '')),
+        ('work_day.delete_profile_work_days', work_day_repo.DELETE_PROFILE_WORK_DAYS_QUERY, ('',)),
+    )
+
+
+# tables of the queries above that are read whole by design, by the alias they have on the query
+SCANNED_TABLES = {
+    'time_card.insert_time_cards_from_epochs': ('i',),  # the cards being imported, each looked up on the index
+}
+
+
+def get_scanning_query_plans():
+    # repository queries that read whole tables by design, they are audited but not required to use an index
+    from wtt.repositories import absence as absence_repo
+    from wtt.repositories import archive as archive_repo
+    from wtt.repositories import holiday as holiday_repo
+    from wtt.repositories import profile as profile_repo
+    from wtt.repositories import time_card as time_card_repo
+    from wtt.repositories import work_day as work_day_repo
+    return (
+        ('archive.get_archives', archive_repo.ARCHIVES_QUERY, (0, 0)),
+        ('time_card.get_all_time_cards', time_card_repo.ALL_TIME_CARDS_QUERY, ()),
+        ('time_card.get_first_time_card_epoch', time_card_repo.FIRST_TIME_CARD_EPOCH_QUERY, ()),
+        ('profile.get_all_profiles', profile_repo.ALL_PROFILES_QUERY, ()),
+        ('absence.get_all_absences', absence_repo.ALL_ABSENCES_QUERY, ()),
+        ('holiday.get_all_holidays', holiday_repo.ALL_HOLIDAYS_QUERY, ()),
+        ('work_day.get_all_work_days', work_day_repo.get_all_work_days_query(1), ('',)),
+        ('work_day.get_balances_in_minutes', work_day_repo.BALANCES_IN_MINUTES_QUERY, ()),
+        ('work_day.get_work_days_states', work_day_repo.WORK_DAYS_STATES_QUERY, ()),
+        ('work_day.get_profiles_with_dirty_work_days', work_day_repo.PROFILES_WITH_DIRTY_WORK_DAYS_QUERY, ()),
+    )
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version;').fetchone()['user_version']
+
+
+def migrate_database():
+    with transaction(immediate=True) as conn:
+        current_version = get_schema_version(conn)
+        for version, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            for statement in statements:
+                execute_query_with_conn(conn, statement, close_conn=False)
+            # PRAGMA does not accept parameters, version is always an int from MIGRATIONS
+            execute_query_with_conn(conn, f'PRAGMA user_version = {int(version)};', close_conn=False)
+
+
+def explain_query_plan(query, params=None):
+    results = execute_query(f'EXPLAIN QUERY PLAN {query}', params=params, fetch=True)
+    return [el['detail'] for el in results]
+
+
+def is_full_scan(plan_detail, scanned_tables=()):
+    # "SCAN table" reads every row, "SCAN table USING [COVERING] INDEX" walks an index instead
+    if not plan_detail.startswith('SCAN ') or ' USING ' in plan_detail:
+        return False
+    return plan_detail.split(' ')[1] not in scanned_tables
+
+
+def is_unindexed_sort(plan_detail):
+    # "USE TEMP B-TREE FOR ORDER BY", or for GROUP BY and DISTINCT, sorts rows the index did not return in order
+    return plan_detail.startswith('USE TEMP B-TREE FOR ')
+
+
+def check_query_plans():
+    # the queries must find their rows and return them in order through an index
+    failures = []
+    for name, query, params in get_query_plan_checks():
+        plan = explain_query_plan(query, params)
+        if any(is_full_scan(el, SCANNED_TABLES.get(name, ())) or is_unindexed_sort(el) for el in plan):
+            failures.append((name, plan))
+    return failures
+
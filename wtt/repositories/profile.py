@@ -1,16 +1,27 @@
 from wtt.models.profile import Profile
-from wtt.repositories import execute_query
+from wtt.repositories import CURRENT_PROFILE, execute_query
+
+ALL_PROFILES_QUERY = """
+        SELECT * FROM profiles ORDER BY created_at_utc;
+    """
+PROFILE_QUERY = """
+        SELECT * FROM profiles WHERE uuid = ?;
+    """
 
 
 def get_all_profiles():
-    query = """
-            SELECT * FROM profiles ORDER BY created_at_utc;
-        """
-    results = execute_query(query, fetch=True)
+    results = execute_query(ALL_PROFILES_QUERY, fetch=True)
     results = [Profile.FromDatabaseObj(el) for el in results]
     return results
 
 
+def get_profile(profile_uuid):
+    results = execute_query(PROFILE_QUERY, params=(profile_uuid,), fetch=True)
+    if len(results) > 0:
+        return Profile.FromDatabaseObj(results[0])
+    return None
+
+
 def create_profile(profile):
     params = profile.to_database_params()
     fields = '(' + ', '.join([f'"{el}"' for el in Profile.GetFields()]) + ')'
@@ -24,12 +35,27 @@ def create_profile(profile):
     execute_query(query_insert, params=params)
 
 
-def get_current_profile():
+def is_profile_selected(profile, selector):
+    selector = selector.strip().lower()
+    full_name = f'{profile.first_name} {profile.last_name}'.lower()
+    return selector in (profile.uuid.lower(), profile.first_name.lower(), full_name)
+
+
+def get_current_profile(selector=None):
+    # the selector is an uuid, a first name or a full name, it falls back to CURRENT_PROFILE
+    if selector is None:
+        selector = CURRENT_PROFILE
     profiles = get_all_profiles()
     if len(profiles) == 0:
         return None
-    elif len(profiles) == 1:
-        return profiles[0]
-    else:
-        # TODO select between profiles using some configuration
-        raise NotImplementedError('Not implemented yet!')
+    if selector is None:
+        if len(profiles) == 1:
+            return profiles[0]
+        raise ValueError(f'There are {len(profiles)} profiles, select one with --profile, the CURRENT_PROFILE '
+                         f'environment variable or "current_profile" on the settings file')
+    selected = [el for el in profiles if is_profile_selected(el, selector)]
+    if len(selected) == 0:
+        raise ValueError(f'There is no profile named {selector}')
+    if len(selected) > 1:
+        raise ValueError(f'There are {len(selected)} profiles named {selector}, select one by its uuid')
+    return selected[0]
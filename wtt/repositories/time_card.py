@@ -1,20 +1,91 @@
+import itertools
+import operator
+
 from wtt.models.time_card import TimeCard
-from wtt.repositories import execute_query
+from wtt.models.time_card_batch import TimeCardBatch
+from wtt.repositories import archive as archive_repo
+from wtt.repositories import execute_many, execute_query, iterate_query_batches, iterate_query_rows
 from wtt.utils import date as date_utils
+from wtt.utils import uuid as uuid_utils
 
 SHORT_SEARCH_LIMIT_IN_DAYS = None  # None or number, such as 60
+EXPORTED_FIELDS = ("uuid", "profile_uuid", "event_timestamp_epoch", "insertion_method")
+
+# the queries are module constants so the query plan checks of migrations run the very same statements
+ALL_TIME_CARDS_QUERY = """
+        SELECT * FROM time_cards
+        ORDER BY event_timestamp_epoch;
+    """
+FIRST_TIME_CARD_EPOCH_QUERY = """
+        SELECT MIN(event_timestamp_epoch) AS first_epoch FROM time_cards;
+    """
+PROFILE_TIME_CARDS_QUERY = """
+        SELECT * FROM time_cards
+        WHERE profile_uuid = ? AND (event_timestamp_epoch >= ? AND event_timestamp_epoch <= ?)
+        ORDER BY event_timestamp_epoch;
+    """
+PROFILE_TIME_CARDS_BATCH_QUERY = """
+        SELECT event_timestamp_epoch, uuid FROM time_cards
+        WHERE profile_uuid = ? AND (event_timestamp_epoch >= ? AND event_timestamp_epoch <= ?)
+        ORDER BY event_timestamp_epoch;
+    """
+TIME_CARDS_ROWS_QUERY = f"""
+        SELECT {', '.join([f'"{el}"' for el in EXPORTED_FIELDS])} FROM time_cards
+        WHERE event_timestamp_epoch >= ? AND event_timestamp_epoch <= ?
+        ORDER BY profile_uuid, event_timestamp_epoch;
+    """
+PROFILE_TIME_CARDS_ROWS_QUERY = f"""
+        SELECT {', '.join([f'"{el}"' for el in EXPORTED_FIELDS])} FROM time_cards
+        WHERE profile_uuid = ? AND event_timestamp_epoch >= ? AND event_timestamp_epoch <= ?
+        ORDER BY event_timestamp_epoch;
+    """
+TIME_CARD_QUERY = """
+        SELECT * FROM time_cards
+        WHERE profile_uuid = ? AND uuid = ?;
+    """
+DELETE_TIME_CARD_QUERY = """
+        DELETE FROM time_cards
+        WHERE profile_uuid = ? AND uuid = ?;
+    """
+IMPORTED_TIME_CARDS_TABLE_QUERY = """
+        CREATE TEMP TABLE IF NOT EXISTS imported_time_cards(
+            "event_timestamp_epoch" INTEGER PRIMARY KEY,
+            "uuid" UUID NOT NULL
+        );
+    """
+INSERT_IMPORTED_TIME_CARDS_QUERY = f"""
+        INSERT INTO time_cards
+            ({', '.join([f'"{el}"' for el in TimeCard.GetFields()])})
+        SELECT i.uuid, ?, strftime('%Y-%m-%d %H:%M:%S+00:00', i.event_timestamp_epoch, 'unixepoch'), ?,
+            i.event_timestamp_epoch
+        FROM imported_time_cards i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM time_cards t
+            WHERE t.profile_uuid = ? AND t.event_timestamp_epoch = i.event_timestamp_epoch
+        )
+        ORDER BY i.event_timestamp_epoch;
+    """
 
 
-def get_all_time_cards():
-    query = """
-            SELECT * FROM time_cards
-            ORDER BY event_timestamp_utc;
+def get_profiles_time_cards_query(amount):
+    return f"""
+            SELECT profile_uuid, event_timestamp_epoch FROM time_cards
+            WHERE profile_uuid IN ({', '.join(['?'] * amount)})
+                AND event_timestamp_epoch >= ? AND event_timestamp_epoch <= ?
+            ORDER BY profile_uuid, event_timestamp_epoch;
         """
-    results = execute_query(query, fetch=True)
+
+
+def get_all_time_cards():
+    results = execute_query(ALL_TIME_CARDS_QUERY, fetch=True)
     results = [TimeCard.FromDatabaseObj(el) for el in results]
     return results
 
 
+def get_first_time_card_epoch():
+    return execute_query(FIRST_TIME_CARD_EPOCH_QUERY, fetch=True)[0]['first_epoch']
+
+
 def filter_time_cards_before_localized(time_cards, last_date):
     last_date_only = date_utils.date_to_beginning_of_day(last_date)
     if len(time_cards) > 0:
@@ -50,19 +121,123 @@ def get_profile_time_cards(profile, start_date=None, end_date=None):
         end_date = date_utils.get_utc_now()
     start_date_minus_one = date_utils.add_days_to_datetime(start_date, -1)
     end_date_plus_one = date_utils.add_days_to_datetime(end_date, 1)
-    query = """
-            SELECT * FROM time_cards
-            WHERE profile_uuid = ? AND (event_timestamp_utc >= ? AND event_timestamp_utc <= ?)
-            ORDER BY event_timestamp_utc;
-        """
-    params = (profile.uuid, start_date_minus_one, end_date_plus_one)
+    query = PROFILE_TIME_CARDS_QUERY
+    params = (profile.uuid, date_utils.datetime_to_epoch(start_date_minus_one),
+              date_utils.datetime_to_epoch(end_date_plus_one))
     results = execute_query(query, params=params, fetch=True)
+    archives = archive_repo.get_archives(params[1], params[2])
+    if len(archives) > 0:
+        archived_results = archive_repo.fetch_from_archives(archives, query, params)
+        results = sorted(archived_results + archive_repo.exclude_archived(results, archived_results),
+                         key=lambda x: x['event_timestamp_epoch'])
     results = [TimeCard.FromDatabaseObj(el) for el in results]
     results = filter_time_cards_after_localized(results, start_date)
     results = filter_time_cards_before_localized(results, end_date)
     return results
 
 
+def get_profile_time_cards_batch(profile, start_date=None, end_date=None, with_uuids=False):
+    # same cards as get_profile_time_cards, without building a TimeCard for each of them
+    if start_date is None:
+        start_date = profile.start_date
+    if end_date is None:
+        end_date = date_utils.get_utc_now()
+    start_date_minus_one = date_utils.add_days_to_datetime(start_date, -1)
+    end_date_plus_one = date_utils.add_days_to_datetime(end_date, 1)
+    query = PROFILE_TIME_CARDS_BATCH_QUERY
+    params = (profile.uuid, date_utils.datetime_to_epoch(start_date_minus_one),
+              date_utils.datetime_to_epoch(end_date_plus_one))
+    first_day_number = date_utils.datetime_to_day_number(start_date)
+    last_day_number = date_utils.datetime_to_day_number(end_date)
+    timezone = date_utils.get_local_timezone()
+    batch = TimeCardBatch(profile.uuid, uuids=[] if with_uuids else None)
+    rows = iterate_query_rows(query, params=params)
+    archives = archive_repo.get_archives(params[1], params[2])
+    if len(archives) > 0:
+        rows = archive_repo.merge_rows(archive_repo.iterate_archives_rows(archives, query, params) + [rows],
+                                       key=operator.itemgetter(0))
+    for epoch, uuid in rows:
+        day_number = date_utils.epoch_to_day_number(epoch, timezone)
+        if first_day_number <= day_number <= last_day_number:
+            batch.append(epoch, day_number, uuid)
+    return batch
+
+
+MAX_PROFILES_PER_QUERY = 500  # keeps the amount of parameters below the limit of older sqlite versions
+
+
+def get_profiles_time_cards_batches(intervals):
+    # intervals maps each profile uuid to its (start_date, end_date), the profiles are read in ordered scans of the
+    # index, one for each MAX_PROFILES_PER_QUERY profiles
+    if len(intervals) == 0:
+        return {}
+    first_date = min(el[0] for el in intervals.values())
+    last_date = max(el[1] for el in intervals.values())
+    epochs = (date_utils.datetime_to_epoch(date_utils.add_days_to_datetime(first_date, -1)),
+              date_utils.datetime_to_epoch(date_utils.add_days_to_datetime(last_date, 1)))
+    profile_uuids = sorted(intervals)
+    archives = archive_repo.get_archives(*epochs)
+    rows = []
+    for i in range(0, len(profile_uuids), MAX_PROFILES_PER_QUERY):
+        chunk = profile_uuids[i:i + MAX_PROFILES_PER_QUERY]
+        query = get_profiles_time_cards_query(len(chunk))
+        chunk_rows = iterate_query_rows(query, params=tuple(chunk) + epochs)
+        if len(archives) > 0:
+            chunk_rows = archive_repo.merge_rows(
+                archive_repo.iterate_archives_rows(archives, query, tuple(chunk) + epochs) + [chunk_rows], key=None)
+        rows.append(chunk_rows)
+    day_number_intervals = {uuid: (date_utils.datetime_to_day_number(start_date),
+                                   date_utils.datetime_to_day_number(end_date))
+                            for uuid, (start_date, end_date) in intervals.items()}
+    timezone = date_utils.get_local_timezone()
+    batches = {uuid: TimeCardBatch(uuid) for uuid in intervals}
+    batch = None
+    current_uuid = None
+    first_day_number = last_day_number = None
+    for profile_uuid, epoch in itertools.chain.from_iterable(rows):
+        if profile_uuid != current_uuid:
+            current_uuid = profile_uuid
+            batch = batches.get(profile_uuid)
+            if batch is not None:
+                first_day_number, last_day_number = day_number_intervals[profile_uuid]
+        if batch is None:
+            continue
+        day_number = date_utils.epoch_to_day_number(epoch, timezone)
+        if first_day_number <= day_number <= last_day_number:
+            batch.append(epoch, day_number)
+    return batches
+
+
+def iterate_time_cards_rows(profile=None, start_epoch=None, end_epoch=None):
+    # batches of EXPORTED_FIELDS tuples of the profile, or of every profile when it is None, ordered by profile and
+    # time, the bounds are inclusive
+    if start_epoch is None:
+        start_epoch = -2 ** 63
+    if end_epoch is None:
+        end_epoch = 2 ** 63 - 1
+    if profile is None:
+        query = TIME_CARDS_ROWS_QUERY
+        params = (start_epoch, end_epoch)
+    else:
+        query = PROFILE_TIME_CARDS_ROWS_QUERY
+        params = (profile.uuid, start_epoch, end_epoch)
+    batches = iterate_query_batches(query, params=params)
+    archives = archive_repo.get_archives(start_epoch, end_epoch)
+    if len(archives) == 0:
+        return batches
+    key = operator.itemgetter(2) if profile is not None else operator.itemgetter(1, 2)
+    return archive_repo.merge_batches(archive_repo.iterate_archives_rows(archives, query, params)
+                                      + [itertools.chain.from_iterable(batches)], key)
+
+
+def get_time_card(profile, card_uuid):
+    params = (profile.uuid, card_uuid)
+    results = execute_query(TIME_CARD_QUERY, params=params, fetch=True)
+    if len(results) > 0:
+        return TimeCard.FromDatabaseObj(results[0])
+    return archive_repo.get_archived_time_card(profile, card_uuid)
+
+
 def persist_time_card(time_card):
     params = time_card.to_database_params()
     fields = '(' + ', '.join([f'"{el}"' for el in TimeCard.GetFields()]) + ')'
@@ -77,6 +252,23 @@ def persist_time_card(time_card):
     return time_card
 
 
+def insert_time_cards_from_epochs(profile, method, epochs):
+    # bulk insertion for imports, epochs repeated on the list or already recorded for the profile are skipped,
+    # returns how many cards were inserted
+    execute_query(IMPORTED_TIME_CARDS_TABLE_QUERY)
+    execute_many("""
+            INSERT OR IGNORE INTO imported_time_cards ("event_timestamp_epoch", "uuid") VALUES (?, ?);
+        """, zip(epochs, uuid_utils.time_ordered_uuids(len(epochs))))
+    if len(epochs) > 0:
+        execute_many("""
+                DELETE FROM imported_time_cards WHERE "event_timestamp_epoch" = ?;
+            """, ((el,) for el in archive_repo.get_archived_epochs(profile, min(epochs), max(epochs))))
+    execute_query(INSERT_IMPORTED_TIME_CARDS_QUERY, params=(profile.uuid, method, profile.uuid))
+    inserted = execute_query('SELECT changes() AS inserted;', fetch=True)[0]['inserted']
+    execute_query('DELETE FROM imported_time_cards;')
+    return inserted
+
+
 def insert_time_card(profile, method, event_timestamp):
     time_card = TimeCard(profile.uuid, method, event_timestamp_utc=event_timestamp)
     return persist_time_card(time_card)
@@ -132,9 +324,7 @@ def get_profile_time_cards_grouped_by_day(profile, start_date=None, end_date=Non
 
 
 def delete_time_card(profile, card_uuid):
-    query = """
-            DELETE FROM time_cards
-            WHERE profile_uuid = ? AND uuid = ?;
-        """
     params = (profile.uuid, card_uuid)
-    execute_query(query, params=params)
+    execute_query(DELETE_TIME_CARD_QUERY, params=params)
+    # a card being archived again is on both files for a moment, so the archives are looked up even if it was found
+    archive_repo.delete_archived_time_card(profile, card_uuid)
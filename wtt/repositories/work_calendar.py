@@ -0,0 +1,75 @@
+from wtt import repositories
+from wtt.models.work_calendar import WorkCalendar
+from wtt.repositories import execute_many, execute_query, is_read_only_session, transaction
+from wtt.repositories import holiday as holiday_repo
+from wtt.utils import date as date_utils
+
+LOCATION_WORK_CALENDARS_QUERY = """
+        SELECT * FROM work_calendars
+        WHERE "location" = ? AND weekend_days = ? AND "year" >= ? AND "year" <= ?;
+    """
+
+
+def get_weekend_days(location):
+    return repositories.LOCATION_WEEKEND_DAYS.get(location, repositories.WEEKEND_DAYS)
+
+
+def compile_work_calendars(location, years, weekend_days):
+    holidays = holiday_repo.get_location_holidays(location)
+    return [WorkCalendar.FromHolidays(location, year, weekend_days, holidays) for year in years]
+
+
+def get_location_work_calendars(location, first_year, last_year):
+    # {year: WorkCalendar} of the location, the calendars are compiled from the holidays only once and stored, the
+    # migration 6 triggers drop them whenever a holiday of the location changes
+    weekend_days = get_weekend_days(location)
+    params = (location, WorkCalendar.WeekendDaysToString(weekend_days), first_year, last_year)
+    calendars = {el['year']: WorkCalendar.FromDatabaseObj(el)
+                 for el in execute_query(LOCATION_WORK_CALENDARS_QUERY, params=params, fetch=True)}
+    missing_years = [year for year in range(first_year, last_year + 1) if year not in calendars]
+    if len(missing_years) == 0:
+        return calendars
+    if is_read_only_session():  # report workers compile them in memory, the next writer stores them
+        compiled = compile_work_calendars(location, missing_years, weekend_days)
+    else:
+        # the holidays are read and the calendars stored on the same transaction, so a holiday inserted meanwhile
+        # can not leave a stale calendar behind
+        fields = '(' + ', '.join([f'"{el}"' for el in WorkCalendar.GetFields()]) + ')'
+        query_insert = f"""
+            INSERT OR REPLACE INTO work_calendars
+                {fields}
+            VALUES
+                ({', '.join(['?'] * len(WorkCalendar.GetFields()))})
+            ;
+        """
+        with transaction(immediate=True):
+            compiled = compile_work_calendars(location, missing_years, weekend_days)
+            execute_many(query_insert, (el.to_database_params() for el in compiled))
+    for calendar in compiled:
+        calendars[calendar.year] = calendar
+    return calendars
+
+
+def get_profile_work_calendars(profile, first_year=None, last_year=None):
+    if first_year is None:
+        first_year = profile.start_date.year
+    if last_year is None:
+        last_year = date_utils.get_now().year
+    return get_location_work_calendars(profile.working_location, first_year, last_year)
+
+
+def get_work_calendar(location, year):
+    return get_location_work_calendars(location, year, year)[year]
+
+
+def get_work_day_numbers_from_calendars(calendars, first_day_number, last_day_number):
+    for year in sorted(calendars):
+        yield from calendars[year].get_work_day_numbers(first_day_number, last_day_number)
+
+
+def get_date_holiday_from_calendars(calendars, date):
+    # (working hours, description) of the holiday on the date fields, or None
+    calendar = calendars.get(date.year)
+    if calendar is None:
+        return None
+    return calendar.get_holiday(date_utils.datetime_to_day_number(date))
@@ -0,0 +1,201 @@
+from wtt.models.work_day import WorkDay
+from wtt.repositories import execute_many, execute_query, execute_query_with_conn, iterate_query_batches, transaction
+from wtt.utils import date as date_utils
+
+# days with time cards come first, then the work days without cards, as get_work_days_with_time_cards does
+PROFILE_WORK_DAYS_QUERY = """
+        SELECT * FROM work_days
+        WHERE profile_uuid = ? AND "date" >= ? AND "date" <= ?
+        ORDER BY "date";
+    """
+WORK_DAYS_ROWS_QUERY = f"""
+        SELECT {', '.join([f'"{el}"' for el in WorkDay.GetFields()])} FROM work_days
+        WHERE "date" >= ? AND "date" <= ?
+        ORDER BY profile_uuid, "date";
+    """
+PROFILE_WORK_DAYS_ROWS_QUERY = f"""
+        SELECT {', '.join([f'"{el}"' for el in WorkDay.GetFields()])} FROM work_days
+        WHERE profile_uuid = ? AND "date" >= ? AND "date" <= ?
+        ORDER BY "date";
+    """
+BALANCES_IN_MINUTES_QUERY = """
+        SELECT profile_uuid, SUM(balance_minutes) AS balance_minutes FROM work_days
+        GROUP BY profile_uuid;
+    """
+WORK_DAYS_STATES_QUERY = """
+        SELECT profile_uuid, computed_until, settings_fingerprint FROM work_days_state;
+    """
+PROFILES_WITH_DIRTY_WORK_DAYS_QUERY = """
+        SELECT DISTINCT profile_uuid FROM work_days_dirty;
+    """
+COMPUTED_UNTIL_QUERY = """
+        SELECT computed_until FROM work_days_state
+        WHERE profile_uuid = ?;
+    """
+SETTINGS_FINGERPRINT_QUERY = """
+        SELECT settings_fingerprint FROM work_days_state
+        WHERE profile_uuid = ?;
+    """
+DIRTY_WORK_DAYS_QUERY = """
+        SELECT rowid, "date", event_timestamp_epoch, repeats_every_year FROM work_days_dirty
+        WHERE profile_uuid = ?
+        ORDER BY rowid;
+    """
+DELETE_READ_DIRTY_WORK_DAYS_QUERY = """
+        DELETE FROM work_days_dirty
+        WHERE profile_uuid = ? AND rowid <= ?;
+    """
+DELETE_DIRTY_WORK_DAYS_QUERY = """
+        DELETE FROM work_days_dirty
+        WHERE profile_uuid = ?;
+    """
+DELETE_WORK_DAYS_QUERY = """
+        DELETE FROM work_days
+        WHERE profile_uuid = ? AND "date" >= ? AND "date" <= ?;
+    """
+DELETE_PROFILE_WORK_DAYS_QUERY = """
+        DELETE FROM work_days
+        WHERE profile_uuid = ?;
+    """
+
+
+def get_all_work_days_query(excluded_status_classes_amount):
+    return f"""
+            SELECT * FROM work_days
+            WHERE status_class NOT IN ({', '.join(['?'] * excluded_status_classes_amount)})
+            ORDER BY profile_uuid, "date";
+        """
+
+
+def sort_work_days(work_days):
+    # the days with time cards first and then the ones without any, both by date, as compute_work_days returns them,
+    # the query only orders them by date, which is the order of the primary key
+    return [el for el in work_days if el.time_cards > 0] + [el for el in work_days if el.time_cards == 0]
+
+
+def get_profile_work_days(profile, start_date=None, end_date=None):
+    if start_date is None:
+        start_date = profile.start_date
+    start_date = date_utils.datetime_to_string(start_date, '%Y-%m-%d')
+    if end_date is None:
+        end_date = '9999-12-31'
+    else:
+        end_date = date_utils.datetime_to_string(end_date, '%Y-%m-%d')
+    params = (profile.uuid, start_date, end_date)
+    results = execute_query(PROFILE_WORK_DAYS_QUERY, params=params, fetch=True)
+    results = [WorkDay.FromDatabaseObj(el) for el in results]
+    return sort_work_days(results)
+
+
+def get_all_work_days(excluded_status_classes=()):
+    # every profile in one query, keyed by the profile uuid, ordered as get_profile_work_days
+    query = get_all_work_days_query(len(excluded_status_classes))
+    work_days = {}
+    for el in execute_query(query, params=tuple(excluded_status_classes), fetch=True):
+        work_day = WorkDay.FromDatabaseObj(el)
+        work_days.setdefault(work_day.profile_uuid, []).append(work_day)
+    return {profile_uuid: sort_work_days(el) for profile_uuid, el in work_days.items()}
+
+
+def iterate_work_days_rows(profile=None, start_date=None, end_date=None):
+    # batches of WorkDay.GetFields() tuples of the profile, or of every profile when it is None, ordered by profile
+    # and date, unlike get_profile_work_days
+    params = (date_utils.datetime_to_string(start_date, '%Y-%m-%d') if start_date is not None else '0000-01-01',
+              date_utils.datetime_to_string(end_date, '%Y-%m-%d') if end_date is not None else '9999-12-31')
+    if profile is None:
+        query = WORK_DAYS_ROWS_QUERY
+    else:
+        query = PROFILE_WORK_DAYS_ROWS_QUERY
+        params = (profile.uuid,) + params
+    return iterate_query_batches(query, params=params)
+
+
+def get_balances_in_minutes():
+    return {el['profile_uuid']: el['balance_minutes'] for el in execute_query(BALANCES_IN_MINUTES_QUERY, fetch=True)}
+
+
+def get_work_days_states():
+    states = {}
+    for el in execute_query(WORK_DAYS_STATES_QUERY, fetch=True):
+        states[el['profile_uuid']] = (date_utils.iso_string_to_datetime(el['computed_until']),
+                                      el['settings_fingerprint'])
+    return states
+
+
+def get_profiles_with_dirty_work_days():
+    return set(el['profile_uuid'] for el in execute_query(PROFILES_WITH_DIRTY_WORK_DAYS_QUERY, fetch=True))
+
+
+def get_computed_until(profile):
+    results = execute_query(COMPUTED_UNTIL_QUERY, params=(profile.uuid,), fetch=True)
+    if len(results) > 0:
+        return date_utils.iso_string_to_datetime(results[0]['computed_until'])
+    return None
+
+
+def get_settings_fingerprint(profile):
+    results = execute_query(SETTINGS_FINGERPRINT_QUERY, params=(profile.uuid,), fetch=True)
+    if len(results) > 0:
+        return results[0]['settings_fingerprint']
+    return None
+
+
+def get_dirty_work_days(profile):
+    # filled by the triggers of time_cards, absences and holidays
+    return execute_query(DIRTY_WORK_DAYS_QUERY, params=(profile.uuid,), fetch=True)
+
+
+def delete_dirty_work_days(profile, last_rowid=None):
+    # only the entries that were read are removed, writes that happened meanwhile are kept for the next read
+    if last_rowid is None:
+        query = DELETE_DIRTY_WORK_DAYS_QUERY
+        params = (profile.uuid,)
+    else:
+        query = DELETE_READ_DIRTY_WORK_DAYS_QUERY
+        params = (profile.uuid, last_rowid)
+    execute_query(query, params=params)
+
+
+def insert_dirty_work_days(profile, epochs):
+    query = """
+            INSERT INTO work_days_dirty ("profile_uuid", "event_timestamp_epoch") VALUES (?, ?);
+        """
+    execute_many(query, ((profile.uuid, el) for el in epochs))
+
+
+def replace_profile_work_days(profile, start_date, end_date, work_days, computed_until=None,
+                              settings_fingerprint=None):
+    # rewrites every ledger row of the interval, days that are no longer worked must disappear as well
+    fields = '(' + ', '.join([f'"{el}"' for el in WorkDay.GetFields()]) + ')'
+    query_insert = f"""
+        INSERT INTO work_days 
+            {fields}
+        VALUES
+            ({', '.join(['?'] * len(WorkDay.GetFields()))})
+        ;
+    """
+    query_state = """
+        INSERT OR REPLACE INTO work_days_state
+            ("profile_uuid", "computed_until", "settings_fingerprint")
+        VALUES
+            (?, ?, ?);
+    """
+    params = (profile.uuid, date_utils.datetime_to_string(start_date, '%Y-%m-%d'),
+              date_utils.datetime_to_string(end_date, '%Y-%m-%d'))
+    with transaction(immediate=True) as conn:
+        execute_query_with_conn(conn, DELETE_WORK_DAYS_QUERY, params=params, close_conn=False)
+        conn.executemany(query_insert, [work_day.to_database_params() for work_day in work_days])
+        if computed_until is not None:
+            params = (profile.uuid, date_utils.datetime_to_string(computed_until, '%Y-%m-%d'), settings_fingerprint)
+            execute_query_with_conn(conn, query_state, params=params, close_conn=False)
+
+
+def delete_profile_work_days(profile):
+    with transaction(immediate=True) as conn:
+        execute_query_with_conn(conn, DELETE_PROFILE_WORK_DAYS_QUERY, params=(profile.uuid,), close_conn=False)
+        execute_query_with_conn(conn, DELETE_DIRTY_WORK_DAYS_QUERY, params=(profile.uuid,), close_conn=False)
+        query = """
+                DELETE FROM work_days_state
+                WHERE profile_uuid = ?;
+            """
+        execute_query_with_conn(conn, query, params=(profile.uuid,), close_conn=False)
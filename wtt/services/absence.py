@@ -3,8 +3,12 @@ from wtt.repositories import absence as absence_repo
 from wtt.utils import date as date_utils
 
 
-def prompt_and_insert_absence(profile):
-    absence = Absence.FromPrompt(profile.uuid)
+def insert_absence(absence):
     absence_repo.create_absence(absence)
+    return absence
+
+
+def prompt_and_insert_absence(profile):
+    absence = insert_absence(Absence.FromPrompt(profile.uuid))
     print(f'A new absence was registered on {date_utils.datetime_to_string(absence.date, "%d/%m/%Y")}')
     return absence
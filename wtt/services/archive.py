@@ -0,0 +1,69 @@
+import datetime
+import os
+
+from wtt.repositories import archive as archive_repo
+from wtt.repositories import profile as profile_repo
+from wtt.repositories import time_card as time_card_repo
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+
+ARCHIVE_KEEP_YEARS = int(os.getenv('ARCHIVE_KEEP_YEARS', '1'))  # closed years kept on the hot database
+
+
+def get_year_epochs(year, timezone):
+    # first epoch of the local year and of the next one
+    return tuple(date_utils.local_epoch_to_epoch(date_utils.naive_datetime_to_local_epoch(datetime.datetime(el, 1, 1)),
+                                                 timezone) for el in (year, year + 1))
+
+
+def archive_years(until_year=None, jobs=None):
+    # moves the time cards of every closed year up to until_year to the archives, returns (year, moved cards) of each,
+    # the ledgers are brought up to date first, so the yearly totals cover the whole years
+    current_year = date_utils.get_now().year
+    if until_year is None:
+        until_year = current_year - 1 - ARCHIVE_KEEP_YEARS
+    if until_year >= current_year:
+        raise ValueError(f'Only closed years can be archived, {until_year} is not over yet')
+    first_epoch = time_card_repo.get_first_time_card_epoch()
+    if first_epoch is None:
+        return []
+    from wtt.services import team as team_service
+    team_service.refresh_team_work_days(profile_repo.get_all_profiles(), jobs or team_service.REPORT_JOBS)
+    timezone = date_utils.get_local_timezone()
+    archives = {el['year']: el for el in archive_repo.get_archives()}
+    archived = []
+    first_year = date_utils.day_number_to_datetime(date_utils.epoch_to_day_number(first_epoch, timezone)).year
+    for year in range(first_year, until_year + 1):
+        if year in archives:  # the boundaries of an archive never move, even if the timezone does
+            epochs = (archives[year]['first_epoch'], archives[year]['end_epoch'])
+        else:
+            epochs = get_year_epochs(year, timezone)
+        archived.append((year, archive_repo.archive_time_cards(year, *epochs)))
+    if sum(el[1] for el in archived) > 0:
+        archive_repo.vacuum()
+    return archived
+
+
+def print_archive_years(until_year=None, jobs=None):
+    archived = archive_years(until_year=until_year, jobs=jobs)
+    for year, moved in archived:
+        print(f'{year}: {moved} time cards archived')
+    if len(archived) == 0:
+        print('Nothing to archive')
+
+
+def print_archives():
+    archives = archive_repo.get_archives()
+    profiles = {el.uuid: el for el in profile_repo.get_all_profiles()}
+    print('Archived years:')
+    for archive in archives:
+        print(f'\t{archive["year"]}: {archive["time_cards"]} time cards on {archive_repo.get_archive_path(archive)}')
+        for totals in archive_repo.get_yearly_totals(archive):
+            profile = profiles.get(totals['profile_uuid'])
+            name = totals['profile_uuid'] if profile is None else f'{profile.first_name} {profile.last_name}'
+            balance = time_card_service.hours_and_minutes_to_human_readable(
+                *time_card_service.minutes_to_hours_and_minutes(totals['balance_minutes']))
+            print(f'\t\t{name}: {totals["time_cards"]} time cards, {totals["work_days"]} work days, extra hours '
+                  f'balance: {balance}')
+    if len(archives) == 0:
+        print('\tNone')
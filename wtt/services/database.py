@@ -0,0 +1,63 @@
+import json
+
+from wtt.repositories import audit as audit_repo
+from wtt.repositories import migrations
+
+# findings of the audit that fail the queries that must be served by an index, as check_query_plans does
+INDEX_FINDINGS = ('full scan', 'unindexed sort', 'partially indexed sort', 'temp b-tree')
+
+
+def print_query_plan_check():
+    failed_checks = migrations.check_query_plans()
+    for name, plan in failed_checks:
+        print(f'{name} is not served by an index: {" | ".join(plan)}')
+    if len(failed_checks) == 0:
+        print(f'All {len(migrations.get_query_plan_checks())} repository queries are served by an index')
+    else:
+        raise AssertionError(f'{len(failed_checks)} repository queries are not served by an index')
+
+
+def format_bytes(amount):
+    if amount is None:
+        return 'size unknown'
+    for unit in ('B', 'KiB', 'MiB'):
+        if amount < 1024:
+            return f'{amount:.0f} {unit}' if unit == 'B' else f'{amount:.1f} {unit}'
+        amount /= 1024
+    return f'{amount:.1f} GiB'
+
+
+def print_database_audit(as_json=False):
+    report = audit_repo.audit_database()
+    errors = [el for el in report['queries']
+              if not el['scan_expected'] and any(finding['finding'] in INDEX_FINDINGS for finding in el['findings'])]
+    if as_json:
+        print(json.dumps(report, indent=2))
+    else:
+        scanning = len([el for el in report['queries'] if el['scan_expected']])
+        print(f'Queries ({len(report["queries"]) - scanning} served by an index, {scanning} reading whole tables by '
+              f'design):')
+        for el in report['queries']:
+            findings = ', '.join(sorted(set(finding['finding'] for finding in el['findings'])))
+            print(f'\t{el["name"]}: {findings or "ok"}')
+            if len(el['findings']) > 0:
+                for detail in el['plan']:
+                    print(f'\t\t{detail}')
+        print('Tables:')
+        for table in report['tables']:
+            print(f'\t{table["name"]}: {table["rows"]} rows, {format_bytes(table["bytes"])}, '
+                  f'{len(table["indexed_queries"])} of {len(table["queries"])} queries use an index')
+            for index in table['indexes']:
+                used_by = f'used by {len(index["used_by"])} {"query" if len(index["used_by"]) == 1 else "queries"}'
+                if len(index['used_by']) == 0:
+                    used_by = 'unused'
+                if len(index['used_by']) == 0 and index['origin'] != 'c':
+                    used_by += ', kept by a constraint'
+                print(f'\t\t{index["name"]} ({", ".join(index["columns"])}): {format_bytes(index["bytes"])}, '
+                      f'{used_by}')
+        if not report['has_statistics']:
+            print('No planner statistics, ANALYZE was never run on this database')
+        findings = sum(len(el['findings']) for el in report['queries'])
+        print(f'{findings} findings on {len(report["queries"])} repository queries')
+    if len(errors) > 0:
+        raise AssertionError(f'{len(errors)} repository queries are not served by an index')
@@ -3,8 +3,12 @@ from wtt.repositories import holiday as holiday_repo
 from wtt.utils import date as date_utils
 
 
-def prompt_and_insert_holiday():
-    holiday = Holiday.FromPrompt()
+def insert_holiday(holiday):
     holiday_repo.create_holiday(holiday)
+    return holiday
+
+
+def prompt_and_insert_holiday():
+    holiday = insert_holiday(Holiday.FromPrompt())
     print(f'A new holiday was added on {date_utils.datetime_to_string(holiday.date, "%d/%m/%Y")}')
     return holiday
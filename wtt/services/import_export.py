@@ -0,0 +1,195 @@
+import csv
+import json
+import os
+import sys
+
+from wtt.repositories import time_card as time_card_repo
+from wtt.repositories import transaction
+from wtt.models.work_day import WorkDay
+from wtt.repositories import work_day as work_day_repo
+from wtt.utils import date as date_utils
+
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '50000'))  # cards kept in memory and written per transaction
+FILE_FORMATS = ('csv', 'jsonl')
+EXPORT_KINDS = ('cards', 'days')
+EXPORTED_TIME_CARD_FIELDS = ('uuid', 'profile_uuid', 'event_timestamp_epoch', 'event_timestamp_utc', 'event_timestamp',
+                             'insertion_method')
+# the first of these fields found on a record is its timestamp, epochs and utc timestamps are taken as they are and
+# naive event_timestamp values are on the local timezone, as on addtc
+TIMESTAMP_FIELDS = ('event_timestamp_epoch', 'event_timestamp_utc', 'event_timestamp')
+CLI_DATETIME_FORMAT = '%d/%m/%Y %H:%M:%S'
+IMPORT_INSERTION_METHOD = 'import'  # the migration 5 trigger relies on it
+
+
+def get_file_format(path, file_format=None):
+    if file_format is None:
+        file_format = os.path.splitext(path)[1][1:].lower()
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f'Unknown file format ({file_format}), should be one of: {", ".join(FILE_FORMATS)}')
+    return file_format
+
+
+def get_timestamp_field(fields):
+    for field in TIMESTAMP_FIELDS:
+        if field in fields:
+            return field
+    raise ValueError(f'Missing the time card timestamp, one of: {", ".join(TIMESTAMP_FIELDS)}')
+
+
+def iterate_csv_timestamps(file):
+    # yields the line number, the timestamp field and its value of each record
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [el.strip() for el in header]
+    field = get_timestamp_field(header)
+    index = header.index(field)
+    for row in reader:
+        if len(row) > 0:
+            yield reader.line_num, field, row[index] if index < len(row) else None
+
+
+def iterate_jsonl_timestamps(file):
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        try:
+            record = json.loads(line)
+            if type(record) is not dict:
+                raise ValueError('Not a json object')
+            field = get_timestamp_field(record)
+        except ValueError as e:
+            raise ValueError(f'Invalid record on line {line_number}: {e}')
+        yield line_number, field, record[field]
+
+
+def parse_timestamp(value):
+    if value[2:3] == '/':
+        return date_utils.string_to_datetime(value, CLI_DATETIME_FORMAT)
+    return date_utils.iso_string_to_datetime(value)
+
+
+def timestamp_to_epoch(field, value, timezone):
+    if field == 'event_timestamp_epoch':
+        return int(value)
+    date = parse_timestamp(value.strip())
+    if date_utils.is_offset_aware_date(date):
+        return date_utils.datetime_to_epoch(date)
+    local_epoch = date_utils.naive_datetime_to_local_epoch(date)
+    if field == 'event_timestamp_utc':
+        return local_epoch
+    return date_utils.local_epoch_to_epoch(local_epoch, timezone)
+
+
+def store_imported_time_cards(profile, epochs, timezone):
+    # the trigger that marks the work day of each inserted card skips imported ones, a single card of each day of
+    # the chunk is marked instead
+    dirty_epochs = {}
+    for epoch in epochs:
+        dirty_epochs.setdefault(date_utils.epoch_to_day_number(epoch, timezone), epoch)
+    with transaction(immediate=True):
+        inserted = time_card_repo.insert_time_cards_from_epochs(profile, IMPORT_INSERTION_METHOD, epochs)
+        work_day_repo.insert_dirty_work_days(profile, dirty_epochs.values())
+    return inserted
+
+
+def import_time_cards(profile, path, file_format=None, chunk_size=IMPORT_CHUNK_SIZE):
+    # the file is streamed and written chunk by chunk, so memory does not grow with its size, cards already recorded
+    # are skipped, which makes an interrupted import safe to run again, returns how many cards were read and inserted
+    file_format = get_file_format(path, file_format)
+    timezone = date_utils.get_local_timezone()
+    read = inserted = 0
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            records = iterate_csv_timestamps(file)
+        else:
+            records = iterate_jsonl_timestamps(file)
+        epochs = []
+        for line_number, field, value in records:
+            try:
+                epochs.append(timestamp_to_epoch(field, value, timezone))
+            except (TypeError, ValueError, AttributeError, OverflowError) as e:
+                raise ValueError(f'Invalid {field} on line {line_number} of {path} ({value}): {e}')
+            if len(epochs) >= chunk_size:
+                inserted += store_imported_time_cards(profile, epochs, timezone)
+                read += len(epochs)
+                epochs = []
+        if len(epochs) > 0:
+            inserted += store_imported_time_cards(profile, epochs, timezone)
+            read += len(epochs)
+    return read, inserted
+
+
+def print_import_time_cards(profile, path, file_format=None):
+    read, inserted = import_time_cards(profile, path, file_format=file_format)
+    print(f'Imported {inserted} time cards of {profile.first_name}, {read - inserted} of the {read} read were '
+          f'duplicates')
+
+
+def get_time_card_records(batches, timezone):
+    for rows in batches:
+        yield [(uuid, profile_uuid, epoch, date_utils.epoch_to_iso_string(epoch),
+                date_utils.epoch_to_iso_string(epoch, timezone), insertion_method)
+               for uuid, profile_uuid, epoch, insertion_method in rows]
+
+
+def write_records(file, file_format, fields, batches):
+    # batches are written as they are read, returns how many records were written
+    written = 0
+    if file_format == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        for rows in batches:
+            writer.writerows(rows)
+            written += len(rows)
+    else:
+        for rows in batches:
+            file.writelines([json.dumps(dict(zip(fields, row))) + '\n' for row in rows])
+            written += len(rows)
+    return written
+
+
+def export_records(kind, profile=None, output=None, file_format=None, start_date=None, end_date=None, jobs=None):
+    # streams the time cards or the closed work days of the ledger between the local dates, of the profile or of
+    # every profile when it is None, to the output file or to stdout, returns how many records were written
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f'Unknown export ({kind}), should be one of: {", ".join(EXPORT_KINDS)}')
+    to_stdout = output is None or output == '-'
+    if to_stdout and file_format is None:
+        file_format = 'csv'
+    file_format = get_file_format(output, file_format)
+    timezone = date_utils.get_local_timezone()
+    if kind == 'cards':
+        start_epoch = end_epoch = None
+        if start_date is not None:
+            start_epoch = date_utils.local_epoch_to_epoch(date_utils.naive_datetime_to_local_epoch(
+                date_utils.date_to_naive_beginning_of_day(start_date)), timezone)
+        if end_date is not None:
+            end_epoch = date_utils.local_epoch_to_epoch(date_utils.naive_datetime_to_local_epoch(
+                date_utils.add_days_to_datetime(date_utils.date_to_naive_beginning_of_day(end_date), 1)), timezone) - 1
+        fields = EXPORTED_TIME_CARD_FIELDS
+        batches = get_time_card_records(time_card_repo.iterate_time_cards_rows(profile, start_epoch, end_epoch),
+                                        timezone)
+    else:
+        if profile is not None:
+            from wtt.services import time_card as time_card_service
+            time_card_service.refresh_work_days(profile)
+        else:
+            from wtt.services import profile as profile_service
+            from wtt.services import team as team_service
+            team_service.refresh_team_work_days(profile_service.get_all_profiles(), jobs or team_service.REPORT_JOBS)
+        fields = WorkDay.GetFields()
+        batches = work_day_repo.iterate_work_days_rows(profile, start_date, end_date)
+    if to_stdout:
+        return write_records(sys.stdout, file_format, fields, batches)
+    with open(output, 'w', newline='', encoding='utf-8') as file:
+        return write_records(file, file_format, fields, batches)
+
+
+def print_export_records(kind, profile=None, output=None, file_format=None, start_date=None, end_date=None, jobs=None):
+    written = export_records(kind, profile=profile, output=output, file_format=file_format, start_date=start_date,
+                             end_date=end_date, jobs=jobs)
+    if output is not None and output != '-':
+        print(f'Exported {written} {"time cards" if kind == "cards" else "work days"} to {output}')
@@ -1,14 +1,29 @@
+import os
+
 from wtt.models.profile import Profile
 from wtt.repositories import profile as profile_repo
+from wtt.utils import date as date_utils
+
+USE_PROFILE_TIMEZONE = os.getenv('USE_PROFILE_TIMEZONE', 'false').lower() in ('true', '1')
 
 
-def get_current_profile():
-    current_profile = profile_repo.get_current_profile()
+def get_current_profile(selector=None):
+    current_profile = profile_repo.get_current_profile(selector)
     if current_profile is None:
         current_profile = prompt_and_insert_profile()
+    if USE_PROFILE_TIMEZONE:
+        date_utils.set_local_timezone(current_profile.default_timezone)
     return current_profile
 
 
+def get_all_profiles():
+    return profile_repo.get_all_profiles()
+
+
+def get_profile(profile_uuid):
+    return profile_repo.get_profile(profile_uuid)
+
+
 def prompt_and_insert_profile():
     profile = Profile.FromPrompt()
     profile_repo.create_profile(profile)
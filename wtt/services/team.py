@@ -0,0 +1,97 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from wtt import repositories
+from wtt.repositories import profile as profile_repo
+from wtt.repositories import work_day as work_day_repo
+from wtt.services import time_card as time_card_service
+from wtt.utils import date as date_utils
+
+REPORT_JOBS = int(os.getenv('REPORT_JOBS', str(os.cpu_count() or 1)))
+SHARDS_PER_JOB = 4  # smaller shards keep every worker busy when profiles have histories of different sizes
+
+
+def init_report_worker(local_timezone, utc_now):
+    # the workers compute with the same timezone and instant as the command, whatever the start method of the pool
+    date_utils.set_local_timezone(local_timezone)
+    date_utils.freeze_now(utc_now)
+    repositories.open_read_only_session()
+
+
+def compute_work_days_shard(pending, last_day, calendars):
+    return time_card_service.compute_team_work_days(pending, last_day, calendars=calendars)
+
+
+def refresh_team_work_days(profiles, jobs=REPORT_JOBS):
+    # the ledgers are computed on a pool of processes and stored by this one, which is the only writer
+    last_day, pending = time_card_service.get_pending_work_days_refreshes(profiles)
+    if len(pending) == 0:
+        return
+    calendars = time_card_service.get_team_work_calendars(pending, last_day)  # compiled once, for every worker
+    if jobs <= 1 or len(pending) == 1:
+        computed = time_card_service.compute_team_work_days(pending, last_day, calendars=calendars)
+    else:
+        shard_count = min(len(pending), jobs * SHARDS_PER_JOB)
+        shards = [pending[i::shard_count] for i in range(shard_count)]
+        computed = {}
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_report_worker,
+                                 initargs=(date_utils.get_local_timezone(), date_utils.get_utc_now())) as executor:
+            for shard_result in executor.map(compute_work_days_shard, shards, [last_day] * shard_count,
+                                             [calendars] * shard_count):
+                computed.update(shard_result)
+    time_card_service.store_team_work_days(pending, last_day, computed)
+
+
+def get_team_profiles(jobs=REPORT_JOBS):
+    # every profile is refreshed in one pass, instead of running ehbal or wdr once per profile
+    profiles = profile_repo.get_all_profiles()
+    refresh_team_work_days(profiles, jobs=jobs)
+    return profiles
+
+
+def get_team_extra_hours_balance(jobs=REPORT_JOBS):
+    profiles = get_team_profiles(jobs=jobs)
+    balances = work_day_repo.get_balances_in_minutes()
+    return [(profile, balances.get(profile.uuid, 0)) for profile in profiles]
+
+
+def get_team_work_days(filter_level=None, jobs=REPORT_JOBS):
+    filtered_out = time_card_service.get_filtered_out_status_classes(filter_level)
+    profiles = get_team_profiles(jobs=jobs)
+    work_days = work_day_repo.get_all_work_days(excluded_status_classes=filtered_out)
+    return [(profile, work_days.get(profile.uuid, [])) for profile in profiles]
+
+
+def print_team_extra_hours_balance(tabs=True, as_json=False, jobs=REPORT_JOBS):
+    team_balance = get_team_extra_hours_balance(jobs=jobs)
+    if as_json:
+        print(json.dumps([{'uuid': profile.uuid, 'name': f'{profile.first_name} {profile.last_name}',
+                           'balance_minutes': balance} for profile, balance in team_balance], indent=2))
+        return
+    report = 'Team extra hours balance:'
+    for profile, balance in team_balance:
+        hours, minutes = time_card_service.minutes_to_hours_and_minutes(balance)
+        report += f'\n\t{profile.first_name} {profile.last_name}: ' \
+                  f'{time_card_service.hours_and_minutes_to_human_readable(hours, minutes)}'
+    if not tabs:
+        report = time_card_service.remove_tabs_from_multiline_string(report)
+    print(report)
+
+
+def print_team_work_day_status_report(filter_level=None, tabs=False, as_json=False, jobs=REPORT_JOBS):
+    team_work_days = get_team_work_days(filter_level=filter_level, jobs=jobs)
+    if as_json:
+        print(json.dumps([{'uuid': profile.uuid, 'name': f'{profile.first_name} {profile.last_name}',
+                           'work_days': [work_day.to_dict() for work_day in work_days]}
+                          for profile, work_days in team_work_days], indent=2))
+        return
+    reports = []
+    for profile, work_days in team_work_days:
+        work_day_status = {work_day.date: work_day.get_status() for work_day in work_days}
+        report = f'{profile.first_name} {profile.last_name} - ' \
+                 f'{time_card_service.get_report_from_work_day_status(work_day_status)}'
+        if not tabs:
+            report = time_card_service.remove_tabs_from_multiline_string(report)
+        reports.append(report)
+    print('\n'.join(reports))
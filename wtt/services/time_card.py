@@ -1,42 +1,67 @@
+import hashlib
 import os
+import sys
 import time
 
 import math
 
-from wtt.models.time_card import TimeCard
+from wtt.models.work_day import WorkDay
 from wtt.repositories import absence as absence_repo
-from wtt.repositories import holiday as holiday_repo
+from wtt.repositories import profile as profile_repo
 from wtt.repositories import time_card as time_card_repo
+from wtt.repositories import get_data_version, run_in_write_transaction, transaction
+from wtt.repositories import work_calendar as work_calendar_repo
+from wtt.repositories import work_day as work_day_repo
 from wtt.repositories.time_card import SHORT_SEARCH_LIMIT_IN_DAYS
 from wtt.utils import date as date_utils
 from wtt.utils import time as time_utils
+from wtt.utils import worked_time as worked_time_utils
 
 COOLDOWN_IN_SECONDS = int(os.getenv('COOLDOWN_IN_SECONDS', '60'))
+TTCO_WATCH_INTERVAL_IN_SECONDS = float(os.getenv('TTCO_WATCH_INTERVAL_IN_SECONDS', '1'))
 
 
-def clock_in_out(profile):
+def insert_clock_time_card(profile, method):
+    utc_now = date_utils.get_utc_now()
     time_cards = time_card_repo.get_today_time_cards(profile)
-    if len(time_cards) == 0 or abs(
-            time_cards[-1].event_timestamp_utc - date_utils.get_utc_now()).seconds >= COOLDOWN_IN_SECONDS:
-        time_card = time_card_repo.insert_time_card_from_cli(profile)
-        local_tc_event = date_utils.convert_datetime_timezone_to_local(time_card.event_timestamp_utc)
-        print(
-            f'Added time card for {profile.first_name} at {date_utils.datetime_to_string(local_tc_event)}')
+    if len(time_cards) == 0 or abs(time_cards[-1].event_timestamp_utc - utc_now).seconds >= COOLDOWN_IN_SECONDS:
+        return time_card_repo.insert_time_card(profile, method, utc_now)
     else:
         raise TimeoutError('Error while storing time card, the clock operation is still on cooldown')
 
 
+def store_clock_time_card(profile, method='cli'):
+    # the cooldown check and the insertion share one write transaction, so of the clocks that run at the same time
+    # only the first one is stored and the others are on cooldown
+    return run_in_write_transaction(insert_clock_time_card, profile, method)
+
+
+def clock_in_out(profile):
+    time_card = store_clock_time_card(profile)
+    local_tc_event = date_utils.convert_datetime_timezone_to_local(time_card.event_timestamp_utc)
+    print(
+        f'Added time card for {profile.first_name} at {date_utils.datetime_to_string(local_tc_event)}')
+    return time_card
+
+
+def store_manual_time_card(profile, event_timestamp):
+    # timestamps without an offset are on the local timezone
+    if not date_utils.is_offset_aware_date(event_timestamp):
+        event_timestamp = date_utils.set_timezone_on_datetime(event_timestamp, date_utils.get_local_timezone())
+    event_timestamp = date_utils.convert_datetime_timezone(event_timestamp)
+    return time_card_repo.insert_time_card_manually(profile, event_timestamp)
+
+
 def clock_in_out_manually(profile, event_timestamp):
     event_timestamp = date_utils.string_to_datetime(event_timestamp, '%d/%m/%Y %H:%M:%S')
-    event_timestamp = date_utils.set_timezone_on_datetime(event_timestamp, date_utils.get_local_timezone())
-    event_timestamp = date_utils.convert_datetime_timezone(event_timestamp)
-    time_card = time_card_repo.insert_time_card_manually(profile, event_timestamp)
+    time_card = store_manual_time_card(profile, event_timestamp)
     local_tc_event = date_utils.convert_datetime_timezone_to_local(time_card.event_timestamp_utc)
     print(
         f'Added time card for {profile.first_name} at {date_utils.datetime_to_string(local_tc_event)}')
+    return time_card
 
 
-def clock_out_automatically(profile, clock_early=False):
+def insert_automatic_time_card(profile, clock_early):
     time_cards = time_card_repo.get_today_time_cards(profile)
 
     if len(time_cards) % 2 == 0:
@@ -56,30 +81,49 @@ def clock_out_automatically(profile, clock_early=False):
     clock_out_at = date_utils.add_minutes_to_datetime(local_time, missing_minutes_regular_shift)
     clock_out_at = date_utils.convert_datetime_timezone(clock_out_at, 'UTC')
 
-    time_card = time_card_repo.insert_time_card(profile, insertion_method, clock_out_at)
+    return time_card_repo.insert_time_card(profile, insertion_method, clock_out_at)
+
+
+def clock_out_automatically(profile, clock_early=False):
+    time_card = run_in_write_transaction(insert_automatic_time_card, profile, clock_early)
     local_tc_event = date_utils.convert_datetime_timezone_to_local(time_card.event_timestamp_utc)
     print(
         f'Added time card for {profile.first_name} at {date_utils.datetime_to_string(local_tc_event)}')
 
 
 def convert_time_cards_to_minutes(time_cards):
-    time_cards_in_min = [time_utils.datetime_to_minutes(el.event_timestamp_utc) for el in time_cards]
+    time_cards_in_min = [el.get_event_timestamp_epoch() // 60 for el in time_cards]
     return time_cards_in_min
 
 
-def print_today_report(profile, from_auto_run=False, tabs=False):
-    if from_auto_run:
-        time.sleep(0.3)
-    office_hours = profile.daily_office_hours
+def get_utc_now_in_minutes():
+    return date_utils.datetime_to_epoch(date_utils.get_utc_now()) // 60
+
+
+def get_today_report_state(profile):
+    # everything the today report reads from the database, the report itself only adds the current time to it
     today = date_utils.get_now()
-    is_work_day = date_utils.is_work_day(today)
-    today_holiday = holiday_repo.get_date_holiday(profile, today)
-    has_recorded_absence = absence_repo.has_absence_on_date(profile, today)
-    time_cards = time_card_repo.get_today_time_cards(profile)
+    today_number = date_utils.datetime_to_day_number(today)
+    calendar = work_calendar_repo.get_work_calendar(profile.working_location, today.year)
+    return {
+        'day_number': today_number,
+        'is_work_day': calendar.is_work_day(today_number),
+        'holiday': calendar.get_holiday(today_number),
+        'has_recorded_absence': absence_repo.has_absence_on_date(profile, today),
+        'time_cards': time_card_repo.get_today_time_cards(profile),
+    }
+
+
+def build_today_report(profile, state, from_auto_run=False, tabs=False):
+    office_hours = profile.daily_office_hours
+    is_work_day = state['is_work_day']
+    today_holiday = state['holiday']
+    has_recorded_absence = state['has_recorded_absence']
+    time_cards = state['time_cards']
 
     if (not is_work_day and len(time_cards) == 0) or today_holiday is not None or has_recorded_absence:
         if today_holiday is not None:
-            office_hours = today_holiday.working_hours
+            office_hours = today_holiday[0]
         if not is_work_day and len(time_cards) == 0:
             office_hours = 0
         if has_recorded_absence:
@@ -89,8 +133,7 @@ def print_today_report(profile, from_auto_run=False, tabs=False):
             report = get_report_for_non_working_day(is_work_day, has_holiday, has_recorded_absence)
             if not tabs:
                 report = remove_tabs_from_multiline_string(report)
-            print(report)
-            return
+            return report
 
     worked_minutes = get_worked_time_from_any_cards(time_cards, profile.auto_insert_lunch_time)
     break_minutes = 0
@@ -106,7 +149,39 @@ def print_today_report(profile, from_auto_run=False, tabs=False):
             report = report_array[2]
     if not tabs:
         report = remove_tabs_from_multiline_string(report)
-    print(report)
+    return report
+
+
+def print_today_report(profile, from_auto_run=False, tabs=False):
+    print(build_today_report(profile, get_today_report_state(profile), from_auto_run=from_auto_run, tabs=tabs))
+
+
+def watch_today_report(profile, tabs=False, interval=TTCO_WATCH_INTERVAL_IN_SECONDS):
+    # redraws the today report every interval until interrupted, from the state kept in memory, which is only read
+    # again when another connection commits to the database, as PRAGMA data_version tells, or when the day changes
+    date_utils.unfreeze_now()
+    redraw_in_place = sys.stdout.isatty()
+    state = data_version = None
+    drawn_lines = 0
+    try:
+        while True:
+            current_data_version = get_data_version()
+            if state is None or current_data_version != data_version or \
+                    state['day_number'] != date_utils.datetime_to_day_number(date_utils.get_now()):
+                data_version = current_data_version
+                profile = profile_repo.get_profile(profile.uuid) or profile
+                state = get_today_report_state(profile)
+            report = build_today_report(profile, state, tabs=tabs)
+            if redraw_in_place and drawn_lines > 0:
+                sys.stdout.write(f'\033[{drawn_lines}F\033[J')  # back to the first line of the last report, cleared
+            elif drawn_lines > 0:
+                sys.stdout.write('---\n')
+            sys.stdout.write(report + '\n')
+            sys.stdout.flush()
+            drawn_lines = report.count('\n') + 1
+            time.sleep(interval - time.time() % interval)  # wakes up when the seconds of the clock change
+    except KeyboardInterrupt:
+        pass
 
 
 def remove_tabs_from_multiline_string(string):
@@ -118,26 +193,29 @@ def remove_tabs_from_multiline_string(string):
 
 
 def get_worked_time_from_any_cards(time_cards, auto_insert_lunch_time=0):
-    if len(time_cards) == 0:
+    return get_worked_time_from_minutes(convert_time_cards_to_minutes(time_cards), auto_insert_lunch_time)
+
+
+def get_worked_time_from_minutes(time_cards_in_mins, auto_insert_lunch_time=0):
+    if len(time_cards_in_mins) == 0:
         worked_minutes = 0
-    elif len(time_cards) in (1, 2):
-        worked_minutes = get_worked_time_from_1_2_cards(time_cards, auto_insert_lunch_time)
-    elif len(time_cards) == 3:
-        worked_minutes = get_worked_time_from_3_cards(time_cards)
-    elif len(time_cards) % 2 == 0:
-        worked_minutes = get_worked_time_from_even_cards(time_cards)
+    elif len(time_cards_in_mins) in (1, 2):
+        worked_minutes = get_worked_time_from_1_2_cards(time_cards_in_mins, auto_insert_lunch_time)
+    elif len(time_cards_in_mins) == 3:
+        worked_minutes = get_worked_time_from_3_cards(time_cards_in_mins)
+    elif len(time_cards_in_mins) % 2 == 0:
+        worked_minutes = get_worked_time_from_even_cards(time_cards_in_mins)
     else:
-        worked_minutes = get_worked_time_from_odd_cards(time_cards)
+        worked_minutes = get_worked_time_from_odd_cards(time_cards_in_mins)
     return worked_minutes
 
 
-def get_worked_time_from_1_2_cards(time_cards, automatic_lunch_insert=0):
-    time_cards_in_mins = convert_time_cards_to_minutes(time_cards)
+def get_worked_time_from_1_2_cards(time_cards_in_mins, automatic_lunch_insert=0):
     t1 = time_cards_in_mins[0]
-    if len(time_cards) == 2:
+    if len(time_cards_in_mins) == 2:
         t_last = time_cards_in_mins[1]
     else:
-        t_last = time_utils.datetime_to_minutes(date_utils.get_utc_now())
+        t_last = get_utc_now_in_minutes()
 
     p1 = t_last - t1
 
@@ -145,9 +223,9 @@ def get_worked_time_from_1_2_cards(time_cards, automatic_lunch_insert=0):
     return worked_minutes
 
 
-def get_worked_time_from_3_cards(time_cards):
-    t1, t2, t3 = convert_time_cards_to_minutes(time_cards)
-    now = time_utils.datetime_to_minutes(date_utils.get_utc_now())
+def get_worked_time_from_3_cards(time_cards_in_mins):
+    t1, t2, t3 = time_cards_in_mins
+    now = get_utc_now_in_minutes()
 
     p1 = t2 - t1
     p2 = now - t3
@@ -156,17 +234,14 @@ def get_worked_time_from_3_cards(time_cards):
     return worked_minutes
 
 
-def get_worked_time_from_even_cards(time_cards):
-    time_cards_in_mins = convert_time_cards_to_minutes(time_cards)
+def get_worked_time_from_even_cards(time_cards_in_mins):
     sum_of_worked_mins = sum_of_worked_timecards(time_cards_in_mins)
 
     return sum_of_worked_mins
 
 
-def get_worked_time_from_odd_cards(time_cards):
-    return get_worked_time_from_even_cards(
-        time_cards + [TimeCard(time_cards[0].profile_uuid, event_timestamp_utc=date_utils.get_utc_now(),
-                               insertion_method='mocked')])
+def get_worked_time_from_odd_cards(time_cards_in_mins):
+    return get_worked_time_from_even_cards(time_cards_in_mins + [get_utc_now_in_minutes()])
 
 
 def sum_of_worked_timecards(time_cards_in_mins):
@@ -264,39 +339,292 @@ def print_extra_hours_balance_in_minutes(profile, details=False, tabs=True):
     print(report)
 
 
+def get_work_days_with_time_cards(profile, start_date, end_date, calendars, until=None, batch=None):
+    # days with cards first, sorted, then the work days of the calendars without any card, also sorted, until is
+    # exclusive
+    if until is None:
+        until = date_utils.get_now()
+    if batch is None:
+        batch = time_card_repo.get_profile_time_cards_batch(profile, start_date=start_date, end_date=end_date)
+    work_days = []
+    glossary = set()
+    for day_number, time_cards, worked_minutes, max_worked_interval, max_break_interval, first_card_in_mins, \
+            last_card_in_mins in worked_time_utils.get_daily_worked_time(batch.epochs, batch.day_numbers):
+        work_days.append({
+            'date': date_utils.set_timezone_on_datetime(date_utils.day_number_to_datetime(day_number), 'UTC'),
+            'time_cards': time_cards,
+            'worked_minutes': worked_minutes,
+            'max_worked_interval': max_worked_interval,
+            'max_break_interval': max_break_interval,
+            'first_card_in_mins': first_card_in_mins,
+            'last_card_in_mins': last_card_in_mins
+        })
+        glossary.add(day_number)
+    for day_number in work_calendar_repo.get_work_day_numbers_from_calendars(
+            calendars, date_utils.datetime_to_day_number(start_date), date_utils.datetime_to_day_number(until) - 1):
+        if day_number not in glossary:
+            work_days.append({
+                'date': date_utils.set_timezone_on_datetime(date_utils.day_number_to_datetime(day_number), 'UTC'),
+                'time_cards': 0,
+                'worked_minutes': 0,
+                'max_worked_interval': 0,
+                'max_break_interval': 0,
+                'first_card_in_mins': None,
+                'last_card_in_mins': None
+            })
+    return work_days
+
+
+def get_work_days_context_start(profile, start_date):
+    # the day before start_date is only loaded to check the rest between shifts of the first day
+    if start_date > date_utils.date_to_naive_beginning_of_day(profile.start_date):
+        return date_utils.add_days_to_datetime(start_date, -1)
+    return start_date
+
+
+def compute_work_days(profile, start_date, end_date, calendars=None, absences_index=None, batch=None):
+    # start_date and end_date are naive local days, preloaded calendars and batch must span from the context start to
+    # end_date
+    first_day = get_work_days_context_start(profile, start_date)
+    if calendars is None:
+        calendars = work_calendar_repo.get_profile_work_calendars(profile, first_day.year, end_date.year)
+    if absences_index is None:
+        absences_index = absence_repo.get_profile_absences_index(profile)
+    until = date_utils.set_timezone_on_datetime(date_utils.add_days_to_datetime(end_date, 1), 'UTC')
+    work_days = get_work_days_with_time_cards(profile, start_date=first_day, end_date=end_date, calendars=calendars,
+                                              until=until, batch=batch)
+
+    start_date_key = date_utils.datetime_to_date_key(start_date)
+    computed = []
+    last_time_card_in_mins = None
+    for work_day in work_days:
+        computed_work_day = compute_work_day(profile, work_day, last_time_card_in_mins, calendars, absences_index)
+        last_time_card_in_mins = work_day['last_card_in_mins']
+        if date_utils.datetime_to_date_key(work_day['date']) >= start_date_key:
+            computed.append(computed_work_day)
+    return computed
+
+
+def get_work_days_settings_fingerprint(profile):
+    # every profile setting used by compute_work_day, plus the timezone that splits the time cards into days and the
+    # weekend of the working location
+    settings = (profile.working_location, date_utils.datetime_to_date_key(profile.start_date),
+                profile.daily_office_hours, profile.required_lunch_time, profile.max_allowed_extra_hours,
+                profile.min_hours_between_working_days, date_utils.get_local_timezone())
+    weekend_days = work_calendar_repo.get_weekend_days(profile.working_location)
+    if weekend_days != (5, 6):  # ledgers computed before weekends were configurable keep their fingerprint
+        settings += (weekend_days,)
+    return hashlib.sha1(repr(settings).encode('utf-8')).hexdigest()
+
+
+def get_dates_on_every_year(date, profile):
+    dates = []
+    for year in range(profile.start_date.year, date_utils.get_now().year + 1):
+        try:
+            dates.append(date.replace(year=year))
+        except ValueError:
+            pass  # 29th of February on a non leap year
+    return dates
+
+
+def update_dirty_work_days(profile):
+    dirty_work_days = work_day_repo.get_dirty_work_days(profile)
+    if len(dirty_work_days) == 0:
+        return
+    timezone = date_utils.get_local_timezone()
+    dates = []
+    for dirty in dirty_work_days:
+        if dirty['event_timestamp_epoch'] is not None:
+            day_number = date_utils.epoch_to_day_number(dirty['event_timestamp_epoch'], timezone)
+            dates.append(date_utils.day_number_to_datetime(day_number))
+        elif dirty['date'] is not None:
+            date = date_utils.iso_string_to_datetime(dirty['date'])
+            if dirty['repeats_every_year']:
+                dates += get_dates_on_every_year(date, profile)
+            else:
+                dates.append(date)
+    with transaction(immediate=True):
+        update_work_days_on_dates(profile, dates)
+        work_day_repo.delete_dirty_work_days(profile, last_rowid=dirty_work_days[-1]['rowid'])
+
+
+def prepare_work_days_refresh(profile, computed_until, stored_fingerprint, has_dirty_work_days=True):
+    # brings the stored days up to date, returns the first day that still has to be computed and the fingerprint
+    # the ledger must be stored with
+    settings_fingerprint = get_work_days_settings_fingerprint(profile)
+    if computed_until is not None and stored_fingerprint != settings_fingerprint:
+        work_day_repo.delete_profile_work_days(profile)
+        computed_until = None
+    if computed_until is None:
+        if has_dirty_work_days:
+            work_day_repo.delete_dirty_work_days(profile)
+        return date_utils.date_to_naive_beginning_of_day(profile.start_date), settings_fingerprint
+    if has_dirty_work_days:
+        update_dirty_work_days(profile)
+    return date_utils.add_days_to_datetime(computed_until, 1), settings_fingerprint
+
+
+def is_work_days_ledger_current(profile, computed_until, stored_fingerprint, has_dirty_work_days, last_day):
+    if computed_until is None:  # profiles that start today have no closed day yet
+        return not has_dirty_work_days and date_utils.date_to_naive_beginning_of_day(profile.start_date) > last_day
+    return (computed_until == last_day and not has_dirty_work_days
+            and stored_fingerprint == get_work_days_settings_fingerprint(profile))
+
+
+def get_prepared_work_days_state(profile, first_day, settings_fingerprint):
+    # the (computed_until, settings_fingerprint) prepare_work_days_refresh leaves stored when it returns first_day
+    if first_day == date_utils.date_to_naive_beginning_of_day(profile.start_date):
+        return None, None
+    return date_utils.add_days_to_datetime(first_day, -1), settings_fingerprint
+
+
+def refresh_work_days(profile):
+    # the ledger only holds closed days, it is extended up to yesterday whenever it is read, days changed since the
+    # last read are recomputed and everything is recomputed when the profile settings are not the same anymore, reads
+    # that find it up to date do not take the write lock, the others read it again on a BEGIN IMMEDIATE transaction,
+    # since a deferred one that reads before writing fails at once when another connection commits in between
+    last_day = date_utils.date_to_naive_beginning_of_day(date_utils.get_yesterday())
+    if is_work_days_ledger_current(profile, work_day_repo.get_computed_until(profile),
+                                   work_day_repo.get_settings_fingerprint(profile),
+                                   len(work_day_repo.get_dirty_work_days(profile)) > 0, last_day):
+        return
+    run_in_write_transaction(extend_work_days, profile, last_day)
+
+
+def extend_work_days(profile, last_day):
+    first_day, settings_fingerprint = prepare_work_days_refresh(profile, work_day_repo.get_computed_until(profile),
+                                                                work_day_repo.get_settings_fingerprint(profile))
+    if first_day > last_day:
+        return
+    work_days = compute_work_days(profile, first_day, last_day)
+    work_day_repo.replace_profile_work_days(profile, first_day, last_day, work_days, computed_until=last_day,
+                                            settings_fingerprint=settings_fingerprint)
+
+
+def get_pending_work_days_refreshes(profiles):
+    # prepare_work_days_refresh of every profile, reading each table once instead of once per profile, returns the
+    # last day of the ledgers and the (profile, first day, fingerprint) of those that must be extended up to it, the
+    # days themselves are computed after the write transaction, see replace_team_work_days
+    states = work_day_repo.get_work_days_states()
+    dirty_profiles = work_day_repo.get_profiles_with_dirty_work_days()
+    last_day = date_utils.date_to_naive_beginning_of_day(date_utils.get_yesterday())
+    stale_profiles = [profile for profile in profiles
+                      if not is_work_days_ledger_current(profile, *states.get(profile.uuid, (None, None)),
+                                                         profile.uuid in dirty_profiles, last_day)]
+    if len(stale_profiles) == 0:
+        return last_day, []
+    return last_day, run_in_write_transaction(prepare_team_work_days_refreshes, stale_profiles, last_day)
+
+
+def prepare_team_work_days_refreshes(profiles, last_day):
+    states = work_day_repo.get_work_days_states()
+    dirty_profiles = work_day_repo.get_profiles_with_dirty_work_days()
+    pending = []
+    for profile in profiles:
+        computed_until, stored_fingerprint = states.get(profile.uuid, (None, None))
+        first_day, settings_fingerprint = prepare_work_days_refresh(profile, computed_until, stored_fingerprint,
+                                                                    profile.uuid in dirty_profiles)
+        if first_day <= last_day:
+            pending.append((profile, first_day, settings_fingerprint))
+    return pending
+
+
+def get_team_work_calendars(pending, last_day):
+    # profiles of the same location share the same calendars, {location: {year: WorkCalendar}}
+    first_years = {}
+    for profile, _, _ in pending:
+        first_years[profile.working_location] = min(first_years.get(profile.working_location, last_day.year),
+                                                    profile.start_date.year)
+    return {location: work_calendar_repo.get_location_work_calendars(location, first_year, last_day.year)
+            for location, first_year in first_years.items()}
+
+
+def compute_team_work_days(pending, last_day, calendars=None):
+    # only reads from the database, so it also runs on the read-only connections of the report workers
+    if calendars is None:
+        calendars = get_team_work_calendars(pending, last_day)
+    batches = time_card_repo.get_profiles_time_cards_batches(
+        {profile.uuid: (get_work_days_context_start(profile, first_day), last_day) for profile, first_day, _ in pending})
+    absences_indexes = absence_repo.get_absences_indexes()
+    computed = {}
+    for profile, first_day, _ in pending:
+        computed[profile.uuid] = compute_work_days(profile, first_day, last_day,
+                                                   calendars=calendars[profile.working_location],
+                                                   absences_index=absences_indexes.get(profile.uuid, {}),
+                                                   batch=batches[profile.uuid])
+    return computed
+
+
+def store_team_work_days(pending, last_day, computed):
+    run_in_write_transaction(replace_team_work_days, pending, last_day, computed)
+
+
+def replace_team_work_days(pending, last_day, computed):
+    # ledgers another process refreshed since they were prepared are kept, they were computed from newer time cards,
+    # and days changed after these were computed are still marked as dirty for the next read
+    states = work_day_repo.get_work_days_states()
+    for profile, first_day, settings_fingerprint in pending:
+        if states.get(profile.uuid, (None, None)) != get_prepared_work_days_state(profile, first_day,
+                                                                                settings_fingerprint):
+            continue
+        work_day_repo.replace_profile_work_days(profile, first_day, last_day, computed[profile.uuid],
+                                                computed_until=last_day, settings_fingerprint=settings_fingerprint)
+
+
+def refresh_team_work_days(profiles):
+    last_day, pending = get_pending_work_days_refreshes(profiles)
+    if len(pending) > 0:
+        store_team_work_days(pending, last_day, compute_team_work_days(pending, last_day))
+
+
+def update_work_days_on_dates(profile, dates):
+    computed_until = work_day_repo.get_computed_until(profile)
+    if computed_until is None:
+        return  # nothing stored yet, everything will be computed on the next refresh
+    profile_start_date = date_utils.date_to_naive_beginning_of_day(profile.start_date)
+    calendars = work_calendar_repo.get_profile_work_calendars(profile, profile_start_date.year, computed_until.year)
+    absences_index = absence_repo.get_profile_absences_index(profile)
+    dates = sorted(set([date_utils.date_to_naive_beginning_of_day(el) for el in dates]))
+    intervals = []  # consecutive dates are computed together, after a bulk import they can be thousands
+    for date in dates:
+        if date > computed_until or date < profile_start_date:
+            continue
+        # the next day is recomputed as well, because it depends on the last time card of this one
+        last_day = min(date_utils.add_days_to_datetime(date, 1), computed_until)
+        if len(intervals) > 0 and intervals[-1][1] >= date:
+            intervals[-1][1] = last_day
+        else:
+            intervals.append([date, last_day])
+    with transaction(immediate=True):
+        for first_day, last_day in intervals:
+            work_days = compute_work_days(profile, first_day, last_day, calendars=calendars,
+                                          absences_index=absences_index)
+            work_day_repo.replace_profile_work_days(profile, first_day, last_day, work_days)
+
+
+def recompute_work_days(profile):
+    work_day_repo.delete_profile_work_days(profile)
+    refresh_work_days(profile)
+
+
+def rebuild_work_days(profile):
+    run_in_write_transaction(recompute_work_days, profile)
+    print(f'Rebuilt work days of {profile.first_name}')
+
+
 def get_extra_hours_balance_in_minutes(profile, daily_details_dict=None, limit_for_search_days=None):
     if limit_for_search_days is None:
         start_date = profile.start_date
     else:
         start_date = date_utils.add_days_to_datetime(date_utils.get_now(), -limit_for_search_days,
                                                      to_beginning_of_day=True)
-    grouped_time_cards = time_card_repo.get_profile_time_cards_grouped_by_day(profile, start_date=start_date,
-                                                                              end_date=date_utils.get_utc_yesterday())
-    all_work_days = date_utils.get_all_dates_between(start_date, date_utils.get_now())
-    all_work_days = list(filter(date_utils.is_work_day, all_work_days))
-    for work_day in all_work_days:
-        if work_day not in grouped_time_cards['glossary']:
-            grouped_time_cards['glossary'].add(work_day)
-            grouped_time_cards['results'].append({
-                'date': work_day,
-                'cards': []
-            })
+    refresh_work_days(profile)
 
     total_balance_in_min = 0
-    for work_day in grouped_time_cards['results']:
-        total_shift = profile.daily_office_hours
-        holiday = holiday_repo.get_date_holiday(profile, work_day['date'])
-        has_authorized_absence = absence_repo.has_authorized_absence_on_date(profile, work_day['date'])
-        if holiday is not None:
-            total_shift = holiday.working_hours
-        if has_authorized_absence:
-            total_shift = 0
-        if len(work_day['cards']) % 2 != 0:  # avoid dealing with incorrect time_cards
-            work_day['cards'] = work_day['cards'][:-1]
-        day_balance_in_min = get_worked_time_from_any_cards(work_day['cards']) - total_shift * 60
-        total_balance_in_min += day_balance_in_min
+    for work_day in work_day_repo.get_profile_work_days(profile, start_date=start_date):
+        total_balance_in_min += work_day.balance_minutes
         if daily_details_dict is not None:
-            daily_details_dict[work_day['date']] = day_balance_in_min
+            daily_details_dict[work_day.date] = work_day.balance_minutes
     return total_balance_in_min
 
 
@@ -337,9 +665,13 @@ def get_report_from_extra_hours_balance_in_minutes(total_balance_in_min, daily_d
     return report
 
 
-def display_time_cards_of_a_day(profile, date):
+def get_time_cards_of_a_day(profile, date):
     start_date, end_date = date_utils.get_day_interval_from_date(date)
-    cards = time_card_repo.get_profile_time_cards(profile, start_date, end_date)
+    return time_card_repo.get_profile_time_cards(profile, start_date, end_date)
+
+
+def display_time_cards_of_a_day(profile, date):
+    cards = get_time_cards_of_a_day(profile, date)
     print(f'Cards for {date_utils.datetime_to_string(date, "%d/%m/%Y")}:')
     if len(cards) == 0:
         print('\tEmpty')
@@ -348,13 +680,23 @@ def display_time_cards_of_a_day(profile, date):
     print()
 
 
+def remove_time_card(profile, card_uuid):
+    time_card = time_card_repo.get_time_card(profile, card_uuid)
+    if time_card is not None:
+        time_card_repo.delete_time_card(profile, card_uuid)
+    return time_card
+
+
 def delete_time_card(profile, card_uuid):
     time_card_repo.delete_time_card(profile, card_uuid)
     print(f'Deleted time card with uuid {card_uuid}')
 
 
 def get_max_worked_interval(time_cards):
-    time_cards_in_mins = convert_time_cards_to_minutes(time_cards)
+    return get_max_worked_interval_from_minutes(convert_time_cards_to_minutes(time_cards))
+
+
+def get_max_worked_interval_from_minutes(time_cards_in_mins):
     max_interval = 0
     for i in range(0, len(time_cards_in_mins), 2):
         if i + 1 < len(time_cards_in_mins):
@@ -366,118 +708,118 @@ def is_empty_result(result):
     return result.get('class', 'UNKNOWN') == 'UNKNOWN'
 
 
-def get_work_day_status(profile, start_date=None, end_date=None):
-    if end_date is None:
-        end_date = date_utils.get_utc_yesterday()
-    grouped_time_cards = time_card_repo.get_profile_time_cards_grouped_by_day(profile,
-                                                                              start_date=start_date,
-                                                                              end_date=end_date)
-    all_work_days = date_utils.get_all_dates_between(start_date, date_utils.get_now())
-    all_work_days = list(filter(date_utils.is_work_day, all_work_days))
-    for work_day in all_work_days:
-        if work_day not in grouped_time_cards['glossary']:
-            grouped_time_cards['glossary'].add(work_day)
-            grouped_time_cards['results'].append({
-                'date': work_day,
-                'cards': []
-            })
+def get_work_days(profile, start_date=None, end_date=None):
+    if end_date is not None and date_utils.is_offset_aware_date(end_date):
+        end_date = date_utils.convert_datetime_timezone_to_local(end_date)
+    refresh_work_days(profile)
+    return work_day_repo.get_profile_work_days(profile, start_date=start_date, end_date=end_date)
 
+
+def get_work_day_status(profile, start_date=None, end_date=None):
     results = {}
-    last_time_card = None
-    for work_day in grouped_time_cards['results']:
-        result = {'class': 'UNKNOWN'}
-        time_cards = len(work_day['cards'])
-        if is_empty_result(result) and time_cards % 2 != 0:
-            result = {'class': 'ERROR', 'reason': f'Odd number of time cards ({time_cards})'}
-
-        holiday = holiday_repo.get_date_holiday(profile, work_day['date'])
-        is_holiday = holiday is not None
-        has_recorded_absence = absence_repo.has_absence_on_date(profile, work_day['date'])
-        has_authorized_absence = absence_repo.has_authorized_absence_on_date(profile, work_day['date'])
-        absence = absence_repo.get_absence_on_date(profile, work_day['date'])
-
-        if is_empty_result(result) and time_cards == 0 and not has_recorded_absence and not is_holiday:
-            result = {'class': 'ERROR',
-                      'reason': f'Missing time cards, holiday: {is_holiday}, recorded absence: {has_recorded_absence}'}
-
-        if is_holiday:
-            max_shift = holiday.working_hours + profile.max_allowed_extra_hours
-        else:
-            max_shift = profile.daily_office_hours + profile.max_allowed_extra_hours
+    for work_day in get_work_days(profile, start_date=start_date, end_date=end_date):
+        results[work_day.date] = work_day.get_status()
+    return results
 
-        if has_authorized_absence:
-            max_shift = profile.max_allowed_extra_hours
-        total_worked = get_worked_time_from_any_cards(work_day['cards']) / 60
-        extra_hours = total_worked - profile.daily_office_hours
 
-        if is_empty_result(result) and total_worked > max_shift:
-            result = {'class': 'WARN',
-                      'reason': f'Worked {time_utils.hours_to_hours_and_minutes_str(total_worked)} hours, which is more than the max allowed ({time_utils.hours_to_hours_and_minutes_str(max_shift)}).'}
+def compute_work_day(profile, work_day, last_time_card_in_mins, calendars, absences_index):
+    result = {'class': 'UNKNOWN'}
+    time_cards = work_day['time_cards']
+    if is_empty_result(result) and time_cards % 2 != 0:
+        result = {'class': 'ERROR', 'reason': f'Odd number of time cards ({time_cards})'}
 
-        max_worked_interval = get_max_worked_interval(work_day['cards']) / 60
-        max_allowed_work_block = 6  # FIXME include the '6' hours on the profile (database)
-        if is_empty_result(result) and max_worked_interval > max_allowed_work_block:
-            result = {'class': 'INFO',
-                      'reason': f'Worked {time_utils.hours_to_hours_and_minutes_str(max_worked_interval)} hours straight, which is more than the max allowed ({time_utils.hours_to_hours_and_minutes_str(max_allowed_work_block)}).'}
+    holiday = work_calendar_repo.get_date_holiday_from_calendars(calendars, work_day['date'])
+    is_holiday = holiday is not None
+    if is_holiday:
+        holiday_working_hours, holiday_description = holiday
+    has_recorded_absence = absence_repo.has_absence_on_date_from_index(absences_index, work_day['date'])
+    has_authorized_absence = absence_repo.has_authorized_absence_on_date_from_index(absences_index,
+                                                                                   work_day['date'])
+    absence = absence_repo.get_absence_on_date_from_index(absences_index, work_day['date'])
+
+    if is_empty_result(result) and time_cards == 0 and not has_recorded_absence and not is_holiday:
+        result = {'class': 'ERROR',
+                  'reason': f'Missing time cards, holiday: {is_holiday}, recorded absence: {has_recorded_absence}'}
 
-        max_lunch_interval = get_max_worked_interval(work_day['cards'][1:]) / 60
-        if is_empty_result(result) and max_lunch_interval < profile.required_lunch_time:
+    if is_holiday:
+        max_shift = holiday_working_hours + profile.max_allowed_extra_hours
+    else:
+        max_shift = profile.daily_office_hours + profile.max_allowed_extra_hours
+
+    if has_authorized_absence:
+        max_shift = profile.max_allowed_extra_hours
+    total_worked = work_day['worked_minutes'] / 60
+    extra_hours = total_worked - profile.daily_office_hours
+
+    if is_empty_result(result) and total_worked > max_shift:
+        result = {'class': 'WARN',
+                  'reason': f'Worked {time_utils.hours_to_hours_and_minutes_str(total_worked)} hours, which is more than the max allowed ({time_utils.hours_to_hours_and_minutes_str(max_shift)}).'}
+
+    max_worked_interval = work_day['max_worked_interval'] / 60
+    max_allowed_work_block = 6  # FIXME include the '6' hours on the profile (database)
+    if is_empty_result(result) and max_worked_interval > max_allowed_work_block:
+        result = {'class': 'INFO',
+                  'reason': f'Worked {time_utils.hours_to_hours_and_minutes_str(max_worked_interval)} hours straight, which is more than the max allowed ({time_utils.hours_to_hours_and_minutes_str(max_allowed_work_block)}).'}
+
+    max_lunch_interval = work_day['max_break_interval'] / 60
+    if is_empty_result(result) and max_lunch_interval < profile.required_lunch_time:
+        result = {'class': 'INFO',
+                  'reason': f'The biggest break was {time_utils.hours_to_hours_and_minutes_str(max_lunch_interval)}, which is less than the required lunch time ({time_utils.hours_to_hours_and_minutes_str(profile.required_lunch_time)}).'}
+
+    if last_time_card_in_mins is not None and time_cards > 0:
+        between_work_days = max(work_day['first_card_in_mins'] - last_time_card_in_mins, 0) / 60
+        if is_empty_result(result) and between_work_days < profile.min_hours_between_working_days:
             result = {'class': 'INFO',
-                      'reason': f'The biggest break was {time_utils.hours_to_hours_and_minutes_str(max_lunch_interval)}, which is less than the required lunch time ({time_utils.hours_to_hours_and_minutes_str(profile.required_lunch_time)}).'}
+                      'reason': f'The break between shifts was of {time_utils.hours_to_hours_and_minutes_str(between_work_days)}, which is less than the allowed ({time_utils.hours_to_hours_and_minutes_str(profile.min_hours_between_working_days)}).'}
 
-        if last_time_card is not None and time_cards > 0:
-            between_work_days = get_max_worked_interval([last_time_card, work_day['cards'][0]]) / 60
-            if is_empty_result(result) and between_work_days < profile.min_hours_between_working_days:
-                result = {'class': 'INFO',
-                          'reason': f'The break between shifts was of {time_utils.hours_to_hours_and_minutes_str(between_work_days)}, which is less than the allowed ({time_utils.hours_to_hours_and_minutes_str(profile.min_hours_between_working_days)}).'}
+    if is_empty_result(result):
+        result = {'class': 'OK'}
 
-        if time_cards > 0:
-            last_time_card = work_day['cards'][-1]
-        else:
-            last_time_card = None
+    if is_holiday:
+        info = f'Holiday - {holiday_description}, had to work {time_utils.hours_to_hours_and_minutes_str(holiday_working_hours)}'
+    elif has_recorded_absence or has_authorized_absence:
+        info = f'Absence - {absence.description}, authorized: {absence.authorized}'
+    elif time_cards % 2 != 0:
+        info = f'Odd number of time cards ({time_cards})'
+    else:
+        info = f'Worked: {time_utils.hours_to_hours_and_minutes_str(total_worked)}'
+        if extra_hours > 0:
+            info += ' - extra: '
+        elif extra_hours < 0:
+            info += ' - missing: '
+        if extra_hours != 0:
+            info += f'{time_utils.hours_to_hours_and_minutes_str(extra_hours)}'
 
-        if is_empty_result(result):
-            result = {'class': 'OK'}
+    total_shift = profile.daily_office_hours
+    if is_holiday:
+        total_shift = holiday_working_hours
+    if has_authorized_absence:
+        total_shift = 0
+    worked_minutes = work_day['worked_minutes']  # the odd last card of incorrect days is already ignored
+    expected_minutes = total_shift * 60
+
+    return WorkDay(profile.uuid, work_day['date'], time_cards=time_cards, worked_minutes=worked_minutes,
+                   expected_minutes=expected_minutes, balance_minutes=worked_minutes - expected_minutes,
+                   status_class=result['class'], status_reason=result.get('reason'), status_info=info)
 
-        if is_holiday:
-            info = f'Holiday - {holiday.description}, had to work {time_utils.hours_to_hours_and_minutes_str(holiday.working_hours)}'
-        elif has_recorded_absence or has_authorized_absence:
-            info = f'Absence - {absence.description}, authorized: {absence.authorized}'
-        elif len(work_day['cards']) % 2 != 0:
-            info = f'Odd number of time cards ({time_cards})'
-        else:
-            info = f'Worked: {time_utils.hours_to_hours_and_minutes_str(total_worked)}'
-            if extra_hours > 0:
-                info += ' - extra: '
-            elif extra_hours < 0:
-                info += ' - missing: '
-            if extra_hours != 0:
-                info += f'{time_utils.hours_to_hours_and_minutes_str(extra_hours)}'
-        result['info'] = info
-
-        results[work_day['date']] = result
-    return results
+
+STATUS_CLASSES = ('OK', 'INFO', 'WARN', 'ERROR')
+
+
+def get_filtered_out_status_classes(filter_out_below='OK'):
+    if filter_out_below is None or filter_out_below.upper() == 'NONE' or filter_out_below.upper() == 'VERBOSE':
+        return ()
+    if filter_out_below.upper() in STATUS_CLASSES:
+        return STATUS_CLASSES[:STATUS_CLASSES.index(filter_out_below.upper()) + 1]
+    raise AttributeError(f'Unknown filter {filter_out_below.upper()}')
 
 
 def filter_work_day_status(work_day_status, filter_out_below='OK'):
+    filtered_out = get_filtered_out_status_classes(filter_out_below)
     filtered = {}
     for date, status in work_day_status.items():
-        if filter_out_below is None or filter_out_below.upper() == 'NONE' or filter_out_below.upper() == 'VERBOSE':
+        if status['class'] not in filtered_out:
             filtered[date] = status
-        elif filter_out_below.upper() == 'OK':
-            if status['class'] not in ('OK',):
-                filtered[date] = status
-        elif filter_out_below.upper() == 'INFO':
-            if status['class'] not in ('OK', 'INFO'):
-                filtered[date] = status
-        elif filter_out_below.upper() == 'WARN':
-            if status['class'] not in ('OK', 'INFO', 'WARN'):
-                filtered[date] = status
-        elif filter_out_below.upper() == 'ERROR':
-            if status['class'] not in ('OK', 'INFO', 'WARN', 'ERROR'):
-                filtered[date] = status
-        else:
-            raise AttributeError(f'Unknown filter {filter_out_below.upper()}')
     return filtered
 
 
@@ -1,8 +1,7 @@
 import datetime
+import functools
 
-import dateutil.parser
 import pytz
-from tzlocal import get_localzone
 
 
 def assert_datetime_string_format(str_date, date_format='%d/%m/%Y'):
@@ -12,17 +11,54 @@ def assert_datetime_string_format(str_date, date_format='%d/%m/%Y'):
         raise ValueError(f'Invalid date format ({str_date}), should be {date_format}')
 
 
+local_timezone = None
+frozen_utc_now = None
+
+
+@functools.lru_cache(maxsize=64)
+def get_timezone(timezone):
+    return pytz.timezone(timezone)
+
+
 def get_local_timezone():
-    timezone_str = str(get_localzone())
-    return timezone_str
+    # resolved once per process, unless it is overridden with set_local_timezone
+    global local_timezone
+    if local_timezone is None:
+        from tzlocal import get_localzone  # imported on first use, tzlocal pulls logging and takes a while
+        local_timezone = str(get_localzone())
+    return local_timezone
+
+
+def set_local_timezone(timezone):
+    global local_timezone
+    if timezone is not None:
+        assert_valid_timezone(timezone)
+    local_timezone = timezone
+
+
+def freeze_now(utc_now=None):
+    # every get_now and get_utc_now call returns the same instant until unfreeze_now is called
+    global frozen_utc_now
+    if utc_now is None:
+        utc_now = datetime.datetime.now(tz=pytz.utc)
+    frozen_utc_now = convert_datetime_timezone(utc_now, 'UTC')
+
+
+def unfreeze_now():
+    global frozen_utc_now
+    frozen_utc_now = None
 
 
 def get_now():
+    if frozen_utc_now is not None:
+        return convert_datetime_timezone(frozen_utc_now, get_local_timezone())
     now = datetime.datetime.now()
     return set_timezone_on_datetime(now, get_local_timezone())
 
 
 def get_utc_now():
+    if frozen_utc_now is not None:
+        return frozen_utc_now
     now = datetime.datetime.utcnow()
     return set_timezone_on_datetime(now, 'UTC')
 
@@ -32,7 +68,7 @@ def get_utc_tomorrow():
 
 
 def get_yesterday():
-    now = datetime.datetime.now() - datetime.timedelta(days=1)
+    now = get_now() - datetime.timedelta(days=1)
     now = datetime.datetime(now.year, now.month, now.day, 23, 59, 59, 999999)
     return set_timezone_on_datetime(now, get_local_timezone())
 
@@ -53,22 +89,20 @@ def get_day_interval_from_date(date):
 
 
 def assert_valid_timezone(timezone):
-    if timezone not in pytz.all_timezones:
+    if timezone not in pytz.all_timezones_set:
         raise ValueError(f'Invalid timezone ({timezone})')
 
 
 def set_timezone_on_datetime(date, timezone):
     if is_offset_naive_date(date):
-        timezone = pytz.timezone(timezone)
-        localized = timezone.localize(date)
+        localized = get_timezone(timezone).localize(date)
     else:
         localized = date
     return localized
 
 
 def convert_datetime_timezone(localized_date, dst_timezone='UTC'):
-    timezone = pytz.timezone(dst_timezone)
-    converted = localized_date.astimezone(timezone)
+    converted = localized_date.astimezone(get_timezone(dst_timezone))
     return converted
 
 
@@ -82,6 +116,87 @@ def set_and_convert_date_timezone(date, src_timezone, dst_timezone='UTC'):
     return converted
 
 
+def epoch_to_utc_datetime(epoch):
+    return datetime.datetime.fromtimestamp(epoch, tz=pytz.utc)
+
+
+def datetime_to_epoch(date):
+    # naive dates are taken as local time, of get_local_timezone and not of the system, which may be another one
+    return int(set_timezone_on_datetime(date, get_local_timezone()).timestamp())
+
+
+UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+SECONDS_IN_A_DAY = 86400
+
+
+def get_utc_offset_in_seconds_on_epoch(epoch, timezone):
+    localized = datetime.datetime.fromtimestamp(epoch, tz=get_timezone(timezone))
+    return int(localized.utcoffset().total_seconds())
+
+
+@functools.lru_cache(maxsize=65536)  # about 180 years of days, imports walk them in any order
+def get_utc_offsets_on_utc_day(utc_day_number, timezone):
+    first_second = utc_day_number * SECONDS_IN_A_DAY
+    return (get_utc_offset_in_seconds_on_epoch(first_second, timezone),
+            get_utc_offset_in_seconds_on_epoch(first_second + SECONDS_IN_A_DAY - 1, timezone))
+
+
+def get_utc_offset_in_seconds(epoch, timezone):
+    # the offset is cached per UTC day and only resolved card by card on days with a timezone transition
+    offset_at_start, offset_at_end = get_utc_offsets_on_utc_day(epoch // SECONDS_IN_A_DAY, timezone)
+    if offset_at_start == offset_at_end:
+        return offset_at_start
+    return get_utc_offset_in_seconds_on_epoch(epoch, timezone)
+
+
+def epoch_to_iso_string(epoch, timezone='UTC'):
+    # with the UTC offset, e.g. 2024-03-01T09:00:00-03:00, the offset is cached as on epoch_to_day_number
+    offset = get_utc_offset_in_seconds(epoch, timezone)
+    local = datetime.datetime.fromordinal(UNIX_EPOCH_ORDINAL) + datetime.timedelta(seconds=epoch + offset)
+    hours, minutes = divmod(abs(offset) // 60, 60)
+    return f'{local.isoformat()}{"-" if offset < 0 else "+"}{hours:02d}:{minutes:02d}'
+
+
+def epoch_to_day_number(epoch, timezone):
+    # days since 01/01/1970 on the given timezone
+    return (epoch + get_utc_offset_in_seconds(epoch, timezone)) // SECONDS_IN_A_DAY
+
+
+def datetime_to_day_number(date):
+    # uses the date fields as they are, without any timezone conversion
+    return datetime.date(date.year, date.month, date.day).toordinal() - UNIX_EPOCH_ORDINAL
+
+
+def naive_datetime_to_local_epoch(date):
+    # seconds since 01/01/1970 of the date fields as they are, like datetime_to_day_number
+    return ((date.toordinal() - UNIX_EPOCH_ORDINAL) * SECONDS_IN_A_DAY + date.hour * 3600 + date.minute * 60
+            + date.second)
+
+
+@functools.lru_cache(maxsize=65536)
+def get_utc_offset_in_seconds_on_local_day(day_number, timezone):
+    # None when the offset changes during the local day
+    first_second = day_number_to_datetime(day_number)
+    last_second = first_second + datetime.timedelta(seconds=SECONDS_IN_A_DAY - 1)
+    offsets = [int(get_timezone(timezone).localize(el).utcoffset().total_seconds())
+               for el in (first_second, last_second)]
+    return offsets[0] if offsets[0] == offsets[1] else None
+
+
+def local_epoch_to_epoch(local_epoch, timezone):
+    # the offset is cached per local day and only days with a timezone transition are localized second by second,
+    # resolving ambiguous and missing times the same way as set_timezone_on_datetime
+    offset = get_utc_offset_in_seconds_on_local_day(local_epoch // SECONDS_IN_A_DAY, timezone)
+    if offset is not None:
+        return local_epoch - offset
+    naive = datetime.datetime.fromordinal(UNIX_EPOCH_ORDINAL) + datetime.timedelta(seconds=local_epoch)
+    return datetime_to_epoch(set_timezone_on_datetime(naive, timezone))
+
+
+def day_number_to_datetime(day_number):
+    return datetime.datetime.fromordinal(day_number + UNIX_EPOCH_ORDINAL)
+
+
 def datetime_to_string(date, date_format='%d/%m/%Y %H:%M:%S'):
     return date.strftime(date_format)
 
@@ -91,11 +206,11 @@ def string_to_datetime(str_date, date_format='%d/%m/%Y'):
 
 
 def iso_string_to_datetime(str_date):
-    return dateutil.parser.isoparse(str_date)
-
-
-def is_work_day(date):
-    return date.weekday() <= 4  # monday=0 | sunday = 6
+    try:
+        return datetime.datetime.fromisoformat(str_date)
+    except ValueError:
+        import dateutil.parser  # only for the formats fromisoformat does not understand, it is slow to import
+        return dateutil.parser.isoparse(str_date)
 
 
 def add_minutes_to_datetime(date, minutes):
@@ -110,23 +225,21 @@ def add_days_to_datetime(date, days, to_beginning_of_day=False):
     return calculated_date
 
 
-def get_all_dates_between(start_date, end_date):
-    current_date = datetime.datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0)
-    current_date = set_timezone_on_datetime(current_date, 'UTC')
-    dates = []
-    end_date -= datetime.timedelta(days=1)
-    while current_date <= end_date:
-        dates.append(current_date)
-        current_date += datetime.timedelta(days=1)
-
-    return dates
-
-
 def date_to_beginning_of_day(date_to_change):
     return datetime.datetime(date_to_change.year, date_to_change.month, date_to_change.day, 0, 0, 0,
                              tzinfo=date_to_change.tzinfo)
 
 
+def datetime_to_date_key(date, to_utc=False):
+    if to_utc and is_offset_aware_date(date):
+        date = convert_datetime_timezone(date, 'UTC')
+    return date.year, date.month, date.day
+
+
+def date_to_naive_beginning_of_day(date_to_change):
+    return datetime.datetime(date_to_change.year, date_to_change.month, date_to_change.day, 0, 0, 0)
+
+
 def is_offset_naive_date(date):
     return date.tzinfo is None or date.tzinfo.utcoffset(date) is None
 
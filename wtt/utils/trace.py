@@ -0,0 +1,329 @@
+import atexit
+import datetime
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+# tracing is opt-in, nothing is wrapped until start is called, so commands that do not trace run the original
+# functions without any check
+
+TRACE_DIR = os.getenv('TRACE_DIR', os.path.join(os.path.expanduser('~'), '.wtt', 'traces'))
+TRACE_MAX_EVENTS = int(os.getenv('TRACE_MAX_EVENTS', '200000'))  # beyond it, calls only count for the summary
+SUMMARY_TOP = 10
+
+# each call is an event of the chrome trace
+TRACED_SQL_FUNCTIONS = ('execute_query_with_conn', 'execute_many', 'iterate_query_rows', 'iterate_query_batches')
+TRACED_MODULES = ('wtt.services.time_card', 'wtt.services.team', 'wtt.services.import_export',
+                  'wtt.services.holiday', 'wtt.services.absence', 'wtt.services.profile', 'wtt.services.database',
+                  'wtt.services.archive', 'wtt.repositories.archive',
+                  'wtt.repositories.time_card', 'wtt.repositories.work_day', 'wtt.repositories.holiday',
+                  'wtt.repositories.absence', 'wtt.repositories.profile', 'wtt.repositories.work_calendar',
+                  'wtt.utils.worked_time')
+# called far too often for an event per call, only the outermost call of a chain is counted and timed
+COUNTED_MODULES = ('wtt.utils.date',)
+
+state = None
+
+
+class TraceState(object):
+    def __init__(self, command, memory):
+        self.command = command
+        self.memory = memory
+        self.started_at = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.dropped_events = 0
+        self.spans = {}  # name: [calls, inclusive seconds, self seconds]
+        self.statements = {}  # sql: [calls, seconds, rows]
+        self.counted = {}  # name: [calls, seconds]
+        self.local = threading.local()
+        self.wrapped = []  # (module, attribute, original)
+
+    def get_stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+
+def to_microseconds(perf_counter_value):
+    return round((perf_counter_value - state.started_at) * 1000000, 1)
+
+
+def add_event(name, category, started_at, ended_at, args=None):
+    if len(state.events) >= TRACE_MAX_EVENTS:
+        state.dropped_events += 1
+        return
+    event = {'name': name, 'cat': category, 'ph': 'X', 'ts': to_microseconds(started_at),
+             'dur': round((ended_at - started_at) * 1000000, 1), 'pid': state.pid, 'tid': threading.get_ident()}
+    if args is not None:
+        event['args'] = args
+    state.events.append(event)
+    if state.memory:
+        current, peak = tracemalloc.get_traced_memory()
+        state.events.append({'name': 'memory', 'ph': 'C', 'ts': event['ts'] + event['dur'], 'pid': state.pid,
+                             'args': {'current_kb': current // 1024, 'peak_kb': peak // 1024}})
+
+
+def enter_span():
+    stack = state.get_stack()
+    stack.append(0.0)  # time spent on the children of the span
+    return time.perf_counter()
+
+
+def exit_span(name, category, started_at, args=None):
+    ended_at = time.perf_counter()
+    stack = state.get_stack()
+    children = stack.pop()
+    elapsed = ended_at - started_at
+    if len(stack) > 0:
+        stack[-1] += elapsed
+    totals = state.spans.get(name)
+    if totals is None:
+        totals = state.spans[name] = [0, 0.0, 0.0, category]
+    totals[0] += 1
+    totals[1] += elapsed
+    totals[2] += elapsed - children
+    add_event(name, category, started_at, ended_at, args)
+
+
+def normalize_sql(query):
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def add_statement(query, params, rows, started_at):
+    sql = normalize_sql(query)
+    totals = state.statements.get(sql)
+    if totals is None:
+        totals = state.statements[sql] = [0, 0.0, 0]
+    totals[0] += 1
+    totals[1] += time.perf_counter() - started_at
+    totals[2] += rows or 0
+    return {'sql': sql, 'params': repr(params)[:200], 'rows': rows}
+
+
+def trace_execute_query_with_conn(function):
+    @functools.wraps(function)
+    def traced(conn, query, params=None, fetch=False, close_conn=True):
+        started_at = enter_span()
+        changes_before = conn.total_changes
+        results = None
+        rows = None
+        try:
+            results = function(conn, query, params=params, fetch=fetch, close_conn=close_conn)
+            return results
+        finally:
+            if fetch and results is not None:
+                rows = len(results)
+            elif not close_conn:
+                rows = conn.total_changes - changes_before
+            exit_span('sql', 'sql', started_at, add_statement(query, params, rows, started_at))
+
+    return traced
+
+
+def trace_execute_many(function):
+    @functools.wraps(function)
+    def traced(query, params_iterable):
+        from wtt.repositories import get_session_conn
+        conn = get_session_conn()
+        started_at = enter_span()
+        changes_before = conn.total_changes
+        try:
+            return function(query, params_iterable)
+        finally:
+            exit_span('sql', 'sql', started_at,
+                      add_statement(query, None, conn.total_changes - changes_before, started_at))
+
+    return traced
+
+
+def trace_iterate_query_rows(function):
+    # the rows are stepped by the caller, only the execution of the statement is timed
+    @functools.wraps(function)
+    def traced(query, params=None):
+        started_at = enter_span()
+        try:
+            return function(query, params=params)
+        finally:
+            exit_span('sql', 'sql', started_at, add_statement(query, params, None, started_at))
+
+    return traced
+
+
+def trace_iterate_query_batches(function):
+    # timed from the execution of the statement until the last batch, the time of the caller between batches included
+    @functools.wraps(function)
+    def traced(query, params=None, batch_size=1000):
+        started_at = enter_span()
+        rows = 0
+        try:
+            for batch in function(query, params=params, batch_size=batch_size):
+                rows += len(batch)
+                yield batch
+        finally:
+            exit_span('sql', 'sql', started_at, add_statement(query, params, rows, started_at))
+
+    return traced
+
+
+SQL_TRACERS = {
+    'execute_query_with_conn': trace_execute_query_with_conn,
+    'execute_many': trace_execute_many,
+    'iterate_query_rows': trace_iterate_query_rows,
+    'iterate_query_batches': trace_iterate_query_batches,
+}
+
+
+def trace_span(function, name):
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def traced_generator(*args, **kwargs):
+            started_at = enter_span()
+            try:
+                yield from function(*args, **kwargs)
+            finally:
+                exit_span(name, 'service', started_at)
+
+        return traced_generator
+
+    @functools.wraps(function)
+    def traced(*args, **kwargs):
+        started_at = enter_span()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            exit_span(name, 'service', started_at)
+
+    return traced
+
+
+def trace_count(function, name):
+    @functools.wraps(function)
+    def counted(*args, **kwargs):
+        local = state.local
+        if getattr(local, 'counting', False):
+            return function(*args, **kwargs)
+        local.counting = True
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            local.counting = False
+            totals = state.counted.get(name)
+            if totals is None:
+                totals = state.counted[name] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += time.perf_counter() - started_at
+
+    return counted
+
+
+def get_module_functions(module):
+    return [(name, value) for name, value in vars(module).items()
+            if inspect.isfunction(value) and value.__module__ == module.__name__ and not name.startswith('_')]
+
+
+def replace_function(original, replacement):
+    # rebinds every reference to the function, including the ones made by "from module import function"
+    for module in list(sys.modules.values()):
+        module_name = getattr(module, '__name__', None)
+        if module_name is None or not (module_name == 'wtt' or module_name.startswith('wtt.')
+                                       or module_name.startswith('benchmarks')):
+            continue
+        for attribute, value in list(vars(module).items()):
+            if value is original:
+                setattr(module, attribute, replacement)
+                state.wrapped.append((module, attribute, original))
+
+
+def wrap_functions():
+    import importlib
+    from wtt import repositories
+    for name in TRACED_SQL_FUNCTIONS:
+        original = getattr(repositories, name)
+        replace_function(original, SQL_TRACERS[name](original))
+    for module_name in TRACED_MODULES:
+        module = importlib.import_module(module_name)
+        short_name = module_name.split('.', 1)[1]
+        for name, original in get_module_functions(module):
+            replace_function(original, trace_span(original, f'{short_name}.{name}'))
+    for module_name in COUNTED_MODULES:
+        module = importlib.import_module(module_name)
+        short_name = module_name.split('.', 1)[1]
+        for name, original in get_module_functions(module):  # lru_cache wrappers are not listed, they are fast
+            replace_function(original, trace_count(original, f'{short_name}.{name}'))
+
+
+def unwrap_functions():
+    for module, attribute, original in reversed(state.wrapped):
+        setattr(module, attribute, original)
+
+
+def start(command, memory=False):
+    global state
+    if state is not None:
+        return
+    state = TraceState(command, memory)
+    if memory:
+        tracemalloc.start()
+    wrap_functions()
+    atexit.register(stop)  # commands that fail still write their trace
+
+
+def format_milliseconds(seconds):
+    return f'{seconds * 1000:.1f} ms'
+
+
+def get_summary(path):
+    elapsed = time.perf_counter() - state.started_at
+    sql_calls = sum(el[0] for el in state.statements.values())
+    sql_time = sum(el[1] for el in state.statements.values())
+    counted_calls = sum(el[0] for el in state.counted.values())
+    counted_time = sum(el[1] for el in state.counted.values())
+    summary = f'Trace of {state.command}: {format_milliseconds(elapsed)}, written to {path}'
+    summary += f'\n\tsql: {sql_calls} statements, {format_milliseconds(sql_time)}'
+    summary += f'\n\tdate utils: {counted_calls} calls, {format_milliseconds(counted_time)}'
+    if state.memory:
+        summary += f'\n\tmemory peak: {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MB'
+    if state.dropped_events > 0:
+        summary += f'\n\t{state.dropped_events} events beyond TRACE_MAX_EVENTS were left out of the file'
+    summary += '\n\tslowest statements (total, calls, rows):'
+    for sql, (calls, seconds, rows) in sorted(state.statements.items(), key=lambda el: -el[1][1])[:SUMMARY_TOP]:
+        summary += f'\n\t\t{format_milliseconds(seconds)}, {calls}x, {rows} rows: {sql[:120]}'
+    summary += '\n\tslowest functions (self, inclusive, calls):'
+    spans = [el for el in state.spans.items() if el[1][3] == 'service']
+    for name, (calls, inclusive, own, _) in sorted(spans, key=lambda el: -el[1][2])[:SUMMARY_TOP]:
+        summary += f'\n\t\t{name}: {format_milliseconds(own)}, {format_milliseconds(inclusive)}, {calls}x'
+    summary += '\n\tslowest date utils (total, calls):'
+    for name, (calls, seconds) in sorted(state.counted.items(), key=lambda el: -el[1][1])[:SUMMARY_TOP]:
+        summary += f'\n\t\t{name}: {format_milliseconds(seconds)}, {calls}x'
+    return summary
+
+
+def stop():
+    # writes the chrome trace, which loads on chrome://tracing or https://ui.perfetto.dev, and prints the summary
+    global state
+    if state is None:
+        return
+    unwrap_functions()
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(TRACE_DIR, f'{state.command}-{timestamp}.json')
+    counters = [{'name': name, 'ph': 'C', 'ts': to_microseconds(time.perf_counter()), 'pid': state.pid,
+                 'args': {'calls': calls, 'ms': round(seconds * 1000, 3)}}
+                for name, (calls, seconds) in state.counted.items()]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': state.events + counters, 'displayTimeUnit': 'ms',
+                   'otherData': {'command': state.command}}, f)
+    print(get_summary(path), file=sys.stderr)
+    if state.memory:
+        tracemalloc.stop()
+    state = None
+    atexit.unregister(stop)
@@ -1,3 +1,5 @@
+import os
+import time
 import uuid
 
 
@@ -6,3 +8,21 @@ def random_uuid(without_dashes=False):
         return uuid.uuid4().hex
     else:
         return str(uuid.uuid4())
+
+
+def time_ordered_uuids(amount):
+    # version 7 uuids, they start with the unix time in milliseconds followed by a 12 bits counter, so rows inserted
+    # in bulk land at the end of the primary key index instead of all over it, the remaining 62 bits are random
+    first_millisecond = time.time_ns() // 1000000
+    random_hex = os.urandom(8 * amount).hex()
+    variant_digits = '89ab' * 4  # the two most significant bits of the variant digit are 10
+    uuids = []
+    prefix = None
+    for i in range(amount):
+        if i & 0xFFF == 0:  # the counter wrapped, moves to the next millisecond
+            millisecond_hex = f'{first_millisecond + (i >> 12):012x}'
+            prefix = f'{millisecond_hex[:8]}-{millisecond_hex[8:]}-7'
+        j = 16 * i
+        uuids.append(f'{prefix}{i & 0xFFF:03x}-{variant_digits[int(random_hex[j], 16)]}{random_hex[j + 1:j + 4]}-'
+                     f'{random_hex[j + 4:j + 16]}')
+    return uuids
@@ -0,0 +1,75 @@
+import os
+
+DISABLE_NUMPY = os.getenv('DISABLE_NUMPY', 'false').lower() in ('true', '1')
+np = None
+
+
+def get_numpy():
+    # imported on first use only, numpy alone takes longer to import than a whole clock command
+    global np
+    if np is None and not DISABLE_NUMPY:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # numpy is optional, the pure python engine gives the same results
+            pass
+    return np
+
+
+def get_daily_worked_time(epochs, day_numbers):
+    # computes every day at once from the time cards of a profile sorted by time, cards are paired as in/out and the
+    # odd last card of a day is ignored. Returns one (day_number, time_cards, worked_minutes, max_worked_interval,
+    # max_break_interval, first_card_in_mins, last_card_in_mins) per day with cards, sorted by day
+    if len(epochs) == 0:
+        return []
+    if get_numpy() is not None:
+        return get_daily_worked_time_numpy(epochs, day_numbers)
+    return get_daily_worked_time_python(epochs, day_numbers)
+
+
+def get_daily_worked_time_python(epochs, day_numbers):
+    cards_in_mins = [el // 60 for el in epochs]
+    size = len(cards_in_mins)
+    daily = []
+    start = 0
+    while start < size:
+        day_number = day_numbers[start]
+        end = start + 1
+        while end < size and day_numbers[end] == day_number:
+            end += 1
+        worked_minutes = 0
+        max_worked_interval = 0
+        max_break_interval = 0
+        for i in range(start, end - 1):
+            interval = cards_in_mins[i + 1] - cards_in_mins[i]
+            if (i - start) % 2 == 0:
+                worked_minutes += interval
+                max_worked_interval = max(interval, max_worked_interval)
+            else:
+                max_break_interval = max(interval, max_break_interval)
+        daily.append((day_number, end - start, worked_minutes, max_worked_interval, max_break_interval,
+                      cards_in_mins[start], cards_in_mins[end - 1]))
+        start = end
+    return daily
+
+
+def get_daily_worked_time_numpy(epochs, day_numbers):
+    cards_in_mins = np.asarray(epochs, dtype=np.int64) // 60
+    day_numbers = np.asarray(day_numbers, dtype=np.int64)
+    days = np.unique(day_numbers)
+    starts = np.searchsorted(day_numbers, days, side='left')
+    ends = np.searchsorted(day_numbers, days, side='right')
+    counts = ends - starts
+
+    # interval i goes from card i to card i + 1, the last one is padded so every day has at least one interval
+    positions = np.arange(cards_in_mins.size) - np.repeat(starts, counts)
+    intervals = np.append(np.diff(cards_in_mins), 0)
+    same_day = np.append(day_numbers[1:] == day_numbers[:-1], False)
+    worked_intervals = np.where(same_day & (positions % 2 == 0), intervals, 0)
+    break_intervals = np.where(same_day & (positions % 2 == 1), intervals, 0)
+
+    worked_minutes = np.add.reduceat(worked_intervals, starts)
+    max_worked_intervals = np.maximum(np.maximum.reduceat(worked_intervals, starts), 0)
+    max_break_intervals = np.maximum(np.maximum.reduceat(break_intervals, starts), 0)
+    return list(zip(days.tolist(), counts.tolist(), worked_minutes.tolist(), max_worked_intervals.tolist(),
+                    max_break_intervals.tolist(), cards_in_mins[starts].tolist(), cards_in_mins[ends - 1].tolist()))